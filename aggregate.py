@@ -0,0 +1,181 @@
+from functools import reduce
+from operator import add
+from typing import Any, Dict, List, Optional, Tuple
+
+from query import make_getter
+from results import Results
+
+# A partial aggregate maps each group key (a tuple of group_by values) to one state per metric. Partials from
+# different partitions or processes merge state by state, so any split of the rows gives the same result.
+METRIC_FUNCTIONS = ('$count', '$sum', '$min', '$max', '$mean', '$distinct_count')
+
+MetricSpec = Tuple[str, str, Optional[str]]
+
+
+def parse_metrics(metrics: Dict[str, Dict[str, Any]]) -> List[MetricSpec]:
+    # {'points': {'$sum': 'stats.points'}, 'games': {'$count': None}} -> [(name, function, field)]
+    metric_specs = []
+    for metric_name, metric_clause in (metrics or {}).items():
+        if not isinstance(metric_clause, dict) or len(metric_clause) != 1:
+            raise ValueError(f"Metric {metric_name} must have exactly one function, e.g. {{'$sum': 'field'}}")
+        metric_function, field = next(iter(metric_clause.items()))
+        if metric_function not in METRIC_FUNCTIONS:
+            raise ValueError(f"Unsupported metric function: {metric_function}")
+        if field is None and metric_function != '$count':
+            raise ValueError(f"Metric {metric_name} needs a field for {metric_function}")
+        metric_specs.append((metric_name, metric_function, field))
+    return metric_specs
+
+
+def new_state(metric_function: str):
+    if metric_function == '$count':
+        return 0
+    elif metric_function == '$mean':
+        return [None, 0]
+    elif metric_function == '$distinct_count':
+        return set()
+    return None
+
+
+def merge_state(metric_function: str, state, other):
+    if metric_function == '$count':
+        return state + other
+    elif metric_function == '$mean':
+        if other[0] is not None:
+            state[0] = other[0] if state[0] is None else state[0] + other[0]
+        state[1] += other[1]
+        return state
+    elif metric_function == '$distinct_count':
+        state |= other
+        return state
+    if state is None:
+        return other
+    if other is None:
+        return state
+    if metric_function == '$sum':
+        return state + other
+    elif metric_function == '$min':
+        return other if other < state else state
+    return other if other > state else state
+
+
+def group_rows(rows, group_by: List[str]) -> Dict[Tuple, List[Dict[str, Any]]]:
+    if not group_by:
+        rows = list(rows)
+        return {(): rows} if rows else {}
+    getters = [make_getter(tuple(field.split('.'))) for field in group_by]
+    rows_by_group: Dict[Any, List[Dict[str, Any]]] = {}
+    if len(getters) == 1:
+        getter = getters[0]
+        for row in rows:
+            group_key = getter(row)
+            group = rows_by_group.get(group_key)
+            if group is None:
+                rows_by_group[group_key] = [row]
+            else:
+                group.append(row)
+        return {(group_key,): group for group_key, group in rows_by_group.items()}
+    for row in rows:
+        group_key = tuple([getter(row) for getter in getters])
+        group = rows_by_group.get(group_key)
+        if group is None:
+            rows_by_group[group_key] = [row]
+        else:
+            group.append(row)
+    return rows_by_group
+
+
+def metric_state(metric_function: str, getter, rows: List[Dict[str, Any]]):
+    # Missing (None) values are skipped by every function except a plain row count
+    if getter is None:
+        return len(rows)
+    values = [value for value in map(getter, rows) if value is not None]
+    if metric_function == '$count':
+        return len(values)
+    elif not values:
+        return new_state(metric_function)
+    elif metric_function == '$sum':
+        # reduce adds left to right like the vectorized kernels; builtin sum may compensate float rounding
+        return reduce(add, values, 0)
+    elif metric_function == '$min':
+        return min(values)
+    elif metric_function == '$max':
+        return max(values)
+    elif metric_function == '$mean':
+        return [reduce(add, values, 0), len(values)]
+    return set(values)
+
+
+def aggregate_rows(rows, group_by: List[str], metric_specs: List[MetricSpec]) -> Dict[Tuple, List[Any]]:
+    # One pass groups the rows, then each metric runs over a group's values with builtins
+    metric_getters = [(metric_function, make_getter(tuple(field.split('.'))) if field else None) for _, metric_function, field in metric_specs]
+    return {
+        group_key: [metric_state(metric_function, getter, group) for metric_function, getter in metric_getters]
+        for group_key, group in group_rows(rows, group_by).items()
+    }
+
+
+def partition_metadata_partial(partition, group_by: List[str], metric_specs: List[MetricSpec]) -> Dict[Tuple, List[Any]]:
+    # Every row of a partition shares its partition_indices, so groups and metrics over index fields need no rows
+    row_count = partition.row_count()
+    if not row_count:
+        return {}
+
+    states = []
+    for _, metric_function, field in metric_specs:
+        value = partition.partition_indices.get(field) if field else None
+        if metric_function == '$count':
+            states.append(row_count if field is None or value is not None else 0)
+        elif value is None:
+            states.append(new_state(metric_function))
+        elif metric_function == '$sum':
+            states.append(0 + value * row_count)
+        elif metric_function == '$mean':
+            states.append([0 + value * row_count, row_count])
+        elif metric_function == '$distinct_count':
+            states.append({value})
+        else:
+            states.append(value)
+    return {tuple(partition.partition_indices.get(field) for field in group_by): states}
+
+
+def metadata_answerable(index_names: List[str], partitions, group_by: List[str], metric_specs: List[MetricSpec]) -> bool:
+    if not all(field in index_names for field in group_by):
+        return False
+    for _, metric_function, field in metric_specs:
+        if field is None:
+            continue
+        if field not in index_names:
+            return False
+        # Repeated float addition is not the same as one multiplication, so float sums still scan the rows
+        if metric_function in ('$sum', '$mean') and any(type(partition.partition_indices.get(field)) not in (int, bool, type(None)) for partition in partitions):
+            return False
+    return True
+
+
+def merge_partials(partials, metric_specs: List[MetricSpec]) -> Dict[Tuple, List[Any]]:
+    merged: Dict[Tuple, List[Any]] = {}
+    for partial in partials:
+        for group_key, states in partial.items():
+            merged_states = merged.get(group_key)
+            if merged_states is None:
+                merged[group_key] = states
+                continue
+            for position, (_, metric_function, _) in enumerate(metric_specs):
+                merged_states[position] = merge_state(metric_function, merged_states[position], states[position])
+    return merged
+
+
+def finalize_partial(partial: Dict[Tuple, List[Any]], group_by: List[str], metric_specs: List[MetricSpec]) -> Results:
+    results = Results()
+    for group_key, states in partial.items():
+        result = dict(zip(group_by, group_key))
+        for (metric_name, metric_function, _), state in zip(metric_specs, states):
+            if metric_function == '$mean':
+                result[metric_name] = state[0] / state[1] if state[1] else None
+            elif metric_function == '$distinct_count':
+                result[metric_name] = len(state)
+            else:
+                result[metric_name] = state
+        results.append(result)
+    return results
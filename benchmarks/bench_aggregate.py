@@ -0,0 +1,64 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import columnar_available
+from database import Database
+
+LEADERBOARDS = {
+    'points by player': (None, ['player_id'], {'points': {'$sum': 'stats.points'}, 'games': {'$count': None}, 'best': {'$max': 'stats.points'}}),
+    'season scoring by team': ({'season': {'$gte': 2015}}, ['season', 'team_id'], {'ppg': {'$mean': 'stats.points'}, 'players': {'$distinct_count': 'player_id'}}),
+    'games per season': (None, ['season'], {'games': {'$count': None}}),
+}
+
+
+def build_table(row_count: int, columnar: bool):
+    random.seed(29)
+    db = Database('bench_aggregate', '/tmp/manydex_bench_aggregate', False, columnar=columnar)
+    table = db.add_table('box_scores', ['season'], 'box_score_id', None, [])
+    table.insert([{
+        'box_score_id': row_id,
+        'season': 2000 + row_id % 20,
+        'team_id': random.randint(1, 30),
+        'player_id': random.randint(1, 2000),
+        'stats': {'points': random.randint(0, 60), 'minutes': random.randint(0, 48)},
+    } for row_id in range(row_count)])
+    return table
+
+
+def find_and_group(table, query, group_by, metrics):
+    # What callers wrote before aggregate existed: fetch the rows, then group them in Python
+    groups = {}
+    for row in table.find(query):
+        groups.setdefault(tuple(row[field] for field in group_by), []).append(row)
+    return groups
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tables = {'rows': build_table(row_count, columnar=False)}
+    if columnar_available():
+        tables['columnar'] = build_table(row_count, columnar=True)
+    print(f'{row_count} rows in 20 partitions')
+
+    for label, (query, group_by, metrics) in LEADERBOARDS.items():
+        find_ms, _ = timed(lambda: find_and_group(tables['rows'], query, group_by, metrics))
+        timings = []
+        for mode, table in tables.items():
+            table.aggregate(query, group_by, metrics)
+            elapsed_ms, groups = timed(lambda: table.aggregate(query, group_by, metrics))
+            timings.append(f'{mode} {elapsed_ms:8.1f} ms')
+        print(f'{label:<24} find + group {find_ms:8.1f} ms   ' + '   '.join(timings) + f'   {len(groups)} groups')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_format'
+
+
+async def build(row_count: int, partition_count: int):
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_format', FOLDER_PATH, False)
+    table = db.add_table('box_scores', ['game_day'], 'box_score_id', None, [])
+    table.insert([{
+        'box_score_id': row_id,
+        'game_day': row_id % partition_count,
+        'player_id': row_id % 4000,
+        'stats': {'points': row_id % 50, 'rebounds': row_id % 17, 'assists': row_id % 13, 'minutes': row_id % 48},
+        'comment': 'lorem ipsum dolor sit amet ' * 4,
+    } for row_id in range(row_count)])
+    await db.save_database()
+    json_bytes = directory_size()
+    await db.convert_storage_format('binary')
+    return json_bytes, directory_size()
+
+
+def directory_size():
+    return sum(entry.stat().st_size for entry in os.scandir(f'{FOLDER_PATH}/bench_format/box_scores'))
+
+
+async def cold_start(storage_format: str):
+    db = Database('bench_format', FOLDER_PATH, False)
+    start = time.perf_counter()
+    await db.read_from_file()
+    open_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    row = db.tables['box_scores'].findOne({'box_score_id': 12345})
+    lookup_ms = (time.perf_counter() - start) * 1000
+    assert row['box_score_id'] == 12345
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'format': storage_format, 'open_ms': open_ms, 'lookup_ms': lookup_ms, 'peak_rss_mb': peak_rss_mb}))
+
+
+def run_child(storage_format: str):
+    output = subprocess.run([sys.executable, __file__, '--cold-start', storage_format], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def convert(storage_format: str):
+    db = Database('bench_format', FOLDER_PATH, False)
+    await db.read_from_file()
+    await db.convert_storage_format(storage_format)
+
+
+def main():
+    if sys.argv[1:2] == ['--cold-start']:
+        asyncio.run(cold_start(sys.argv[2]))
+        return
+
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    json_bytes, binary_bytes = asyncio.run(build(row_count, partition_count=200))
+    binary = run_child('binary')
+    asyncio.run(convert('json'))
+    pretty_json = run_child('json')
+
+    print(f'{row_count} rows, json {json_bytes / 2**20:.1f} MB on disk, binary {binary_bytes / 2**20:.1f} MB on disk')
+    for result in (pretty_json, binary):
+        print(f"{result['format']:<7} open {result['open_ms']:10.1f} ms   first lookup {result['lookup_ms']:8.2f} ms   peak RSS {result['peak_rss_mb']:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def make_rows(row_count: int, offset: int = 0):
+    random.seed(13)
+    return [{
+        'box_score_id': offset + row_id,
+        'season': 2000 + row_id % 25,
+        'team_id': random.randint(1, 30),
+        'stats': {'points': random.randint(0, 60), 'rebounds': random.randint(0, 20)},
+    } for row_id in range(row_count)]
+
+
+def new_table(secondary_indices=None):
+    db = Database('bench_bulk', '/tmp/manydex_bench_bulk', False)
+    return db.add_table('box_scores', ['season', 'team_id'], 'box_score_id', None, [], secondary_indices)
+
+
+def time_call(label, row_count, call):
+    start = time.perf_counter()
+    call()
+    seconds = time.perf_counter() - start
+    print(f'{label:<34} {seconds * 1000:9.1f} ms   {row_count / seconds:12,.0f} rows/s')
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    rows = make_rows(row_count)
+    print(f'{row_count} rows into 750 partitions')
+
+    for secondary_indices in (None, {'stats.points': 'sorted'}):
+        suffix = ' +sorted index' if secondary_indices else ''
+        table = new_table(secondary_indices)
+        time_call('row at a time insert' + suffix, row_count, lambda: [table.insert(row) for row in rows])
+
+        table = new_table(secondary_indices)
+        time_call('batch insert' + suffix, row_count, lambda: table.insert(rows))
+
+        # Half the batch replaces existing rows, half is new
+        upserts = make_rows(row_count, offset=row_count // 2)
+        time_call('batch upsert' + suffix, row_count, lambda: table.upsert(upserts))
+        assert len(table.partition_name_by_primary_key) == row_count + row_count // 2
+
+
+if __name__ == '__main__':
+    main()
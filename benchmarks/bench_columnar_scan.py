@@ -0,0 +1,57 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import columnar_available
+from database import Database
+
+QUERIES = {
+    'points > 55': {'stats.points': {'$gt': 55}},
+    'minutes between, team': {'stats.minutes': {'$between': [30, 36]}, 'team_id': 7},
+    'position in, fg_pct >=': {'position': {'$in': ['PG', 'SG']}, 'stats.fg_pct': {'$gte': 0.6}},
+}
+
+
+def build_table(row_count: int, columnar: bool):
+    random.seed(23)
+    db = Database('bench_columnar', '/tmp/manydex_bench_columnar', False, columnar=columnar)
+    table = db.add_table('box_scores', ['season'], 'box_score_id', None, [])
+    table.insert([{
+        'box_score_id': row_id,
+        'season': 2000 + row_id % 20,
+        'team_id': random.randint(1, 30),
+        'position': random.choice(['PG', 'SG', 'SF', 'PF', 'C']),
+        'stats': {'points': random.randint(0, 60), 'minutes': random.randint(0, 48), 'fg_pct': random.random()},
+    } for row_id in range(row_count)])
+    return table
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    if not columnar_available():
+        print('NumPy is not installed, nothing to compare')
+        return
+
+    row_table = build_table(row_count, columnar=False)
+    column_table = build_table(row_count, columnar=True)
+    print(f'{row_count} rows in 20 partitions')
+    for label, query in QUERIES.items():
+        row_ms, expected = timed(lambda: row_table.find(query))
+        first_ms, rows = timed(lambda: column_table.find(query))
+        warm_ms, rows = timed(lambda: column_table.find(query))
+        assert [row['box_score_id'] for row in rows] == [row['box_score_id'] for row in expected]
+        print(f'{label:<26} rows {row_ms:9.1f} ms   columnar first {first_ms:9.1f} ms   warm {warm_ms:8.1f} ms   '
+              f'({row_ms / warm_ms:5.1f}x)   {len(rows)} matches')
+
+
+if __name__ == '__main__':
+    main()
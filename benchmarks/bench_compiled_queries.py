@@ -0,0 +1,70 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from query import clear_plan_cache, compile_query, plan_cache_stats
+from utils import get_from_dict
+
+
+def build_table(row_count: int):
+    random.seed(11)
+    db = Database('bench_compiled', '/tmp/manydex_bench', False)
+    table = db.add_table('player_games', [], 'player_game_id', None, [])
+    table.insert([{
+        'player_game_id': row_id,
+        'team_id': random.randint(1, 30),
+        'position': random.choice(['PG', 'SG', 'SF', 'PF', 'C']),
+        'stats': {'points': random.randint(0, 60), 'minutes': random.randint(0, 48)},
+    } for row_id in range(row_count)])
+    return table
+
+
+def interpreted_filter(table, rows, query):
+    # The per-field, per-row dispatch Table.filter used before queries were compiled
+    for query_field, query_clause in query.items():
+        rows = [row for row in rows if all(table.meets_query_condition(get_from_dict(row, query_field), func, value)
+                                           for func, value in query_clause.items())]
+    return rows
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    table = build_table(row_count)
+    rows = table.find()
+    query = table.normalize_query({
+        'stats.minutes': {'$gte': 20},
+        'position': {'$in': ['PG', 'SG']},
+        'stats.points': {'$between': [25, 40]},
+        'team_id': 7,
+    })
+
+    start = time.perf_counter()
+    interpreted = interpreted_filter(table, rows, query)
+    interpreted_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    predicate = compile_query(query)
+    compiled = [row for row in rows if predicate(row)]
+    compiled_ms = (time.perf_counter() - start) * 1000
+    assert compiled == interpreted
+
+    print(f'{row_count} rows, {len(compiled)} matches')
+    print(f'interpreted filter   {interpreted_ms:9.2f} ms')
+    print(f'compiled predicate   {compiled_ms:9.2f} ms')
+
+    # Same template, different constants: only the first call pays for planning
+    clear_plan_cache()
+    iterations = 100_000
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        compile_query({'team_id': {'$eq': iteration % 30}, 'stats.points': {'$gt': iteration % 60}})
+    bind_us = (time.perf_counter() - start) * 1_000_000 / iterations
+    print(f'template bind        {bind_us:9.2f} us/query  cache {plan_cache_stats}')
+
+
+if __name__ == '__main__':
+    main()
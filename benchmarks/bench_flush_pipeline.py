@@ -0,0 +1,62 @@
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_flush'
+
+
+def build(partition_count: int, rows_per_partition: int, do_compression: bool, flush_workers: int):
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_flush', FOLDER_PATH, do_compression, flush_workers=flush_workers)
+    table = db.add_table('box_scores', ['game_id'], 'box_score_id', None, [])
+    table.insert([{
+        'box_score_id': row_id,
+        'game_id': row_id % partition_count,
+        'player_id': row_id % 4000,
+        'stats': {'points': row_id % 50, 'rebounds': row_id % 17, 'assists': row_id % 13},
+    } for row_id in range(partition_count * rows_per_partition)])
+    return db, table
+
+
+def serial_flush(table):
+    # The previous save path: every partition serialized and written one after another on the event loop thread
+    start = time.perf_counter()
+    bytes_written = 0
+    for partition in table.partitions_by_partition_name.values():
+        partition.write_file()
+        bytes_written += partition.last_write_bytes
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'mb_per_second': bytes_written / (1024 * 1024) / seconds,
+            'partitions_per_second': len(table.partitions_by_partition_name) / seconds}
+
+
+def report(label, stats):
+    print(f"{label:<22} {stats['seconds'] * 1000:9.1f} ms   {stats['mb_per_second']:8.1f} MB/s   {stats['partitions_per_second']:9.0f} partitions/s")
+
+
+def main():
+    partition_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rows_per_partition = 20
+    print(f'{partition_count} dirty partitions x {rows_per_partition} rows, {os.cpu_count()} cpus')
+
+    for do_compression in (False, True):
+        label = 'gzip' if do_compression else 'json'
+        db, table = build(partition_count, rows_per_partition, do_compression, 1)
+        report(f'{label} serial', serial_flush(table))
+
+        for flush_workers in (1, 4, 16):
+            db, table = build(partition_count, rows_per_partition, do_compression, flush_workers)
+            stats = asyncio.run(db.save_database())
+            assert stats['partitions_written'] == partition_count and stats['failures'] == 0
+            report(f'{label} pipeline x{flush_workers}', stats)
+            db.flush_pipeline.shutdown()
+
+
+if __name__ == '__main__':
+    main()
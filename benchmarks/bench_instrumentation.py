@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from instrumentation import CounterSink, ExplainLog, SlowQueryLog, profiling
+from join import _cached_join, join
+
+QUERIES = [
+    {'season': 2019, 'points': {'$gte': 40}},
+    {'season': {'$in': [2017, 2018]}, 'team_id': 7, 'points': {'$lt': 10}},
+    {'box_score_id': {'$in': list(range(0, 2000, 7))}},
+]
+
+
+def build(row_count: int):
+    random.seed(53)
+    db = Database('bench_instrumentation', '/tmp/manydex_bench_instrumentation', False)
+    teams = db.add_table('teams', [], 'team_id', None, [])
+    box_scores = db.add_table('box_scores', ['season'], 'box_score_id', None, [])
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('teams', 'box_scores', 'team_id', 'one_to_many')
+    teams.insert([{'team_id': team_id, 'name': f'team {team_id}'} for team_id in range(30)])
+    box_scores.insert([{
+        'box_score_id': row_id,
+        'season': 2000 + row_id % 20,
+        'team_id': row_id % 30,
+        'points': random.randint(0, 60),
+    } for row_id in range(row_count)])
+    return db
+
+
+def timed(call, repeat: int):
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            call()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / repeat * 1_000_000
+
+
+def report(label: str, baseline_us: float, modes):
+    cells = '   '.join(f'{name} {us:9.1f} us ({(us / baseline_us - 1) * 100:+6.1f}%)' for name, us in modes)
+    print(f'  {label:<34} direct {baseline_us:9.1f} us   {cells}')
+
+
+def measure(label: str, direct, call, repeat: int):
+    # direct skips the instrumentation check altogether, so off shows what the disabled hooks cost
+    baseline_us = timed(direct, repeat)
+    modes = [('off', timed(call, repeat))]
+    with profiling(CounterSink()):
+        modes.append(('counters', timed(call, repeat)))
+    with profiling(CounterSink(), SlowQueryLog(threshold_ms=50), ExplainLog()):
+        modes.append(('all sinks', timed(call, repeat)))
+    report(label, baseline_us, modes)
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    db = build(row_count)
+    table = db.tables['box_scores']
+    print(f'{row_count} rows in 20 partitions; best of 5, per call')
+
+    for query in QUERIES:
+        label = f'find {", ".join(query)}'
+        measure(label, lambda: table._cached_find(query, None, 0, None, False), lambda: table.find(query), 20)
+    measure('find_iter limit 10', lambda: table._cached_find({'points': {'$gte': 30}}, None, 0, 10, False),
+            lambda: table.find({'points': {'$gte': 30}}, limit=10), 200)
+    join_query = {'box_scores': {'season': 2019, 'points': {'$gte': 50}}}
+    measure('join teams + box_scores', lambda: _cached_join(db, 'teams', ['box_scores'], join_query, root_table_name=None, fields=None, inner=False),
+            lambda: join(db, 'teams', ['box_scores'], join_query), 20)
+
+    # Partition writes: every partition is dirtied, then flushed with and without a counter sink attached
+    for label, sinks in (('save off', ()), ('save counters', (CounterSink(),))):
+        table.update([{**row} for row in table.find({'box_score_id': {'$in': list(range(20))}})])
+        with profiling(*sinks):
+            start = time.perf_counter()
+            asyncio.run(db.save_database())
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f'  {label:<34} {elapsed_ms:9.1f} ms')
+        if sinks:
+            writes = sinks[0].totals('partition_write')['box_scores']
+            print(f"    {writes['count']} partition writes, {writes['bytes'] / 1024 / 1024:.1f} MB, "
+                  f"serialize {writes['serialize_seconds'] * 1000:.1f} ms, fsync {writes['fsync_seconds'] * 1000:.1f} ms (summed over partitions)")
+
+
+if __name__ == '__main__':
+    main()
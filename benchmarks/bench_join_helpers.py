@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import distinct, get_from_dict, group_by, index_and_group_by, index_by
+
+SIZES = [10_000, 100_000, 1_000_000]
+# The list scan in the old distinct is quadratic; past this many comparisons it is not timed
+MAX_LEGACY_COMPARISONS = 2 * 10 ** 9
+
+
+def legacy_distinct(arr):
+    result = []
+    for item in arr:
+        if item not in result:
+            result.append(item)
+    return result
+
+
+def legacy_index_by(list_, index_field):
+    index_map = {}
+    for row in list_:
+        index_map[get_from_dict(row, index_field)] = row
+    return index_map
+
+
+def legacy_group_by(list_, index_field):
+    group_map = defaultdict(list)
+    for row in list_:
+        group_map[get_from_dict(row, index_field)].append(row)
+    return group_map
+
+
+def build_rows(row_count: int):
+    random.seed(47)
+    return [{'stat_id': row_id, 'player_id': row_id // 4, 'team_id': row_id % 30, 'game': {'season': 2000 + row_id % 20}} for row_id in range(row_count)]
+
+
+def timed(call, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def report(label: str, legacy_ms, new_ms):
+    legacy = f'{legacy_ms:10.1f} ms' if legacy_ms is not None else '    skipped'
+    speedup = f'{legacy_ms / new_ms:8.1f}x' if legacy_ms is not None else ''
+    print(f'  {label:<46} old {legacy}   new {new_ms:9.1f} ms {speedup}')
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    for row_count in sizes:
+        rows = build_rows(row_count)
+        print(f'{row_count} rows')
+
+        for key, distinct_count in (('team_id', 30), ('player_id', row_count // 4)):
+            values = [row[key] for row in rows]
+            legacy_ms = timed(lambda: legacy_distinct(values), 1) if row_count * distinct_count <= MAX_LEGACY_COMPARISONS else None
+            report(f'distinct {key} ({distinct_count} values)', legacy_ms, timed(lambda: distinct(values)))
+
+        report('index_by player_id', timed(lambda: legacy_index_by(rows, 'player_id')), timed(lambda: index_by(rows, 'player_id')))
+        report('group_by game.season (dotted)', timed(lambda: legacy_group_by(rows, 'game.season')), timed(lambda: group_by(rows, 'game.season')))
+        report('index player_id + group team_id, game.season',
+               timed(lambda: (legacy_index_by(rows, 'player_id'), legacy_group_by(rows, 'team_id'), legacy_group_by(rows, 'game.season'))),
+               timed(lambda: index_and_group_by(rows, ['player_id'], ['team_id', 'game.season'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from join import explain_join, highest_parent, join
+
+
+def build_database(season_count: int = 10, games_per_season: int = 1200, player_count: int = 450, stats_per_game: int = 20):
+    db = Database('bench_join_order', '/tmp/manydex_bench', False)
+    seasons = db.add_table('season', [], 'season_id', None, [])
+    games = db.add_table('game', ['season_id'], 'game_id', None, [])
+    players = db.add_table('player', [], 'player_id', None, [])
+    stats = db.add_table('stat', [], 'stat_id', None, [], {'game_id': 'hash', 'player_id': 'hash'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('season', 'game', 'season_id', 'one_to_many')
+        db.add_connection('game', 'stat', 'game_id', 'one_to_many')
+        db.add_connection('player', 'stat', 'player_id', 'one_to_many')
+
+    seasons.insert([{'season_id': season_id} for season_id in range(season_count)])
+    games.insert([{'game_id': game_id, 'season_id': game_id % season_count} for game_id in range(season_count * games_per_season)])
+    players.insert([{'player_id': player_id} for player_id in range(player_count)])
+    stats.insert([{
+        'stat_id': stat_id,
+        'game_id': stat_id // stats_per_game,
+        'player_id': (stat_id * 7) % player_count,
+        'points': stat_id % 40,
+    } for stat_id in range(season_count * games_per_season * stats_per_game)])
+    return db
+
+
+def time_join(db, query_addons, root_table_name=None):
+    start = time.perf_counter()
+    join_tracker = join(db, 'season', ['game', 'stat', 'player'], query_addons, root_table_name, inner=True)
+    return (time.perf_counter() - start) * 1000, len(join_tracker['results'])
+
+
+def main():
+    query_addons = {'player': {'player_id': 42}}
+    table_names = ['season', 'game', 'stat', 'player']
+    roots = [
+        ('base', 'season'),
+        ('topology', highest_parent(build_database(), table_names, query_addons)),
+        ('cost', None),
+    ]
+
+    counts = set()
+    for label, root_table_name in roots:
+        elapsed_ms, count = time_join(build_database(), query_addons, root_table_name)
+        counts.add(count)
+        print(f'{label:<9} root {root_table_name or "(planned)":<10} {elapsed_ms:10.2f} ms')
+    assert len(counts) == 1
+
+    explanation = explain_join(build_database(), 'season', ['game', 'stat', 'player'], query_addons, inner=True)
+    print(f'planned root {explanation["root"]}, estimated costs {explanation["costs"]}')
+    for stage in explanation['stages']:
+        print(f'  {stage["table_name"]:<8} estimated {stage["estimated_rows"]:>10.1f}  actual {stage["actual_rows"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from join import join
+from utils import group_by, index_by
+
+
+def build_database(stat_count: int, team_count: int = 1000, players_per_team: int = 15):
+    db = Database('bench_join', '/tmp/manydex_bench', False)
+    teams = db.add_table('team', ['conference'], 'team_id', None, [])
+    players = db.add_table('player', [], 'player_id', None, [], {'team_id': 'hash'})
+    stats = db.add_table('stat', [], 'stat_id', None, [], {'player_id': 'hash'})
+    db.add_connection('team', 'player', 'team_id', 'one_to_many')
+    db.add_connection('player', 'stat', 'player_id', 'one_to_many')
+
+    player_count = team_count * players_per_team
+    teams.insert([{'team_id': team_id, 'conference': team_id % 20} for team_id in range(team_count)])
+    players.insert([{'player_id': player_id, 'team_id': player_id % team_count} for player_id in range(player_count)])
+    stats.insert([{'stat_id': stat_id, 'player_id': stat_id % player_count, 'points': stat_id % 50} for stat_id in range(stat_count)])
+    return db
+
+
+def full_materialization_cost(db):
+    # What every join paid before pushdown: each child table loaded whole and mapped on every key
+    for table_name in ('player', 'stat'):
+        table = db.tables[table_name]
+        data = table.find({})
+        for key in table.get_foreign_keys_and_primary_keys():
+            index_by(data, key)
+            group_by(data, key)
+
+
+def main():
+    stat_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    start = time.perf_counter()
+    db = build_database(stat_count)
+    print(f'built {stat_count} stat rows in {time.perf_counter() - start:.1f} s')
+
+    query_addons = {'team': {'conference': 3}}
+    start = time.perf_counter()
+    join_tracker = join(db, 'team', ['player', 'stat'], query_addons)
+    pushdown_ms = (time.perf_counter() - start) * 1000
+    rows_by_table = {table_name: len(tracked['data']) for table_name, tracked in join_tracker['tables'].items()}
+
+    start = time.perf_counter()
+    full_materialization_cost(db)
+    full_ms = (time.perf_counter() - start) * 1000
+
+    print(f'pushdown join              {pushdown_ms:10.2f} ms  rows materialized {rows_by_table}')
+    print(f'child tables load + maps   {full_ms:10.2f} ms  (lower bound for the join without pushdown)')
+
+
+if __name__ == '__main__':
+    main()
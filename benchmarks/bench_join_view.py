@@ -0,0 +1,71 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from join import join
+
+QUERY_ADDONS = {'players': {'position': {'$in': ['PG', 'SG']}}}
+
+
+def build(player_count: int):
+    random.seed(31)
+    db = Database('bench_join_view', '/tmp/manydex_bench_join_view', False)
+    teams = db.add_table('teams', [], 'team_id', None, [])
+    players = db.add_table('players', ['team_id'], 'player_id', None, [])
+    stats = db.add_table('stats', ['season'], 'stat_id', None, [])
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('teams', 'players', 'team_id', 'one_to_many')
+        db.add_connection('players', 'stats', 'player_id', 'one_to_many')
+    teams.insert([{'team_id': team_id, 'name': f'team {team_id}'} for team_id in range(30)])
+    players.insert([{'player_id': player_id, 'team_id': player_id % 30, 'position': random.choice(['PG', 'SG', 'SF', 'PF', 'C'])} for player_id in range(player_count)])
+    stats.insert([{'stat_id': stat_id, 'player_id': stat_id % player_count, 'season': 2020 + stat_id % 4, 'points': random.randint(0, 40)} for stat_id in range(player_count * 4)])
+    return db
+
+
+def write(db, step: int, player_count: int):
+    # Box score corrections and the occasional trade
+    if step % 5:
+        stat_id = random.randrange(player_count * 4)
+        db.tables['stats'].update([{'stat_id': stat_id, 'player_id': stat_id % player_count, 'season': 2020 + stat_id % 4, 'points': random.randint(0, 40)}])
+    else:
+        player_id = random.randrange(player_count)
+        db.tables['players'].update([{'player_id': player_id, 'team_id': random.randrange(30), 'position': random.choice(['PG', 'SG', 'SF', 'PF', 'C'])}])
+
+
+def run(db, read, requests: int, reads_per_write: int, player_count: int):
+    random.seed(37)
+    start = time.perf_counter()
+    for step in range(requests):
+        if step % (reads_per_write + 1) == reads_per_write:
+            write(db, step, player_count)
+        else:
+            read()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    player_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f'teams -> players -> stats, {player_count} players, {player_count * 4} stat rows, {requests} requests')
+
+    for reads_per_write in (1, 10, 100):
+        db = build(player_count)
+        join_ms = run(db, lambda: join(db, 'teams', ['players', 'stats'], QUERY_ADDONS)['results'], requests, reads_per_write, player_count)
+
+        db = build(player_count)
+        start = time.perf_counter()
+        view = db.add_join_view('rosters', 'teams', ['players', 'stats'], QUERY_ADDONS)
+        build_ms = (time.perf_counter() - start) * 1000
+        view_ms = run(db, view.rows, requests, reads_per_write, player_count)
+        print(f'{reads_per_write:>3} reads per write   join {join_ms:9.1f} ms   view {view_ms:8.1f} ms (+{build_ms:.1f} ms build)   '
+              f'{join_ms / view_ms:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_lazy'
+
+
+async def build(row_count: int, partition_count: int):
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_lazy', FOLDER_PATH, False)
+    for table_name in ('box_scores', 'play_by_play'):
+        table = db.add_table(table_name, ['game_day'], 'event_id', None, [])
+        table.insert([{
+            'event_id': row_id,
+            'game_day': row_id % partition_count,
+            'player_id': row_id % 4000,
+            'stats': {'points': row_id % 50, 'rebounds': row_id % 17},
+        } for row_id in range(row_count)])
+    await db.save_database()
+
+
+async def time_open(lazy: bool):
+    db = Database('bench_lazy', FOLDER_PATH, False)
+    start = time.perf_counter()
+    await db.read_from_file(lazy=lazy)
+    open_ms = (time.perf_counter() - start) * 1000
+
+    table = db.tables['box_scores']
+    start = time.perf_counter()
+    rows = table.find({'game_day': 17})
+    query_ms = (time.perf_counter() - start) * 1000
+    loaded = sum(partition.is_loaded for partition in table.partitions_by_partition_name.values())
+    return open_ms, query_ms, len(rows), loaded, len(table.partitions_by_partition_name)
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    asyncio.run(build(row_count, partition_count=365))
+    print(f'2 tables x {row_count} rows, 365 partitions each')
+    for lazy in (False, True):
+        open_ms, query_ms, returned, loaded, total = asyncio.run(time_open(lazy))
+        print(f"{'lazy' if lazy else 'eager':<6} open {open_ms:10.1f} ms   first query {query_ms:8.2f} ms "
+              f"({returned} rows)   partitions loaded {loaded}/{total}")
+
+
+if __name__ == '__main__':
+    main()
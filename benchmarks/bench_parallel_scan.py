@@ -0,0 +1,78 @@
+import asyncio
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from parallel_scan import shutdown_executors
+
+FOLDER_PATH = '/tmp/manydex_bench_parallel'
+WORKER_COUNTS = [1, 4, 16, 32]
+
+
+async def build(row_count: int, partition_count: int):
+    random.seed(5)
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_parallel', FOLDER_PATH, False)
+    table = db.add_table('player_games', ['season'], 'player_game_id', None, [])
+    table.insert([{
+        'player_game_id': row_id,
+        'season': row_id % partition_count,
+        'team_id': random.randint(1, 30),
+        'position': random.choice(['PG', 'SG', 'SF', 'PF', 'C']),
+        'stats': {'points': random.randint(0, 60), 'minutes': random.randint(0, 48)},
+    } for row_id in range(row_count)])
+    await db.save_database()
+
+
+def open_table(workers: int, dirty: bool):
+    db = Database('bench_parallel', FOLDER_PATH, False, parallel_workers=workers)
+    asyncio.run(db.read_from_file())
+    table = db.tables['player_games']
+    table.parallel_min_rows = 0
+    if dirty:
+        # Unsaved partitions have to ship their rows to the workers instead of letting them read the files
+        for partition in table.partitions_by_partition_name.values():
+            partition.is_dirty = True
+    return table
+
+
+def time_find(table, query, fields=None, repeats: int = 3):
+    best_ms, rows = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = table.find(query, fields)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        best_ms = elapsed_ms if best_ms is None else min(best_ms, elapsed_ms)
+    return best_ms, rows
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    asyncio.run(build(row_count, partition_count=64))
+    query = {'stats.minutes': {'$gte': 30}, 'position': {'$in': ['PG', 'SG']}, 'stats.points': {'$between': [20, 45]}}
+    fields = ['player_game_id', 'stats.points']
+    print(f'{row_count} rows in 64 partitions, {os.cpu_count()} cpus')
+
+    for dirty in (False, True):
+        baseline = {}
+        for workers in WORKER_COUNTS:
+            table = open_table(workers, dirty)
+            rows_ms, rows = time_find(table, query)
+            fields_ms, projected = time_find(table, query, fields)
+            if workers == 1:
+                baseline = {'rows': rows_ms, 'fields': fields_ms, 'keys': sorted(row['player_game_id'] for row in rows)}
+            else:
+                assert sorted(row['player_game_id'] for row in rows) == baseline['keys']
+                assert sorted(row['player_game_id'] for row in projected) == baseline['keys']
+            print(f"{'dirty' if dirty else 'clean'} workers {workers:>2}   rows {rows_ms:9.1f} ms ({baseline['rows'] / rows_ms:5.2f}x)   "
+                  f"fields {fields_ms:9.1f} ms ({baseline['fields'] / fields_ms:5.2f}x)   {len(rows)} matches")
+        shutdown_executors()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_cache'
+
+
+async def build(row_count: int, partition_count: int):
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_cache', FOLDER_PATH, False)
+    table = db.add_table('box_scores', ['game_day'], 'box_score_id', None, [])
+    table.insert([{
+        'box_score_id': row_id,
+        'game_day': row_id % partition_count,
+        'player_id': row_id % 4000,
+        'stats': {'points': row_id % 50, 'rebounds': row_id % 17},
+    } for row_id in range(row_count)])
+    await db.save_database()
+    return sum(partition.estimated_bytes() for partition in table.partitions_by_partition_name.values())
+
+
+async def run_workload(memory_budget_bytes, cache_policy: str, partition_count: int, operations: int):
+    random.seed(1)
+    db = Database('bench_cache', FOLDER_PATH, False, memory_budget_bytes=memory_budget_bytes, cache_policy=cache_policy)
+    await db.read_from_file(lazy=True)
+    table = db.tables['box_scores']
+
+    start = time.perf_counter()
+    for operation in range(operations):
+        # Recent game days are queried far more often than old ones
+        game_day = partition_count - 1 - min(int(random.paretovariate(1.2)) - 1, partition_count - 1)
+        rows = table.find({'game_day': game_day})
+        if operation % 10 == 0 and rows:
+            row = dict(rows[0])
+            row['stats'] = {'points': operation, 'rebounds': 0}
+            table.update(row)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    await db.save_database()
+    return elapsed_ms, db.cache_stats()
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    partition_count = 500
+    total_bytes = asyncio.run(build(row_count, partition_count))
+    print(f'{row_count} rows in {partition_count} partitions, ~{total_bytes / 2**20:.1f} MB serialized')
+
+    for budget_fraction in (None, 0.5, 0.1, 0.02):
+        for cache_policy in ('lru', 'lfu'):
+            if budget_fraction is None and cache_policy == 'lfu':
+                continue
+            budget = int(total_bytes * budget_fraction) if budget_fraction else None
+            elapsed_ms, stats = asyncio.run(run_workload(budget, cache_policy, partition_count, 2000))
+            label = f'{budget_fraction:.0%} budget {cache_policy}' if budget_fraction else 'unbounded'
+            print(f"{label:<16} {elapsed_ms:9.1f} ms  hit rate {stats.get('hit_rate', 1.0):6.1%}  misses {stats.get('misses', 0):>5}  "
+                  f"evictions {stats.get('evictions', 0):>5}  write-backs {stats.get('write_backs', 0):>4}  "
+                  f"resident {stats.get('bytes_resident', 0) / 2**20:6.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def build_table(partition_count: int, rows_per_partition: int):
+    db = Database('bench_pruning', '/tmp/manydex_bench', False)
+    table = db.add_table('games', ['season', 'team_id'], 'game_id', None, [])
+    rows = []
+    for game_id in range(partition_count * rows_per_partition):
+        partition_number = game_id % partition_count
+        rows.append({
+            'game_id': game_id,
+            'season': 2000 + partition_number // 100,
+            'team_id': partition_number % 100,
+            'points': game_id % 130,
+        })
+    table.insert(rows)
+    return table
+
+
+def run_query(table, label, query, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        table.find(query)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    stats = table.explain(query)
+    print(f"{label:<28} partitions {stats['partitions_scanned']:>6}/{stats['partitions_total']:<6} "
+          f"rows scanned {stats['rows_scanned']:>7}/{stats['rows_total']:<7} "
+          f"returned {stats['rows_returned']:>6}  {elapsed_ms:8.3f} ms")
+
+
+def main():
+    table = build_table(partition_count=10_000, rows_per_partition=5)
+    run_query(table, 'primary key $eq', {'game_id': 4242})
+    run_query(table, 'primary key $in', {'game_id': {'$in': [1, 2, 3, 40_000]}})
+    run_query(table, 'index $eq', {'season': 2042, 'team_id': 7})
+    run_query(table, 'index $in', {'season': {'$in': [2001, 2002]}})
+    run_query(table, 'index $between', {'season': {'$between': [2010, 2012]}, 'team_id': {'$lt': 10}})
+    run_query(table, 'index $nin', {'season': {'$nin': list(range(2000, 2099))}})
+    run_query(table, 'non-index field (full scan)', {'points': 100}, repeat=3)
+
+
+if __name__ == '__main__':
+    main()
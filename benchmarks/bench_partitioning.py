@@ -0,0 +1,84 @@
+import asyncio
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_partitioning'
+
+# One high-cardinality field partitioned each way; 'day' is an ISO date over two years
+STRATEGIES = [
+    ('value user_id', ['user_id'], None),
+    ('hash user_id x16', ['user_id'], {'user_id': {'strategy': 'hash', 'shards': 16}}),
+    ('range points', ['points'], {'points': {'strategy': 'range', 'boundaries': [10, 20, 30, 40, 50]}}),
+    ('time day by month', ['day'], {'day': {'strategy': 'time', 'unit': 'month'}}),
+    ('composite', ['season', 'user_id'], {'user_id': {'strategy': 'hash', 'shards': 4}}),
+]
+
+QUERIES = [
+    ('user_id =', {'user_id': 1234}),
+    ('points range', {'points': {'$between': [12, 18]}}),
+    ('day range', {'day': {'$gte': '2019-03-01', '$lt': '2019-04-01'}}),
+]
+
+
+def generate(row_count: int, user_count: int):
+    rng = random.Random(7)
+    return [{
+        'row_id': row_id,
+        'user_id': rng.randrange(user_count),
+        'season': 2018 + row_id % 2,
+        'day': f"{2018 + rng.randrange(2)}-{1 + rng.randrange(12):02d}-{1 + rng.randrange(28):02d}",
+        'points': rng.randrange(60),
+    } for row_id in range(row_count)]
+
+
+def timed(call, repeat: int = 1):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    user_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    rows = generate(row_count, user_count)
+    print(f'{row_count} rows, {user_count} users')
+
+    for label, indices, partitioning in STRATEGIES:
+        shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+        db = Database('bench_partitioning', FOLDER_PATH, False)
+        table = db.add_table('scores', indices, 'row_id', None, [], partitioning=partitioning)
+        insert_ms = timed(lambda: table.insert(rows))
+        save_ms = timed(lambda: asyncio.run(db.save_database()))
+        files = len(os.listdir(table.storage_location))
+        cells = []
+        for query_label, query in QUERIES:
+            scanned = table.explain(query)['partitions_scanned']
+            cells.append(f'{query_label} {timed(lambda: table.find(query), 5):7.2f} ms ({scanned} parts)')
+        print(f'  {label:<18} {len(table.partitions_by_partition_name):6} partitions {files:6} files   '
+              f'insert {insert_ms:8.1f} ms   save {save_ms:8.1f} ms   ' + '   '.join(cells))
+
+    # The value-partitioned table regrouped into hash shards in place, its old files removed
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_partitioning', FOLDER_PATH, False)
+    table = db.add_table('scores', ['user_id'], 'row_id', None, [])
+    table.insert(rows)
+    asyncio.run(db.save_database())
+    start = time.perf_counter()
+    asyncio.run(table.repartition(['user_id'], {'user_id': {'strategy': 'hash', 'shards': 16}}))
+    print(f'  repartition value -> hash x16: {(time.perf_counter() - start) * 1000:.1f} ms, '
+          f'{len(table.partitions_by_partition_name)} partitions, {len(os.listdir(table.storage_location))} files')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from join import join
+
+READS = [
+    lambda db: db.tables['box_scores'].find({'season': 2019, 'points': {'$gte': 40}}),
+    lambda db: db.tables['box_scores'].find({'season': {'$in': [2017, 2018]}, 'team_id': 7}),
+    lambda db: db.tables['box_scores'].find({'points': {'$gte': 58}}),
+    lambda db: join(db, 'teams', ['box_scores'], {'box_scores': {'season': 2019, 'points': {'$gte': 50}}})['results'],
+]
+
+
+def build(row_count: int, result_cache_rows: int = None):
+    random.seed(41)
+    db = Database('bench_result_cache', '/tmp/manydex_bench_result_cache', False, result_cache_rows=result_cache_rows)
+    teams = db.add_table('teams', [], 'team_id', None, [])
+    box_scores = db.add_table('box_scores', ['season'], 'box_score_id', None, [])
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('teams', 'box_scores', 'team_id', 'one_to_many')
+    teams.insert([{'team_id': team_id, 'name': f'team {team_id}'} for team_id in range(30)])
+    box_scores.insert([{
+        'box_score_id': row_id,
+        'season': 2000 + row_id % 20,
+        'team_id': row_id % 30,
+        'points': random.randint(0, 60),
+    } for row_id in range(row_count)])
+    return db
+
+
+def run(db, requests: int, reads_per_write: int, row_count: int):
+    # Writes land in a random season, so most of them leave the cached season 2019 results untouched
+    random.seed(43)
+    start = time.perf_counter()
+    for step in range(requests):
+        if step % (reads_per_write + 1) == reads_per_write:
+            row_id = random.randrange(row_count)
+            db.tables['box_scores'].update([{'box_score_id': row_id, 'season': 2000 + row_id % 20, 'team_id': row_id % 30, 'points': random.randint(0, 60)}])
+        else:
+            READS[step % len(READS)](db)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f'{row_count} rows in 20 partitions, {requests} requests')
+    for reads_per_write in (10, 500):
+        uncached_ms = run(build(row_count), requests, reads_per_write, row_count)
+        db = build(row_count, result_cache_rows=100_000)
+        cached_ms = run(db, requests, reads_per_write, row_count)
+        hit_rates = ', '.join(f"{table_name} {stats['hit_rate']:.0%}" for table_name, stats in db.result_cache_stats()['tables'].items())
+        print(f'{reads_per_write:>3} reads per write   uncached {uncached_ms:9.1f} ms   cached {cached_ms:8.1f} ms   '
+              f'({uncached_ms / cached_ms:6.1f}x)   hit rates: {hit_rates}')
+
+
+if __name__ == '__main__':
+    main()
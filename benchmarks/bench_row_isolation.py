@@ -0,0 +1,68 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from join import join
+from utils import deep_copy
+
+
+def build(row_count: int):
+    random.seed(17)
+    db = Database('bench_isolation', '/tmp/manydex_bench_isolation', False)
+    teams = db.add_table('teams', [], 'team_id', None, [])
+    box_scores = db.add_table('box_scores', ['season'], 'box_score_id', None, [], {'team_id': 'hash'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('teams', 'box_scores', 'team_id', 'one_to_many')
+    teams.insert([{'team_id': team_id, 'name': f'team {team_id}', 'colors': ['red', 'white']} for team_id in range(30)])
+    box_scores.insert([{
+        'box_score_id': row_id,
+        'season': 2000 + row_id % 20,
+        'team_id': row_id % 30,
+        'stats': {'points': random.randint(0, 60), 'shooting': {'fga': random.randint(0, 30), 'fgm': random.randint(0, 20)}},
+        'tags': ['starter'] if row_id % 3 else ['bench'],
+    } for row_id in range(row_count)])
+    return db
+
+
+def timed(label, call):
+    start = time.perf_counter()
+    result = call()
+    print(f'{label:<44} {(time.perf_counter() - start) * 1000:9.1f} ms')
+    return result
+
+
+def touch(rows):
+    # A caller editing a tenth of the rows, including nested values
+    for row in rows[::10]:
+        row['stats']['points'] = -1
+        row['tags'].append('edited')
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    db = build(row_count)
+    table = db.tables['box_scores']
+    print(f'{row_count} rows')
+
+    timed('find (live stored rows)', lambda: table.find({'season': {'$gte': 2005}}))
+    rows = timed('find + deep_copy', lambda: deep_copy(table.find({'season': {'$gte': 2005}})))
+    timed('  then edit 10%', lambda: touch(rows))
+    rows = timed('find copy_on_write', lambda: table.find({'season': {'$gte': 2005}}, copy_on_write=True))
+    timed('  then edit 10%', lambda: touch(rows))
+    timed('find fields=[box_score_id, stats.points]', lambda: table.find({'season': {'$gte': 2005}}, fields=['box_score_id', 'stats.points']))
+    assert all(row['stats']['points'] >= 0 and row['tags'][-1] != 'edited' for row in table.find())
+
+    timed('join + deep_copy', lambda: deep_copy(join(db, 'teams', ['box_scores'])['results']))
+    timed('join (copy-on-write rows)', lambda: join(db, 'teams', ['box_scores'])['results'])
+    timed('join fields=[box_scores: stats.points]', lambda: join(db, 'teams', ['box_scores'], fields={'box_scores': ['stats.points']})['results'])
+    assert all('box_scoress' not in row for row in db.tables['teams'].find())
+
+
+if __name__ == '__main__':
+    main()
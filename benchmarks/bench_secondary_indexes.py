@@ -0,0 +1,54 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def build_table(row_count: int, secondary_indices):
+    random.seed(7)
+    db = Database('bench_secondary', '/tmp/manydex_bench', False)
+    table = db.add_table('player_games', ['season'], 'player_game_id', None, [], secondary_indices)
+    table.insert([{
+        'player_game_id': row_id,
+        'season': 2000 + row_id % 20,
+        'position': random.choice(['PG', 'SG', 'SF', 'PF', 'C']),
+        'player_id': row_id % 5000,
+        'stats': {'points': random.randint(0, 60), 'assists': random.randint(0, 20)},
+    } for row_id in range(row_count)])
+    return table
+
+
+def time_query(table, query, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = table.find(query)
+    return (time.perf_counter() - start) * 1000 / repeat, len(results)
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    queries = [
+        ('hash $eq', {'player_id': 42}),
+        ('hash $in', {'player_id': {'$in': list(range(100))}}),
+        ('sorted $gte', {'stats.points': {'$gte': 58}}),
+        ('sorted $between + hash', {'stats.points': {'$between': [40, 45]}, 'position': 'C'}),
+        ('sorted + partition index', {'stats.points': {'$gt': 55}, 'season': 2010}),
+    ]
+    scan_table = build_table(row_count, None)
+    indexed_table = build_table(row_count, {'player_id': 'hash', 'position': 'hash', 'stats.points': 'sorted'})
+
+    print(f'{row_count} rows')
+    for label, query in queries:
+        scan_ms, scan_count = time_query(scan_table, query)
+        indexed_ms, indexed_count = time_query(indexed_table, query)
+        assert scan_count == indexed_count
+        print(f'{label:<26} returned {indexed_count:>7}  scan {scan_ms:9.2f} ms  indexed {indexed_ms:9.2f} ms  '
+              f'rows scanned {indexed_table.explain(query)["rows_scanned"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_stream'
+EXPORT_PATH = '/tmp/manydex_bench_stream_export.jsonl'
+ROWS_PER_PARTITION = 50_000
+MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def build(row_count: int):
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    # The cache writes evicted partitions back, so the build itself never holds the whole table
+    db = Database('bench_stream', FOLDER_PATH, False, storage_format='binary', memory_budget_bytes=MEMORY_BUDGET_BYTES)
+    table = db.add_table('box_scores', ['chunk'], 'box_score_id', None, [])
+    for start in range(0, row_count, ROWS_PER_PARTITION):
+        table.insert([{
+            'box_score_id': row_id,
+            'chunk': row_id // ROWS_PER_PARTITION,
+            'player_id': row_id % 4000,
+            'stats': {'points': row_id % 50, 'rebounds': row_id % 17},
+        } for row_id in range(start, min(start + ROWS_PER_PARTITION, row_count))])
+    await db.save_database()
+
+
+def export(mode: str):
+    db = Database('bench_stream', FOLDER_PATH, False, memory_budget_bytes=MEMORY_BUDGET_BYTES)
+    asyncio.run(db.read_from_file(lazy=True))
+    table = db.tables['box_scores']
+    open_rss_mb = peak_rss_mb()
+
+    start = time.perf_counter()
+    rows = table.find_iter() if mode == 'stream' else table.find()
+    exported = 0
+    with open(EXPORT_PATH, 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row))
+            f.write('\n')
+            exported += 1
+    seconds = time.perf_counter() - start
+    print(json.dumps({'mode': mode, 'rows': exported, 'seconds': seconds, 'open_rss_mb': open_rss_mb, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ('stream', 'materialize'):
+        export(sys.argv[1])
+        return
+
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(build(row_count))
+    print(f'{row_count} rows, {MEMORY_BUDGET_BYTES // (1024 * 1024)} MB partition cache')
+
+    # Each export runs in a fresh process so peak RSS only reflects that export
+    for mode in ('stream', 'materialize'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), mode], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<12} {result['seconds'] * 1000:10.1f} ms   RSS after open {result['open_rss_mb']:8.1f} MB   "
+              f"peak {result['peak_rss_mb']:8.1f} MB   growth {result['peak_rss_mb'] - result['open_rss_mb']:8.1f} MB")
+    os.remove(EXPORT_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+FOLDER_PATH = '/tmp/manydex_bench_wal'
+
+
+def rows_of(table):
+    return sorted((row['game_id'], row['points']) for row in table.find())
+
+
+async def build_database(use_write_ahead_log: bool, row_count: int):
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    db = Database('bench_wal', FOLDER_PATH, False, use_write_ahead_log)
+    table = db.add_table('games', ['season'], 'game_id', None, [])
+    table.insert([{'game_id': game_id, 'season': 2020, 'points': game_id % 130, 'notes': 'x' * 200} for game_id in range(row_count)])
+    await db.save_database()
+    return db, table
+
+
+async def time_single_row_saves(use_write_ahead_log: bool, row_count: int, saves: int = 20):
+    db, table = await build_database(use_write_ahead_log, row_count)
+    start = time.perf_counter()
+    for save in range(saves):
+        table.update({'game_id': save, 'season': 2020, 'points': -save, 'notes': 'updated'})
+        await db.save_database()
+    return (time.perf_counter() - start) * 1000 / saves
+
+
+async def verify_crash_recovery(trials: int = 50):
+    random.seed(3)
+    db, table = await build_database(True, 500)
+    states = [(0, rows_of(table))]
+    for step in range(40):
+        if step % 3 == 0:
+            table.insert({'game_id': 10_000 + step, 'season': 2021 + step % 3, 'points': step, 'notes': ''})
+        elif step % 3 == 1:
+            table.update({'game_id': step, 'season': 2020, 'points': -step, 'notes': ''})
+        else:
+            await table.delete({'game_id': step})
+        await db.save_database()
+        states.append((table.wal.size(), rows_of(table)))
+
+    with open(table.wal.file_path, 'rb') as f:
+        log_data = f.read()
+    for _ in range(trials):
+        offset = random.randrange(len(log_data) + 1)
+        with open(table.wal.file_path, 'wb') as f:
+            f.write(log_data[:offset])
+
+        recovered = Database('bench_wal', FOLDER_PATH, False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            await recovered.read_from_file()
+        # Each save here appends one record, so recovery must land exactly on the last save fully written
+        expected = [state for size, state in states if size <= offset][-1]
+        assert rows_of(recovered.tables['games']) == expected, offset
+    return trials
+
+
+async def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    full_ms = await time_single_row_saves(False, row_count)
+    wal_ms = await time_single_row_saves(True, row_count)
+    print(f'{row_count} rows in one partition, single-row update + save')
+    print(f'full partition rewrite   {full_ms:10.2f} ms/save')
+    print(f'write-ahead log append   {wal_ms:10.2f} ms/save')
+    print(f'crash recovery: {await verify_crash_recovery()} random log truncations recovered to the last complete save')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+LABELS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel']
+JOIN_TYPES = ('one_to_many', 'many_to_one')
+
+
+class TableSpec:
+    # One generated table. It is connected to its parent either as its detail rows (one_to_many, each row carries the
+    # parent's key) or as a lookup the parent's rows point into (many_to_one, each parent row carries this table's key)
+    def __init__(self, table_name: str, row_count: int, parent: 'TableSpec' = None, join_type: str = None):
+        self.table_name = table_name
+        self.primary_key = f"{table_name}_id"
+        self.row_count = row_count
+        self.parent = parent
+        self.join_type = join_type
+        self.join_key = None
+        if parent is not None:
+            self.join_key = parent.primary_key if join_type == 'one_to_many' else self.primary_key
+        self.lookups: List['TableSpec'] = []
+
+
+class Dataset:
+    # Every row is a function of the seed and the table name alone, so the same arguments give the same data on any
+    # machine and commit; fingerprint() lets results from two runs be checked against the same input
+    def __init__(self, table_count: int = 3, root_rows: int = 2000, fanout: int = 4, partition_cardinality: int = 16,
+                 join_types: List[str] = None, shape: str = 'chain', seed: int = 1):
+        if table_count < 1:
+            raise ValueError("A dataset needs at least one table")
+        if shape not in ('chain', 'star'):
+            raise ValueError(f"Unsupported dataset shape: {shape}")
+        join_types = list(join_types or ['one_to_many'])
+        for join_type in join_types:
+            if join_type not in JOIN_TYPES:
+                raise ValueError(f"Unsupported join type: {join_type}")
+
+        self.table_count = table_count
+        self.root_rows = root_rows
+        self.fanout = fanout
+        self.partition_cardinality = partition_cardinality
+        self.shape = shape
+        self.seed = seed
+        # Join types are repeated across the links when fewer are given than there are links
+        self.join_types = [join_types[position % len(join_types)] for position in range(table_count - 1)]
+
+        self.specs: List[TableSpec] = [TableSpec('table_0', root_rows)]
+        for position in range(1, table_count):
+            parent = self.specs[position - 1] if shape == 'chain' else self.specs[0]
+            join_type = self.join_types[position - 1]
+            row_count = parent.row_count * fanout if join_type == 'one_to_many' else max(1, parent.row_count // fanout)
+            spec = TableSpec(f"table_{position}", row_count, parent, join_type)
+            if join_type == 'many_to_one':
+                parent.lookups.append(spec)
+            self.specs.append(spec)
+        self.rows_by_table_name: Dict[str, List[Dict[str, Any]]] = {}
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            'table_count': self.table_count,
+            'root_rows': self.root_rows,
+            'fanout': self.fanout,
+            'partition_cardinality': self.partition_cardinality,
+            'join_types': self.join_types,
+            'shape': self.shape,
+            'seed': self.seed,
+            'row_counts': {spec.table_name: spec.row_count for spec in self.specs},
+        }
+
+    def rows(self, table_name: str) -> List[Dict[str, Any]]:
+        if table_name not in self.rows_by_table_name:
+            spec = next(spec for spec in self.specs if spec.table_name == table_name)
+            self.rows_by_table_name[table_name] = self._generate(spec)
+        return self.rows_by_table_name[table_name]
+
+    def _generate(self, spec: TableSpec) -> List[Dict[str, Any]]:
+        rng = random.Random(f"{self.seed}:{spec.table_name}")
+        rows = []
+        for row_id in range(spec.row_count):
+            row = {
+                spec.primary_key: row_id,
+                'bucket': rng.randrange(self.partition_cardinality),
+                'value': rng.randrange(1000),
+                'score': round(rng.random() * 100, 3),
+                'label': rng.choice(LABELS),
+                'attributes': {'rank': rng.randrange(100), 'flag': rng.random() < 0.5},
+            }
+            if spec.join_type == 'one_to_many':
+                row[spec.join_key] = rng.randrange(spec.parent.row_count)
+            for lookup in spec.lookups:
+                row[lookup.join_key] = rng.randrange(lookup.row_count)
+            rows.append(row)
+        return rows
+
+    def row_count(self) -> int:
+        return sum(spec.row_count for spec in self.specs)
+
+    def create_tables(self, db: Database):
+        # Tables are partitioned on bucket, and each link is declared from the side its join type names
+        with contextlib.redirect_stdout(io.StringIO()):
+            for spec in self.specs:
+                db.add_table(spec.table_name, ['bucket'], spec.primary_key, None, [])
+            for spec in self.specs[1:]:
+                db.add_connection(spec.parent.table_name, spec.table_name, spec.join_key, spec.join_type)
+
+    def load(self, db: Database) -> int:
+        for spec in self.specs:
+            db.tables[spec.table_name].insert(self.rows(spec.table_name))
+        return self.row_count()
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for spec in self.specs:
+            digest.update(json.dumps(self.rows(spec.table_name), sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+
+if __name__ == '__main__':
+    dataset = Dataset(*[int(argument) for argument in sys.argv[1:5]])
+    print(json.dumps({**dataset.config(), 'fingerprint': dataset.fingerprint()}, indent=2))
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from join import join
+
+FOLDER_PATH = '/tmp/manydex_stress_concurrency'
+OPENING_BALANCE = 100
+
+
+class Stress:
+    # Accounts partitioned by branch; every transfer moves money between two accounts and, when they are in different
+    # branches, the branch totals with it, all in one write. Readers check that no read ever sees half a transfer.
+    def __init__(self, account_count: int, branch_count: int, storage_format: str, result_cache_rows: int = None):
+        self.account_count = account_count
+        self.branch_count = branch_count
+        self.storage_format = storage_format
+        self.result_cache_rows = result_cache_rows
+        self.total = account_count * OPENING_BALANCE
+        self.counts = {}
+        self.violations = []
+        self.counts_lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def open_database(self) -> Database:
+        db = Database('stress', FOLDER_PATH, False, storage_format=self.storage_format, result_cache_rows=self.result_cache_rows)
+        db.add_table('branches', [], 'branch_id', None, [])
+        db.add_table('accounts', ['branch_id'], 'account_id', None, [])
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.add_connection('branches', 'accounts', 'branch_id', 'one_to_many')
+        return db
+
+    def build(self) -> Database:
+        shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+        db = self.open_database()
+        accounts = [{'account_id': account_id, 'branch_id': account_id % self.branch_count, 'balance': OPENING_BALANCE} for account_id in range(self.account_count)]
+        branch_totals = {}
+        for account in accounts:
+            branch_totals[account['branch_id']] = branch_totals.get(account['branch_id'], 0) + OPENING_BALANCE
+        db.tables['branches'].insert([{'branch_id': branch_id, 'total': total} for branch_id, total in branch_totals.items()])
+        db.tables['accounts'].insert(accounts)
+        return db
+
+    def count(self, name: str, amount: int = 1):
+        with self.counts_lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def violation(self, message: str):
+        with self.counts_lock:
+            self.violations.append(message)
+
+    def transfer(self, db: Database, rng: random.Random, same_branch: bool = False):
+        accounts = db.tables['accounts']
+        branches = db.tables['branches']
+        source_id = rng.randrange(self.account_count)
+        target_id = rng.randrange(self.account_count)
+        if same_branch:
+            target_id = target_id - target_id % self.branch_count + source_id % self.branch_count
+            if target_id >= self.account_count:
+                target_id = source_id
+        # Two tables change together, so the caller takes the database's write lock around both updates
+        with db.lock.writing:
+            rows = accounts.get_rows([source_id, target_id])
+            source, target = rows[source_id], rows[target_id]
+            amount = rng.randint(1, 20)
+            if source_id == target_id:
+                return
+            accounts.update([{**source, 'balance': source['balance'] - amount}, {**target, 'balance': target['balance'] + amount}])
+            if source['branch_id'] != target['branch_id']:
+                totals = branches.get_rows([source['branch_id'], target['branch_id']])
+                branches.update([
+                    {**totals[source['branch_id']], 'total': totals[source['branch_id']]['total'] - amount},
+                    {**totals[target['branch_id']], 'total': totals[target['branch_id']]['total'] + amount},
+                ])
+        self.count('transfers')
+
+    def check_find(self, db: Database):
+        total = sum(row['balance'] for row in db.tables['accounts'].find())
+        if total != self.total:
+            self.violation(f"find saw a total of {total}")
+        self.count('find')
+
+    def check_find_iter(self, db: Database):
+        total = sum(row['balance'] for row in db.tables['accounts'].find_iter())
+        if total != self.total:
+            self.violation(f"find_iter saw a total of {total}")
+        self.count('find_iter')
+
+    def check_join(self, db: Database):
+        for branch in join(db, 'branches', ['accounts'])['results']:
+            balances = sum(account['balance'] for account in branch.get('accountss') or [])
+            if balances != branch['total']:
+                self.violation(f"join saw branch {branch['branch_id']} at {branch['total']} with accounts summing to {balances}")
+        self.count('join')
+
+    def check_aggregate(self, db: Database):
+        # Reads of two tables agree only when made under one read lock
+        with db.lock.reading:
+            sums = db.tables['accounts'].aggregate(None, ['branch_id'], {'balance': {'$sum': 'balance'}})
+            totals = {row['branch_id']: row['total'] for row in db.tables['branches'].find()}
+        for row in sums:
+            if row['balance'] != totals[row['branch_id']]:
+                self.violation(f"aggregate saw branch {row['branch_id']} at {totals[row['branch_id']]} with accounts summing to {row['balance']}")
+        self.count('aggregate')
+
+    def reader(self, db: Database):
+        checks = [self.check_find, self.check_find_iter, self.check_join, self.check_aggregate]
+        position = 0
+        while not self.stop.is_set():
+            try:
+                checks[position % len(checks)](db)
+            except Exception as error:
+                self.violation(f"reader failed: {error!r}")
+            position += 1
+
+    def writer(self, db: Database, seed: int, same_branch: bool = False):
+        rng = random.Random(seed)
+        while not self.stop.is_set():
+            try:
+                self.transfer(db, rng, same_branch)
+            except Exception as error:
+                self.violation(f"writer failed: {error!r}")
+
+    def run_threads(self, db: Database, readers: int, writers: int, seconds: float):
+        # Readers and writers on their own threads, with cross-branch transfers
+        threads = [threading.Thread(target=self.reader, args=(db,)) for _ in range(readers)]
+        threads += [threading.Thread(target=self.writer, args=(db, seed)) for seed in range(writers)]
+        self.stop.clear()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        self.stop.set()
+        for thread in threads:
+            thread.join()
+
+    async def stream(self, db: Database, batch: int):
+        # A streamed scan that yields to the loop as it goes, so writes and saves run while it is half read
+        while not self.stop.is_set():
+            total = 0
+            for position, row in enumerate(db.tables['accounts'].find_iter()):
+                total += row['balance']
+                if position % batch == 0:
+                    await asyncio.sleep(0)
+            if total != self.total:
+                self.violation(f"streamed find_iter saw a total of {total}")
+            self.count('stream')
+
+    async def write_coroutine(self, db: Database, seed: int):
+        rng = random.Random(seed)
+        while not self.stop.is_set():
+            self.transfer(db, rng, same_branch=True)
+            await asyncio.sleep(0)
+
+    async def save(self, db: Database):
+        # Transfers stay within a branch here, so every saved partition must sum to its branch's total
+        while not self.stop.is_set():
+            stats = await db.save_database()
+            if stats['failures']:
+                self.violation(f"save failed to write {stats['failures']} partitions")
+            await self.check_saved()
+            self.count('save')
+            await asyncio.sleep(0)
+
+    async def check_saved(self):
+        saved = self.open_database()
+        await saved.read_from_file()
+        totals = {row['branch_id']: row['total'] for row in saved.tables['branches'].find()}
+        sums = {}
+        for row in saved.tables['accounts'].find():
+            sums[row['branch_id']] = sums.get(row['branch_id'], 0) + row['balance']
+        if sums != totals:
+            self.violation(f"saved branches {totals} do not match saved accounts {sums}")
+
+    async def run_coroutines(self, db: Database, streams: int, writers: int, seconds: float, thread_writers: int):
+        # Coroutines on the loop, one more writer thread beside them, and saves throughout
+        self.stop.clear()
+        threads = [threading.Thread(target=self.writer, args=(db, 100 + seed, True)) for seed in range(thread_writers)]
+        for thread in threads:
+            thread.start()
+        tasks = [asyncio.ensure_future(self.stream(db, 50)) for _ in range(streams)]
+        tasks += [asyncio.ensure_future(self.write_coroutine(db, 200 + seed)) for seed in range(writers)]
+        tasks.append(asyncio.ensure_future(self.save(db)))
+        await asyncio.sleep(seconds)
+        self.stop.set()
+        await asyncio.gather(*tasks)
+        for thread in threads:
+            thread.join()
+
+
+def report(label: str, counts, seconds: float):
+    rates = '   '.join(f"{name} {count / seconds:10,.0f}/s" for name, count in sorted(counts.items()))
+    print(f"  {label:<12} {rates}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent readers, writers and saves against one database, checking every read is consistent')
+    parser.add_argument('--accounts', type=int, default=20000)
+    parser.add_argument('--branches', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+    parser.add_argument('--writers', type=int, default=4, help='Writer threads, and writer coroutines')
+    parser.add_argument('--streams', type=int, default=8, help='Coroutines streaming find_iter')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Length of each phase')
+    parser.add_argument('--storage-format', default='json', choices=['json', 'binary'])
+    parser.add_argument('--result-cache-rows', type=int, help='Run with a result cache of this many rows')
+    args = parser.parse_args()
+
+    stress = Stress(args.accounts, args.branches, args.storage_format, args.result_cache_rows)
+    db = stress.build()
+    print(f"{args.accounts} accounts in {args.branches} branches, {args.seconds:.0f} s per phase")
+
+    stress.run_threads(db, args.readers, args.writers, args.seconds)
+    report('threads', stress.counts, args.seconds)
+
+    stress.counts = {}
+    asyncio.run(stress.run_coroutines(db, args.streams, args.writers, args.seconds, 1))
+    report('coroutines', stress.counts, args.seconds)
+
+    # Once everything has stopped, the database on disk must hold the same total it started with
+    asyncio.run(db.save_database())
+    asyncio.run(stress.check_saved())
+    total = sum(row['balance'] for row in db.tables['accounts'].find())
+    if total != stress.total:
+        stress.violation(f"final total is {total}")
+
+    for message in stress.violations[:20]:
+        print(f"  violation: {message}")
+    print(f"{len(stress.violations)} violations")
+    if stress.violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
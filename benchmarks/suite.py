@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from datagen import Dataset
+from join import join
+
+FOLDER_PATH = '/tmp/manydex_bench_suite'
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Scenario:
+    # prepare builds the untimed state for one run, run is the timed part and returns what it did:
+    # {'operations': ..., 'rows': ...}, from which the throughputs are derived
+    def __init__(self, name: str, prepare: Callable[[], Any], run: Callable[[Any], Dict[str, int]]):
+        self.name = name
+        self.prepare = prepare
+        self.run = run
+
+
+class Suite:
+    def __init__(self, dataset: Dataset, storage_format: str = 'json', do_compression: bool = False, lookups: int = 1000):
+        self.dataset = dataset
+        self.storage_format = storage_format
+        self.do_compression = do_compression
+        self.lookups = lookups
+        self.loaded_db = None
+        self.scenarios = {scenario.name: scenario for scenario in [
+            Scenario('bulk_insert', self.empty_database, self.run_bulk_insert),
+            Scenario('point_lookup', self.loaded_database, self.run_point_lookup),
+            Scenario('range_scan', self.loaded_database, self.run_range_scan),
+            Scenario('join', self.loaded_database, self.run_join),
+            Scenario('save_database', self.unsaved_database, self.run_save_database),
+            Scenario('read_from_file', self.saved_database, self.run_read_from_file),
+        ]}
+
+    def new_database(self, name: str) -> Database:
+        shutil.rmtree(f"{FOLDER_PATH}/{name}", ignore_errors=True)
+        return Database(name, FOLDER_PATH, self.do_compression, storage_format=self.storage_format)
+
+    def empty_database(self) -> Database:
+        db = self.new_database('bulk_insert')
+        self.dataset.create_tables(db)
+        return db
+
+    def loaded_database(self) -> Database:
+        # Read-only scenarios share one database, loaded the first time one of them runs
+        if self.loaded_db is None:
+            self.loaded_db = self.new_database('queries')
+            self.dataset.create_tables(self.loaded_db)
+            self.dataset.load(self.loaded_db)
+        return self.loaded_db
+
+    def unsaved_database(self, name: str = 'save_database') -> Database:
+        db = self.new_database(name)
+        self.dataset.create_tables(db)
+        self.dataset.load(db)
+        return db
+
+    def saved_database(self) -> Database:
+        # Written once; every run opens it with a new Database, so no rows or partitions are held from an earlier run
+        if not os.path.exists(f"{FOLDER_PATH}/read_from_file/_read_from_file.json"):
+            asyncio.run(self.unsaved_database('read_from_file').save_database())
+        return Database('read_from_file', FOLDER_PATH, self.do_compression, storage_format=self.storage_format)
+
+    def run_bulk_insert(self, db: Database) -> Dict[str, int]:
+        rows = self.dataset.load(db)
+        return {'operations': rows, 'rows': rows}
+
+    def run_point_lookup(self, db: Database) -> Dict[str, int]:
+        rng = random.Random(f"{self.dataset.seed}:point_lookup")
+        rows = 0
+        for spec in self.dataset.specs:
+            table = db.tables[spec.table_name]
+            for _ in range(self.lookups):
+                rows += len(table.find({spec.primary_key: rng.randrange(spec.row_count)}))
+        return {'operations': self.lookups * len(self.dataset.specs), 'rows': rows}
+
+    def run_range_scan(self, db: Database) -> Dict[str, int]:
+        # Unpruned ranges over a value column, then ranges inside the partitions of a few buckets
+        rng = random.Random(f"{self.dataset.seed}:range_scan")
+        queries = []
+        for spec in self.dataset.specs:
+            for _ in range(10):
+                low = rng.randrange(950)
+                queries.append((spec.table_name, {'value': {'$between': [low, low + 50]}}))
+                queries.append((spec.table_name, {'bucket': {'$in': [rng.randrange(self.dataset.partition_cardinality)]}, 'score': {'$gte': 90}}))
+        rows = sum(len(db.tables[table_name].find(query)) for table_name, query in queries)
+        return {'operations': len(queries), 'rows': rows}
+
+    def run_join(self, db: Database) -> Dict[str, int]:
+        if len(self.dataset.specs) < 2:
+            return {'operations': 0, 'rows': 0}
+        root = self.dataset.specs[0].table_name
+        others = [spec.table_name for spec in self.dataset.specs[1:]]
+        leaf = others[-1]
+        joins = [
+            {},
+            {root: {'bucket': {'$in': [0, 1]}}},
+            {leaf: {'value': {'$lt': 20}}},
+        ]
+        rows = sum(len(join(db, root, others, query_addons)['results']) for query_addons in joins)
+        return {'operations': len(joins), 'rows': rows}
+
+    def run_save_database(self, db: Database) -> Dict[str, int]:
+        stats = asyncio.run(db.save_database())
+        return {'operations': stats['partitions_written'], 'rows': self.dataset.row_count(), 'bytes': stats['bytes_written']}
+
+    def run_read_from_file(self, db: Database) -> Dict[str, int]:
+        asyncio.run(db.read_from_file())
+        rows = sum(len(table.partition_name_by_primary_key) for table in db.tables.values())
+        if rows != self.dataset.row_count():
+            raise ValueError(f"Read {rows} rows back, expected {self.dataset.row_count()}")
+        return {'operations': rows, 'rows': rows}
+
+
+def measure(scenario: Scenario, repeat: int, track_memory: bool) -> Dict[str, Any]:
+    runs = []
+    counts = {}
+    for _ in range(repeat):
+        state = scenario.prepare()
+        gc.collect()
+        start = time.perf_counter()
+        counts = scenario.run(state)
+        runs.append(time.perf_counter() - start)
+        del state
+
+    seconds = min(runs)
+    result = {
+        'seconds': seconds,
+        'median_seconds': sorted(runs)[len(runs) // 2],
+        'runs': runs,
+        **counts,
+        'operations_per_second': counts['operations'] / seconds if seconds else 0.0,
+        'rows_per_second': counts['rows'] / seconds if seconds else 0.0,
+    }
+    if track_memory:
+        # A separate run, since tracing allocations slows the timed ones down; only the run's own allocations count
+        state = scenario.prepare()
+        gc.collect()
+        tracemalloc.start()
+        scenario.run(state)
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_PATH, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    # A scenario regresses when its best time or its peak memory grew by more than the threshold
+    regressions = []
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+        line = f"  {name:<16} {previous['seconds'] * 1000:10.1f} ms -> {result['seconds'] * 1000:10.1f} ms  {ratio:6.2f}x"
+        memory_ratio = None
+        if result.get('peak_memory_bytes') and previous.get('peak_memory_bytes'):
+            memory_ratio = result['peak_memory_bytes'] / previous['peak_memory_bytes']
+            line += f"   memory {memory_ratio:6.2f}x"
+        if ratio > 1 + threshold or (memory_ratio is not None and memory_ratio > 1 + threshold):
+            line += '   REGRESSION'
+            regressions.append(name)
+        print(line)
+    if results['dataset'].get('fingerprint') != baseline.get('dataset', {}).get('fingerprint'):
+        print('  note: the baseline was run on a different dataset')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Database/Table/Partition stack on a generated dataset')
+    parser.add_argument('--scenarios', nargs='*', help='Scenarios to run, all by default')
+    parser.add_argument('--tables', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=2000, help='Rows in the root table')
+    parser.add_argument('--fanout', type=int, default=4, help='Rows per parent row, or parent rows per lookup row')
+    parser.add_argument('--partitions', type=int, default=16, help='Distinct partition values per table')
+    parser.add_argument('--join-types', nargs='*', default=['one_to_many'], help='Join type of each link, repeated across the links')
+    parser.add_argument('--shape', default='chain', choices=['chain', 'star'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--storage-format', default='json', choices=['json', 'binary'])
+    parser.add_argument('--compression', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the extra run that measures peak memory')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    dataset = Dataset(args.tables, args.rows, args.fanout, args.partitions, args.join_types, args.shape, args.seed)
+    suite = Suite(dataset, args.storage_format, args.compression)
+    names = args.scenarios or list(suite.scenarios)
+    for name in names:
+        if name not in suite.scenarios:
+            parser.error(f"Unknown scenario {name}, expected one of {', '.join(suite.scenarios)}")
+
+    shutil.rmtree(FOLDER_PATH, ignore_errors=True)
+    results = {
+        'environment': environment(),
+        'dataset': {**dataset.config(), 'fingerprint': dataset.fingerprint()},
+        'options': {'storage_format': args.storage_format, 'compression': args.compression, 'repeat': args.repeat},
+        'scenarios': {},
+    }
+    print(f"{dataset.row_count()} rows in {args.tables} tables ({args.shape}, {', '.join(dataset.join_types) or 'no links'}), "
+          f"dataset {results['dataset']['fingerprint']}")
+    for name in names:
+        result = measure(suite.scenarios[name], args.repeat, not args.no_memory)
+        results['scenarios'][name] = result
+        memory = f"   peak {result['peak_memory_bytes'] / 1024 / 1024:8.1f} MB" if 'peak_memory_bytes' in result else ''
+        print(f"  {name:<16} {result['seconds'] * 1000:10.1f} ms   {result['operations_per_second']:12,.0f} ops/s   "
+              f"{result['rows_per_second']:12,.0f} rows/s{memory}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {baseline.get('environment', {}).get('commit') or args.compare}")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
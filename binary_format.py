@@ -0,0 +1,166 @@
+import json
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from utils import sync_file
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Layout: header | meta | [u32 length + payload] per row | offset index of [primary key, offset, length]
+MAGIC = b'MDXP'
+VERSION = 1
+HEADER = struct.Struct('<4sBBxxQI')
+RECORD_LENGTH = struct.Struct('<I')
+
+CODEC_JSON = 1
+CODEC_MSGPACK = 2
+
+
+def default_codec() -> int:
+    return CODEC_MSGPACK if msgpack is not None else CODEC_JSON
+
+
+def encode(codec: int, value: Any) -> bytes:
+    if codec == CODEC_MSGPACK:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def decode(codec: int, data) -> Any:
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Partition file was written with msgpack, which is not installed")
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return json.loads(bytes(data))
+
+
+class EncodedRow:
+    __slots__ = ('offset', 'length')
+
+    def __init__(self, offset: int, length: int):
+        self.offset = offset
+        self.length = length
+
+
+class LazyRowMap(MutableMapping):
+    # Primary key -> row mapping over a memory-mapped partition file; rows are decoded on first access
+    def __init__(self, buffer, codec: int, entries: Dict[Any, Any]):
+        self._buffer = buffer
+        self._codec = codec
+        self._entries = entries
+
+    def _decode(self, row_pk, entry):
+        row = decode(self._codec, self._buffer[entry.offset:entry.offset + entry.length])
+        self._entries[row_pk] = row
+        return row
+
+    def __getitem__(self, row_pk):
+        entry = self._entries[row_pk]
+        if type(entry) is EncodedRow:
+            return self._decode(row_pk, entry)
+        return entry
+
+    def __setitem__(self, row_pk, row):
+        self._entries[row_pk] = row
+
+    def __delitem__(self, row_pk):
+        del self._entries[row_pk]
+
+    def __contains__(self, row_pk):
+        return row_pk in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def values(self):
+        return [self._decode(row_pk, entry) if type(entry) is EncodedRow else entry for row_pk, entry in self._entries.items()]
+
+    def items(self):
+        return [(row_pk, self._decode(row_pk, entry) if type(entry) is EncodedRow else entry) for row_pk, entry in self._entries.items()]
+
+    def iter_values(self) -> Iterator[Any]:
+        # Streaming reads decode one row at a time without keeping it, so a full scan holds no more than the mapped file
+        for entry in self._entries.values():
+            yield decode(self._codec, self._buffer[entry.offset:entry.offset + entry.length]) if type(entry) is EncodedRow else entry
+
+    def pop(self, row_pk, *default):
+        if row_pk not in self._entries and default:
+            return default[0]
+        row = self[row_pk]
+        del self._entries[row_pk]
+        return row
+
+    def clear(self):
+        self._entries.clear()
+
+    def copy(self) -> 'LazyRowMap':
+        return LazyRowMap(self._buffer, self._codec, dict(self._entries))
+
+    def decoded_count(self) -> int:
+        return sum(1 for entry in self._entries.values() if type(entry) is not EncodedRow)
+
+    def encoded_items(self, codec: int) -> Iterable[Tuple[Any, bytes]]:
+        # Rows never decoded are copied byte for byte when the codec matches
+        for row_pk, entry in self._entries.items():
+            if type(entry) is EncodedRow and codec == self._codec:
+                yield row_pk, self._buffer[entry.offset:entry.offset + entry.length]
+            else:
+                yield row_pk, encode(codec, self[row_pk])
+
+
+def write_partition_file(file_path: str, meta: Dict[str, Any], data, fsync: bool = False, profile=None) -> int:
+    codec = default_codec()
+    if isinstance(data, LazyRowMap):
+        encoded_items = data.encoded_items(codec)
+    else:
+        encoded_items = ((row_pk, encode(codec, row)) for row_pk, row in data.items())
+
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    temp_file_path = f"{file_path}.tmp"
+    index = []
+    with open(temp_file_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, codec, 0, len(meta_bytes)))
+        f.write(meta_bytes)
+        offset = HEADER.size + len(meta_bytes)
+        for row_pk, payload in encoded_items:
+            f.write(RECORD_LENGTH.pack(len(payload)))
+            f.write(payload)
+            index.append([row_pk, offset + RECORD_LENGTH.size, len(payload)])
+            offset += RECORD_LENGTH.size + len(payload)
+
+        f.write(encode(codec, index))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, codec, offset, len(meta_bytes)))
+        size = f.seek(0, os.SEEK_END)
+        if fsync:
+            sync_file(f, profile)
+    os.replace(temp_file_path, file_path)
+    return size
+
+
+def read_partition_file(file_path: str) -> Tuple[Dict[str, Any], LazyRowMap]:
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty partition file: {file_path}")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, codec, index_offset, meta_length = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a binary partition file: {file_path}")
+
+    meta = json.loads(buffer[HEADER.size:HEADER.size + meta_length])
+    index = decode(codec, buffer[index_offset:])
+    entries = {row_pk: EncodedRow(offset, length) for row_pk, offset, length in index}
+    return meta, LazyRowMap(buffer, codec, entries)
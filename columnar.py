@@ -0,0 +1,302 @@
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from query import compile_query, make_getter, make_test
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+# Integers beyond this lose precision once mixed with floats in a float64 column
+FLOAT_EXACT_INT = 2 ** 53
+RANGE_FUNCTIONS = {'$gt', '$gte', '$lt', '$lte', '$between'}
+
+
+def columnar_available() -> bool:
+    return np is not None
+
+
+def is_number(value) -> bool:
+    return type(value) in (int, float, bool) and not (type(value) is int and not INT64_MIN <= value <= INT64_MAX)
+
+
+class Column:
+    # kind is 'number' or 'datetime' for typed arrays with a presence mask, or 'dictionary' for codes into a value list
+    def __init__(self, kind: str, values, present=None, dictionary: List[Any] = None, value_type=None, inexact_floats: bool = False):
+        self.kind = kind
+        self.values = values
+        self.present = present
+        self.dictionary = dictionary
+        self.value_type = value_type
+        # NumPy compares int64 with a float by rounding the integer, which is only exact up to 2 ** 53
+        self.inexact_floats = inexact_floats
+
+    def mask(self, query_function: str, query_value: Any):
+        # None means the clause cannot be answered exactly from the column and has to be checked per row
+        if self.kind == 'dictionary':
+            return self._dictionary_mask(query_function, query_value)
+        return self._typed_mask(query_function, query_value)
+
+    def _dictionary_mask(self, query_function, query_value):
+        # The clause runs once per distinct value, then the codes pick up the answer
+        test = make_test(query_function, query_value)
+        try:
+            lookup = np.fromiter((bool(test(value)) for value in self.dictionary), dtype=bool, count=len(self.dictionary))
+        except TypeError:
+            return None
+        return lookup[self.values]
+
+    def _typed_mask(self, query_function, query_value):
+        if self.inexact_floats and any(type(value) is float for value in (query_value if isinstance(query_value, (list, tuple)) else [query_value])):
+            return None
+        if query_function in ('$in', '$nin'):
+            comparable = [self._scalar(value) for value in query_value]
+            if any(value is None for value in comparable):
+                # Values of another type can never be equal, but an out of range integer could still equal a float
+                if any(type(value) is int for value in query_value if not is_number(value)):
+                    return None
+                comparable = [value for value in comparable if value is not None]
+            matches = np.isin(self.values, np.array(comparable)) if comparable else np.zeros(len(self.values), dtype=bool)
+            matches = self._present(matches)
+            if self.present is not None and any(value is None for value in query_value):
+                matches |= ~self.present
+            return matches if query_function == '$in' else ~matches
+
+        if query_value is None and query_function in ('$eq', '$ne'):
+            missing = ~self.present if self.present is not None else np.zeros(len(self.values), dtype=bool)
+            return missing if query_function == '$eq' else ~missing
+
+        if query_function == '$between':
+            lower, upper = self._scalar(query_value[0]), self._scalar(query_value[1])
+            if lower is None or upper is None or self.present is not None:
+                return None
+            return (self.values >= lower) & (self.values <= upper)
+
+        value = self._scalar(query_value)
+        if value is None:
+            if query_function in RANGE_FUNCTIONS or type(query_value) is int:
+                return None
+            # Python equality across types is simply False
+            matches = np.zeros(len(self.values), dtype=bool)
+            return matches if query_function == '$eq' else ~matches
+        if query_function in RANGE_FUNCTIONS and self.present is not None:
+            # Comparing a missing value raises in the row path, so rows without one are left to it
+            return None
+
+        if query_function == '$eq':
+            return self._present(self.values == value)
+        elif query_function == '$ne':
+            return ~self._present(self.values == value)
+        elif query_function == '$gt':
+            return self.values > value
+        elif query_function == '$gte':
+            return self.values >= value
+        elif query_function == '$lt':
+            return self.values < value
+        elif query_function == '$lte':
+            return self.values <= value
+        return None
+
+    def _scalar(self, value):
+        if self.kind == 'number':
+            return value if is_number(value) else None
+        if type(value) is self.value_type:
+            return np.datetime64(value, 'us' if self.value_type is datetime.datetime else 'D')
+        return None
+
+    def _present(self, matches):
+        return matches if self.present is None else matches & self.present
+
+
+def build_column(values: List[Any]) -> Optional[Column]:
+    present_values = [value for value in values if value is not None]
+    value_types = {type(value) for value in present_values}
+    present = None
+    if len(present_values) < len(values):
+        present = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+
+    if value_types and value_types <= {bool}:
+        return Column('number', np.array([bool(value) for value in values], dtype=bool), present, value_type=bool)
+    if value_types and value_types <= {int} and all(INT64_MIN <= value <= INT64_MAX for value in present_values):
+        return Column('number', np.array([value or 0 for value in values], dtype=np.int64), present, value_type=int,
+                      inexact_floats=any(abs(value) > FLOAT_EXACT_INT for value in present_values))
+    if value_types and value_types <= {int, float} and all(type(value) is float or abs(value) <= FLOAT_EXACT_INT for value in present_values):
+        # Columns mixing ints and floats keep value_type None: their rows do not aggregate to float64 results
+        return Column('number', np.array([value or 0.0 for value in values], dtype=np.float64), present,
+                      value_type=float if value_types == {float} else None)
+    if value_types == {datetime.datetime} and all(value.tzinfo is None for value in present_values):
+        return Column('datetime', np.array([value or datetime.datetime.min for value in values], dtype='datetime64[us]'), present, value_type=datetime.datetime)
+    if value_types == {datetime.date}:
+        return Column('datetime', np.array([value or datetime.date.min for value in values], dtype='datetime64[D]'), present, value_type=datetime.date)
+
+    # Strings and anything else hashable are dictionary-encoded, missing values included as None
+    codes_by_value: Dict[Any, int] = {}
+    try:
+        codes = np.fromiter((codes_by_value.setdefault(value, len(codes_by_value)) for value in values), dtype=np.int32, count=len(values))
+    except TypeError:
+        return None
+    return Column('dictionary', codes, dictionary=list(codes_by_value))
+
+
+class ColumnStore:
+    # Columns of one partition, built per field the first time a query filters on it
+    def __init__(self, rows_by_pk, version: int):
+        self.version = version
+        self.primary_keys = list(rows_by_pk.keys())
+        self.rows = list(rows_by_pk.values())
+        self.columns: Dict[str, Optional[Column]] = {}
+        self.codes: Dict[str, Optional[Tuple[Any, List[Any]]]] = {}
+
+    def column(self, field: str) -> Optional[Column]:
+        if field not in self.columns:
+            getter: Callable[[Dict[str, Any]], Any] = make_getter(tuple(field.split('.')))
+            self.columns[field] = build_column([getter(row) for row in self.rows])
+        return self.columns[field]
+
+    def mask(self, query: Dict[str, Dict[str, Any]]) -> Tuple[Any, Dict[str, Dict[str, Any]]]:
+        # Returns the vectorized mask and the clauses that still have to be checked row by row
+        mask = np.ones(len(self.rows), dtype=bool)
+        residual_query: Dict[str, Dict[str, Any]] = {}
+        for query_field, query_clause in query.items():
+            column = self.column(query_field)
+            for query_function, query_value in query_clause.items():
+                clause_mask = column.mask(query_function, query_value) if column is not None else None
+                if clause_mask is None:
+                    residual_query.setdefault(query_field, {})[query_function] = query_value
+                else:
+                    mask &= clause_mask
+        return mask, residual_query
+
+    def rows_where(self, mask) -> List[Dict[str, Any]]:
+        rows = self.rows
+        return [rows[position] for position in np.flatnonzero(mask).tolist()]
+
+    def filter_mask(self, mask, query: Dict[str, Dict[str, Any]]):
+        # Clauses without a vectorized answer are checked on the rows the mask kept, and the result folded back in
+        predicate = compile_query(query)
+        rows = self.rows
+        filtered = np.zeros(len(rows), dtype=bool)
+        filtered[[position for position in np.flatnonzero(mask).tolist() if predicate(rows[position])]] = True
+        return filtered
+
+    def group_codes(self, field: str) -> Optional[Tuple[Any, List[Any]]]:
+        # Per-row codes into the list of distinct values, None included when some rows miss the field
+        if field not in self.codes:
+            self.codes[field] = self._build_codes(self.column(field))
+        return self.codes[field]
+
+    def _build_codes(self, column: Optional[Column]):
+        if column is None:
+            return None
+        if column.kind == 'dictionary':
+            return column.values, column.dictionary
+        if column.kind == 'number' and column.value_type is None:
+            return None
+        if column.value_type is float and np.isnan(column.values).any():
+            return None
+        unique_values, codes = np.unique(column.values, return_inverse=True)
+        values = unique_values.tolist()
+        if column.present is not None:
+            codes = np.where(column.present, codes, len(values))
+            values.append(None)
+        return codes, values
+
+    def aggregate(self, mask, group_by: List[str], metric_specs) -> Optional[Dict[Tuple, List[Any]]]:
+        # Partial aggregate of the masked rows, or None when a column has no exact kernel and the rows have to be used
+        selected = np.flatnonzero(mask)
+        if not len(selected):
+            return {}
+        group_keys, group_ids = self._group_ids(group_by, selected)
+        if group_keys is None:
+            return None
+
+        metric_states = []
+        for _, metric_function, field in metric_specs:
+            states = self._metric_states(metric_function, field, selected, group_ids, len(group_keys))
+            if states is None:
+                return None
+            metric_states.append(states)
+        return {group_key: [states[position] for states in metric_states] for position, group_key in enumerate(group_keys)}
+
+    def _group_ids(self, group_by, selected):
+        # Codes of several fields combine into one integer per row, so a single np.unique finds the groups
+        combined = np.zeros(len(selected), dtype=np.int64)
+        field_values = []
+        cardinality = 1
+        for field in group_by:
+            codes = self.group_codes(field)
+            if codes is None:
+                return None, None
+            field_codes, values = codes
+            cardinality *= len(values)
+            if cardinality > INT64_MAX:
+                return None, None
+            combined = combined * len(values) + field_codes[selected]
+            field_values.append(values)
+
+        unique_combined, group_ids = np.unique(combined, return_inverse=True)
+        group_keys = []
+        for code in unique_combined.tolist():
+            group_key = []
+            for values in reversed(field_values):
+                code, position = divmod(code, len(values))
+                group_key.append(values[position])
+            group_keys.append(tuple(reversed(group_key)))
+        return group_keys, group_ids
+
+    def _metric_states(self, metric_function, field, selected, group_ids, group_count):
+        if field is None:
+            return np.bincount(group_ids, minlength=group_count).tolist()
+        column = self.column(field)
+        if column is None:
+            return None
+
+        if metric_function == '$count':
+            if column.kind == 'dictionary':
+                present = np.array([value is not None for value in column.dictionary], dtype=bool)[column.values]
+            else:
+                present = column.present
+            if present is None:
+                return np.bincount(group_ids, minlength=group_count).tolist()
+            return np.bincount(group_ids, weights=present[selected], minlength=group_count).astype(np.int64).tolist()
+
+        if metric_function == '$distinct_count':
+            codes = self.group_codes(field)
+            if codes is None:
+                return None
+            field_codes, values = codes
+            distinct_values = [set() for _ in range(group_count)]
+            for group_id, code in set(zip(group_ids.tolist(), field_codes[selected].tolist())):
+                if values[code] is not None:
+                    distinct_values[group_id].add(values[code])
+            return distinct_values
+
+        # Sums and extremes need every row to hold a number of one Python type
+        if column.kind != 'number' or column.present is not None or column.value_type is None:
+            return None
+        values = column.values[selected]
+        if column.value_type is bool:
+            values = values.astype(np.int64)
+
+        if metric_function in ('$sum', '$mean'):
+            if column.value_type is not float and max(abs(int(values.max())), abs(int(values.min()))) * len(values) > INT64_MAX:
+                return None
+            # ufunc.at adds row by row in order, so float totals match the row path bit for bit
+            totals = np.zeros(group_count, dtype=values.dtype)
+            np.add.at(totals, group_ids, values)
+            if metric_function == '$sum':
+                return totals.tolist()
+            return [[total, count] for total, count in zip(totals.tolist(), np.bincount(group_ids, minlength=group_count).tolist())]
+
+        # NaN makes Python's comparisons depend on row order, which a vectorized min cannot reproduce
+        if column.value_type is float and np.isnan(values).any():
+            return None
+        if metric_function == '$min':
+            extremes = np.full(group_count, np.inf if column.value_type is float else INT64_MAX, dtype=values.dtype)
+            np.minimum.at(extremes, group_ids, values)
+        else:
+            extremes = np.full(group_count, -np.inf if column.value_type is float else INT64_MIN, dtype=values.dtype)
+            np.maximum.at(extremes, group_ids, values)
+        return extremes.tolist()
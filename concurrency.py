@@ -0,0 +1,115 @@
+import threading
+from threading import get_ident
+
+
+class ReadWriteLock:
+    # Many readers or one writer, shared by every table of a database so a join reads all its tables at one point in time.
+    # Both sides are reentrant per thread: a writer may read (delete finds the rows it removes), and a nested read never
+    # queues behind a waiting writer. Phase-fair: a waiting writer holds back new readers, and the readers that waited
+    # on a write go before the next one, so neither side starves. Held only by synchronous code, never across an await,
+    # so coroutines sharing the loop thread cannot interleave inside it.
+    def __init__(self):
+        # Held through the mutex; the condition over it is only for waiting
+        self._mutex = threading.Lock()
+        self._condition = threading.Condition(self._mutex)
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._readers_waiting = 0
+        # Readers let in ahead of waiting writers, counted when a write ends
+        self._reader_turns = 0
+        # Read depth per thread; negative for reads inside the thread's own write, which are not counted as readers
+        self._read_depths = {}
+        self.reading = _Reading(self)
+        self.writing = _Writing(self)
+
+    def acquire_read(self):
+        thread_id = get_ident()
+        depth = self._read_depths.get(thread_id)
+        if depth:
+            self._read_depths[thread_id] = depth + 1 if depth > 0 else depth - 1
+            return
+        if self._writer == thread_id:
+            self._read_depths[thread_id] = -1
+            return
+        with self._mutex:
+            if self._writer is not None or (self._writers_waiting and not self._reader_turns):
+                self._readers_waiting += 1
+                try:
+                    while self._writer is not None or (self._writers_waiting and not self._reader_turns):
+                        self._condition.wait()
+                finally:
+                    self._readers_waiting -= 1
+            if self._reader_turns:
+                self._reader_turns -= 1
+            self._readers += 1
+        self._read_depths[thread_id] = 1
+
+    def release_read(self):
+        thread_id = get_ident()
+        depth = self._read_depths[thread_id]
+        if depth > 1:
+            self._read_depths[thread_id] = depth - 1
+        elif depth < -1:
+            self._read_depths[thread_id] = depth + 1
+        else:
+            del self._read_depths[thread_id]
+            if depth == 1:
+                with self._mutex:
+                    self._readers -= 1
+                    if not self._readers and self._writers_waiting:
+                        self._condition.notify_all()
+
+    def acquire_write(self):
+        thread_id = get_ident()
+        if self._writer == thread_id:
+            self._write_depth += 1
+            return
+        if thread_id in self._read_depths:
+            raise RuntimeError("Cannot write while this thread holds a read lock")
+        with self._mutex:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers or self._reader_turns:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = thread_id
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._mutex:
+            self._writer = None
+            self._reader_turns = self._readers_waiting
+            if self._readers_waiting or self._writers_waiting:
+                self._condition.notify_all()
+
+
+class _Reading:
+    __slots__ = ('lock',)
+
+    def __init__(self, lock: ReadWriteLock):
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire_read()
+
+    def __exit__(self, *exc_info):
+        self.lock.release_read()
+
+
+class _Writing:
+    __slots__ = ('lock',)
+
+    def __init__(self, lock: ReadWriteLock):
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire_write()
+
+    def __exit__(self, *exc_info):
+        self.lock.release_write()
@@ -1,24 +1,46 @@
+import asyncio
 import json
 import os
+import time
 from typing import Dict, Any
 
+from concurrency import ReadWriteLock
+from flush import FlushPipeline
+from join_view import JoinView
+from partition_cache import PartitionCache
+from result_cache import ResultCache
 from table import Table  # Assuming table.py exists with a Table class
+from utils import write_file_atomic
 
 class Database:
-    def __init__(self, dbname: str, folder_path: str, do_compression: bool):
+    def __init__(self, dbname: str, folder_path: str, do_compression: bool, use_write_ahead_log: bool = False, storage_format: str = 'json', memory_budget_bytes: int = None, cache_policy: str = 'lru', parallel_workers: int = None, flush_workers: int = None, columnar: bool = False, result_cache_rows: int = None, fsync_writes: bool = False):
         self.dbname = dbname
         self.folder_path = folder_path
         self.tables: Dict[str, Table] = {}
         self.storage_location = f"{folder_path}/{dbname}"
         self.output_file_path = f"{self.storage_location}/_{dbname}.json"
         self.do_compression = do_compression
+        self.use_write_ahead_log = use_write_ahead_log
+        self.storage_format = storage_format
+        self.partition_cache = PartitionCache(memory_budget_bytes, cache_policy) if memory_budget_bytes else None
+        self.parallel_workers = parallel_workers
+        self.flush_pipeline = FlushPipeline(flush_workers)
+        self.columnar = columnar
+        self.last_flush_stats: Dict[str, Any] = {}
+        self.join_views: Dict[str, JoinView] = {}
+        # Opt-in: find and join results, up to this many rows in total, reused until a write touches what they read
+        self.result_cache = ResultCache(result_cache_rows) if result_cache_rows else None
+        # Opt-in: files are synced to disk before they replace the previous version
+        self.fsync_writes = fsync_writes
+        # One lock for every table, so a join reads all of its tables as of the same moment
+        self.lock = ReadWriteLock()
 
-    def add_table(self, table_name: str, indices: list, primary_key: str, proto: Any, delete_key_list: list) -> Table:
+    def add_table(self, table_name: str, indices: list, primary_key: str, proto: Any, delete_key_list: list = None, secondary_indices: dict = None, partitioning: dict = None) -> Table:
         if not table_name:
             raise ValueError("Table name is required")
 
         if table_name not in self.tables:
-            new_table = Table(table_name, indices, self.storage_location, self.dbname, primary_key, proto, delete_key_list, self.do_compression)
+            new_table = Table(table_name, indices, self.storage_location, self.dbname, primary_key, proto, delete_key_list, self.do_compression, secondary_indices, self.use_write_ahead_log, self.storage_format, self.partition_cache, self.parallel_workers, self.flush_pipeline, self.columnar, self.result_cache, self.fsync_writes, self.lock, partitioning)
             self.tables[table_name] = new_table
             return new_table
         else:
@@ -41,26 +63,70 @@ class Database:
         table_b.table_connections[table_a_name] = {'join_key': join_key, 'join_type': opposite_join_type[join_type]}
         print(f'Added connection: {table_a_name}, {table_b_name}, {join_key}, {join_type}')
 
+    def add_join_view(self, view_name: str, base_table_name: str, include_table_names: list, query_addons: Dict[str, Any] = None, inner: bool = False) -> JoinView:
+        # The join is materialized once here, then kept up to date by every insert, update and delete on its tables
+        if not view_name:
+            raise ValueError("View name is required")
+        if view_name in self.join_views:
+            return self.join_views[view_name]
+        for table_name in [base_table_name] + include_table_names:
+            if table_name not in self.tables:
+                raise ValueError(f"Table does not exist for join view {view_name} - {table_name}")
+
+        join_view = JoinView(self, view_name, base_table_name, include_table_names, query_addons, inner)
+        join_view.build()
+        self.join_views[view_name] = join_view
+        return join_view
+
+    def drop_join_view(self, view_name: str) -> None:
+        join_view = self.join_views.pop(view_name, None)
+        if join_view is not None:
+            join_view.drop()
+
     async def save_database(self):
-        table_info = [{'table_name': table.table_name, 'indices': table.indices, 'primary_key': table.primary_key} for table in self.tables.values()]
-        save_data = {
-            'dbname': self.dbname,
-            'tables': table_info,
-            'storage_location': self.storage_location,
-            'output_file_path': self.output_file_path,
-            'do_compression': self.do_compression,
-        }
+        with self.lock.reading:
+            table_info = [{'table_name': table.table_name, 'indices': table.indices, 'primary_key': table.primary_key, 'partitioning': table.partitioning()} for table in self.tables.values()]
+            save_data = {
+                'dbname': self.dbname,
+                'tables': table_info,
+                'join_views': [join_view.definition() for join_view in self.join_views.values()],
+                'storage_location': self.storage_location,
+                'output_file_path': self.output_file_path,
+                'do_compression': self.do_compression,
+                'use_write_ahead_log': self.use_write_ahead_log,
+                'storage_format': self.storage_format,
+            }
 
         data = json.dumps(save_data, indent=2)
 
         os.makedirs(os.path.dirname(self.output_file_path), exist_ok=True)
-        with open(self.output_file_path, 'w') as f:
-            f.write(data)
+        write_file_atomic(self.output_file_path, data.encode('utf-8'), self.fsync_writes)
+
+        # Every table flushes at once; the shared pipeline bounds how many partitions are in flight
+        start_totals = self.flush_pipeline.totals()
+        start = time.perf_counter()
+        await asyncio.gather(*[table.output_to_file() for table in self.tables.values()])
+        for join_view in self.join_views.values():
+            join_view.write_file()
+        self.last_flush_stats = self.flush_pipeline.report(start_totals, time.perf_counter() - start)
+        return self.last_flush_stats
 
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.partition_cache.stats() if self.partition_cache is not None else {}
+
+    def result_cache_stats(self) -> Dict[str, Any]:
+        return self.result_cache.stats() if self.result_cache is not None else {}
+
+    async def compact(self):
+        await asyncio.gather(*[table.compact() for table in self.tables.values()])
+
+    async def convert_storage_format(self, storage_format: str):
+        self.storage_format = storage_format
         for table in self.tables.values():
-            await table.output_to_file()  # Assuming Table class has an async output_to_file method
+            await table.convert_storage_format(storage_format)
+        await self.save_database()
 
-    async def read_from_file(self):
+    async def read_from_file(self, lazy: bool = False):
         try:
             with open(self.output_file_path, 'r') as f:
                 parsed_data = json.load(f)
@@ -68,9 +134,16 @@ class Database:
             self.dbname = parsed_data['dbname']
             self.storage_location = parsed_data['storage_location']
             self.do_compression = parsed_data['do_compression']
+            self.use_write_ahead_log = parsed_data.get('use_write_ahead_log', False)
+            self.storage_format = parsed_data.get('storage_format', 'json')
+
+            table_objs = [self.add_table(**table_info, proto=None) for table_info in parsed_data['tables']]
+            await asyncio.gather(*[table_obj.read_from_file(lazy) for table_obj in table_objs])
 
-            for table_info in parsed_data['tables']:
-                table_obj = self.add_table(**table_info, proto=None)
-                await table_obj.read_from_file()  # Assuming Table class has an async read_from_file method
+            # Views are read after their tables, so a saved view whose tables moved on since is rebuilt instead
+            for view_info in parsed_data.get('join_views', []):
+                join_view = JoinView(self, **view_info)
+                join_view.read_from_file()
+                self.join_views[join_view.view_name] = join_view
         except FileNotFoundError:
             pass  # Handle error or log as needed
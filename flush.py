@@ -0,0 +1,72 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from partition import Partition
+
+
+class FlushPipeline:
+    def __init__(self, workers: int = None, max_in_flight: int = None):
+        # Threads suffice: file writes and zlib release the GIL, and partition data never has to be pickled
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='flush')
+        self.partitions_written = 0
+        self.bytes_written = 0
+        self.failures = 0
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # Bounds how many snapshots are held at once across every table flushing on this loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def write(self, partition: Partition) -> bool:
+        if not partition.is_dirty:
+            return True
+        async with self.semaphore():
+            written = await partition.write_to_file(self.executor)
+        if written:
+            self.partitions_written += 1
+            self.bytes_written += partition.last_write_bytes
+        else:
+            self.failures += 1
+        return written
+
+    async def flush(self, partitions: List[Partition]) -> bool:
+        results = await asyncio.gather(*[self.write(partition) for partition in partitions])
+        return all(results)
+
+    def totals(self) -> Dict[str, int]:
+        return {'partitions_written': self.partitions_written, 'bytes_written': self.bytes_written, 'failures': self.failures}
+
+    def report(self, start_totals: Dict[str, int], seconds: float) -> Dict[str, Any]:
+        partitions_written = self.partitions_written - start_totals['partitions_written']
+        bytes_written = self.bytes_written - start_totals['bytes_written']
+        return {
+            'partitions_written': partitions_written,
+            'bytes_written': bytes_written,
+            'failures': self.failures - start_totals['failures'],
+            'seconds': seconds,
+            'mb_per_second': bytes_written / (1024 * 1024) / seconds if seconds else 0.0,
+            'partitions_per_second': partitions_written / seconds if seconds else 0.0,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+_default_pipeline = None
+
+
+def default_pipeline() -> FlushPipeline:
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = FlushPipeline()
+    return _default_pipeline
+
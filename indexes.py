@@ -0,0 +1,218 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+from result_cache import freeze
+from utils import get_from_dict
+
+# Sorted indexes rebuild their lists for a batch once it is at least 1/MERGE_BATCH_RATIO of the index size
+MERGE_BATCH_RATIO = 8
+
+
+def hash_key(value):
+    # Lists and dicts cannot be dict keys, so hash indexes keep them under a frozen form
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+    try:
+        return ('frozen', freeze(value))
+    except TypeError:
+        return ('repr', repr(value))
+
+
+class _RankEnd:
+    # Sorts after every value, closing the range of one kind of value
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+RANK_END = _RankEnd()
+
+
+def sort_key(value):
+    # A total order over mixed values, so one 'n/a' among numbers cannot break an index: numbers, then strings,
+    # then other values grouped by type and ordered by their repr
+    if isinstance(value, (int, float)):
+        return (0, '', value)
+    if isinstance(value, str):
+        return (1, '', value)
+    return (2, type(value).__name__, repr(value))
+
+
+class HashIndex:
+    index_type = 'hash'
+    supported_functions = {'$eq', '$in'}
+
+    def __init__(self, field: str):
+        self.field = field
+        self.primary_keys_by_value: Dict[Any, Dict[Any, None]] = {}
+
+    def add(self, row_pk, row):
+        value = hash_key(get_from_dict(row, self.field))
+        self.primary_keys_by_value.setdefault(value, {})[row_pk] = None
+
+    def add_many(self, rows_by_pk):
+        primary_keys_by_value = self.primary_keys_by_value
+        for row_pk, row in rows_by_pk.items():
+            primary_keys_by_value.setdefault(hash_key(get_from_dict(row, self.field)), {})[row_pk] = None
+
+    def remove(self, row_pk, row):
+        value = hash_key(get_from_dict(row, self.field))
+        primary_keys = self.primary_keys_by_value.get(value)
+        if primary_keys is None:
+            return
+        primary_keys.pop(row_pk, None)
+        if not primary_keys:
+            del self.primary_keys_by_value[value]
+
+    def remove_many(self, rows_by_pk):
+        for row_pk, row in rows_by_pk.items():
+            self.remove(row_pk, row)
+
+    def clear(self):
+        self.primary_keys_by_value.clear()
+
+    def lookup(self, query_clause) -> Optional[Dict[Any, None]]:
+        if '$eq' in query_clause:
+            values = [query_clause['$eq']]
+        elif '$in' in query_clause:
+            values = query_clause['$in']
+        else:
+            return None
+
+        primary_keys = {}
+        for value in values:
+            primary_keys.update(self.primary_keys_by_value.get(hash_key(value), {}))
+        return primary_keys
+
+
+class SortedIndex:
+    index_type = 'sorted'
+    supported_functions = {'$eq', '$in', '$gt', '$gte', '$lt', '$lte', '$between'}
+
+    def __init__(self, field: str):
+        self.field = field
+        # Parallel lists ordered by sort key; rows without a value are not indexed since no range can match them
+        self.keys: List[Any] = []
+        self.primary_keys: List[Any] = []
+
+    def add(self, row_pk, row):
+        value = get_from_dict(row, self.field)
+        if value is None:
+            return
+        position = bisect_right(self.keys, sort_key(value))
+        self.keys.insert(position, sort_key(value))
+        self.primary_keys.insert(position, row_pk)
+
+    def add_many(self, rows_by_pk):
+        # Small batches are inserted in place; larger ones are appended and merged by one stable sort
+        if len(rows_by_pk) * MERGE_BATCH_RATIO < len(self.keys):
+            for row_pk, row in rows_by_pk.items():
+                self.add(row_pk, row)
+            return
+
+        entries = list(zip(self.keys, self.primary_keys))
+        entries.extend((sort_key(value), row_pk) for value, row_pk in ((get_from_dict(row, self.field), row_pk) for row_pk, row in rows_by_pk.items()) if value is not None)
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [key for key, _ in entries]
+        self.primary_keys = [row_pk for _, row_pk in entries]
+
+    def remove(self, row_pk, row):
+        value = get_from_dict(row, self.field)
+        if value is None:
+            return
+        key = sort_key(value)
+        start, end = bisect_left(self.keys, key), bisect_right(self.keys, key)
+        for position in range(start, end):
+            if self.primary_keys[position] == row_pk:
+                del self.keys[position]
+                del self.primary_keys[position]
+                return
+
+    def remove_many(self, rows_by_pk):
+        if len(rows_by_pk) * MERGE_BATCH_RATIO < len(self.keys):
+            for row_pk, row in rows_by_pk.items():
+                self.remove(row_pk, row)
+            return
+
+        kept = [(key, row_pk) for key, row_pk in zip(self.keys, self.primary_keys) if row_pk not in rows_by_pk]
+        self.keys = [key for key, _ in kept]
+        self.primary_keys = [row_pk for _, row_pk in kept]
+
+    def build(self, rows_by_pk: Dict[Any, Dict[str, Any]]):
+        entries = [(get_from_dict(row, self.field), row_pk) for row_pk, row in rows_by_pk.items()]
+        entries = sorted(((sort_key(value), row_pk) for value, row_pk in entries if value is not None), key=lambda entry: entry[0])
+        self.keys = [key for key, _ in entries]
+        self.primary_keys = [row_pk for _, row_pk in entries]
+
+    def clear(self):
+        self.keys.clear()
+        self.primary_keys.clear()
+
+    def lookup(self, query_clause) -> Optional[Dict[Any, None]]:
+        if '$in' in query_clause:
+            if len(query_clause) > 1 or any(value is None for value in query_clause['$in']):
+                return None
+            primary_keys = {}
+            for value in query_clause['$in']:
+                primary_keys.update(dict.fromkeys(self._range(sort_key(value), True, sort_key(value), True)))
+            return primary_keys
+
+        lower, lower_inclusive, upper, upper_inclusive = None, True, None, True
+        for func, value in query_clause.items():
+            if func == '$eq':
+                bounds = [(value, True, 'lower'), (value, True, 'upper')]
+            elif func in ('$gt', '$gte'):
+                bounds = [(value, func == '$gte', 'lower')]
+            elif func in ('$lt', '$lte'):
+                bounds = [(value, func == '$lte', 'upper')]
+            elif func == '$between':
+                bounds = [(value[0], True, 'lower'), (value[1], True, 'upper')]
+            else:
+                return None
+            if any(bound is None for bound, _, _ in bounds):
+                return None
+
+            # Several clauses on one field intersect, so keep the tightest bound on each side
+            for bound, inclusive, side in bounds:
+                bound = sort_key(bound)
+                if side == 'lower' and (lower is None or bound > lower or (bound == lower and not inclusive)):
+                    lower, lower_inclusive = bound, inclusive
+                elif side == 'upper' and (upper is None or bound < upper or (bound == upper and not inclusive)):
+                    upper, upper_inclusive = bound, inclusive
+
+        # A range only reaches values of its bounds' kind, as comparing a number with a string matches nothing;
+        # other values are ordered by repr, which answers equality but not ranges
+        if lower is not None and upper is not None and lower[:2] != upper[:2]:
+            return {}
+        if (lower or upper)[0] == 2 and lower != upper:
+            return None
+        if lower is None and upper is not None:
+            lower, lower_inclusive = upper[:2], True
+        if upper is None and lower is not None:
+            upper, upper_inclusive = lower[:2] + (RANK_END,), False
+        return dict.fromkeys(self._range(lower, lower_inclusive, upper, upper_inclusive))
+
+    def _range(self, lower, lower_inclusive, upper, upper_inclusive):
+        if lower is None:
+            start = 0
+        else:
+            start = bisect_left(self.keys, lower) if lower_inclusive else bisect_right(self.keys, lower)
+        if upper is None:
+            end = len(self.keys)
+        else:
+            end = bisect_right(self.keys, upper) if upper_inclusive else bisect_left(self.keys, upper)
+        return self.primary_keys[start:end]
+
+
+def build_index(field: str, index_type: str):
+    if index_type == 'hash':
+        return HashIndex(field)
+    elif index_type == 'sorted':
+        return SortedIndex(field)
+    else:
+        raise ValueError(f"Unsupported index type: {index_type}")
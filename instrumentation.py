@@ -0,0 +1,158 @@
+import json
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from query import compile_clauses
+
+# Attached sinks; every hook checks this list before timing anything, so with none attached instrumentation costs one truth test
+sinks: List[Any] = []
+
+# Rows a streamed find filters at a time when its clauses are profiled; batches start small and double,
+# so a find with a small limit reads little past it
+PROFILE_BATCH_SIZES = (16, 1024)
+
+
+def attach(sink):
+    if sink not in sinks:
+        sinks.append(sink)
+    return sink
+
+
+def detach(sink):
+    if sink in sinks:
+        sinks.remove(sink)
+
+
+@contextmanager
+def profiling(*new_sinks):
+    # Attaches the sinks for the duration of the block: `with profiling(CounterSink()) as counters: ...`
+    for sink in new_sinks:
+        attach(sink)
+    try:
+        yield new_sinks[0] if len(new_sinks) == 1 else new_sinks
+    finally:
+        for sink in new_sinks:
+            detach(sink)
+
+
+def emit(event: Dict[str, Any]):
+    for sink in list(sinks):
+        sink.record(event)
+
+
+def clause_profiles(profile: Dict[str, Any], query: Dict[str, Dict[str, Any]]) -> List[Tuple[Any, Dict[str, Any]]]:
+    # Each clause check with its counters in the profile, in the order the compiled predicate runs them
+    return [(check, clause_stats(profile, f"{query_field} {query_function}")) for query_field, query_function, check in compile_clauses(query)]
+
+
+def clause_stats(profile: Dict[str, Any], clause: str) -> Dict[str, Any]:
+    # Counters are shared by every batch and partition the find filters with the same clause
+    for stats in profile['clauses']:
+        if stats['clause'] == clause:
+            return stats
+    stats = {'clause': clause, 'rows_in': 0, 'rows_out': 0, 'seconds': 0.0}
+    profile['clauses'].append(stats)
+    return stats
+
+
+def filter_clauses(rows: List[Dict[str, Any]], clauses: List[Tuple[Any, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # Clauses run one after another over the whole list, so each is timed once rather than once per row,
+    # and a row only reaches the clauses the predicate would have checked it against
+    for check, stats in clauses:
+        start = perf_counter()
+        stats['rows_in'] += len(rows)
+        rows = [row for row in rows if check(row)]
+        stats['rows_out'] += len(rows)
+        stats['seconds'] += perf_counter() - start
+    return rows
+
+
+def iter_filter_clauses(rows: Iterable[Dict[str, Any]], clauses: List[Tuple[Any, Dict[str, Any]]], profile: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    rows = iter(rows)
+    batch_size, max_batch_size = PROFILE_BATCH_SIZES
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        profile['rows_scanned'] += len(batch)
+        yield from filter_clauses(batch, clauses) if clauses else batch
+        batch_size = min(batch_size * 2, max_batch_size)
+
+
+class CounterSink:
+    # Running totals per event and table: how many events, and the sum of every numeric field they carried
+    def __init__(self):
+        self.counters: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    def record(self, event: Dict[str, Any]):
+        counters = self.counters.setdefault(event['event'], {}).setdefault(event.get('table_name'), {'count': 0})
+        counters['count'] += 1
+        if event.get('error'):
+            counters['errors'] = counters.get('errors', 0) + 1
+        for field, value in event.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                counters[field] = counters.get(field, 0) + value
+
+    def totals(self, event_name: str = None) -> Dict[str, Any]:
+        if event_name is not None:
+            return self.counters.get(event_name, {})
+        return self.counters
+
+    def reset(self):
+        self.counters = {}
+
+
+class SlowQueryLog:
+    # Queries slower than the threshold, newest last; with a file path each one is also appended to it as a JSON line
+    def __init__(self, threshold_ms: float = 100, max_entries: int = 1000, file_path: str = None, events: Tuple[str, ...] = ('find', 'join')):
+        self.threshold_seconds = threshold_ms / 1000
+        self.entries: deque = deque(maxlen=max_entries)
+        self.file_path = file_path
+        self.events = events
+
+    def record(self, event: Dict[str, Any]):
+        if event['event'] not in self.events or event.get('seconds', 0) < self.threshold_seconds:
+            return
+        self.entries.append(event)
+        if self.file_path:
+            try:
+                with open(self.file_path, 'a') as f:
+                    f.write(json.dumps(event, default=repr) + '\n')
+            except Exception as e:
+                print(f"Error writing slow query log: {e}")
+
+
+class ExplainLog:
+    # Full profiles of the latest queries; explain() renders one as a readable plan with actual counts and times
+    def __init__(self, max_entries: int = 100):
+        self.entries: deque = deque(maxlen=max_entries)
+
+    def record(self, event: Dict[str, Any]):
+        if event['event'] in ('find', 'join'):
+            self.entries.append(event)
+
+    def explain(self, position: int = -1) -> str:
+        return format_profile(self.entries[position])
+
+
+def format_profile(event: Dict[str, Any]) -> str:
+    if event['event'] == 'join':
+        cached = ', cached' if event.get('cached') else ''
+        lines = [f"join {event['table_name']} + {', '.join(event['include_table_names'])}: {event['rows_returned']} rows in {event['seconds'] * 1000:.2f} ms{cached}"]
+        for stage in event['stages']:
+            lines.append(f"  stage {stage['table_name']}: {stage['rows']} rows, find {stage['seconds'] * 1000:.2f} ms, nest {stage.get('nest_seconds', 0.0) * 1000:.2f} ms")
+        return '\n'.join(lines)
+
+    lines = [
+        f"find {event['table_name']} {event['query']}: {event['rows_returned']} rows in {event['seconds'] * 1000:.2f} ms ({event['path']})",
+        f"  partitions: {event['partitions_scanned']} scanned, {event['partitions_pruned']} pruned of {event['partitions_total']}",
+        f"  rows: {event['rows_scanned']} scanned, {event['rows_returned']} returned",
+    ]
+    if event.get('indexes_used'):
+        lines.append(f"  indexes: {', '.join(event['indexes_used'])}")
+    for stats in event['clauses']:
+        lines.append(f"  clause {stats['clause']}: {stats['rows_in']} -> {stats['rows_out']} rows, {stats['seconds'] * 1000:.2f} ms")
+    return '\n'.join(lines)
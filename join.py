@@ -1,4 +1,14 @@
-from typing import Dict, List, Set, Any
+from itertools import islice
+from time import perf_counter
+from typing import Dict, Iterator, List, Set, Any
+
+from instrumentation import emit, sinks
+from result_cache import freeze
+from results import Results, fork_row
+from utils import distinct, group_by, index_by, key_getter, nest_children
+
+# Base rows joined per batch by join_iter
+JOIN_BATCH_SIZE = 1000
 
 def most_precise_query_table(query_addons: Dict[str, Any]) -> str:
     max_key, max_count = None, 0
@@ -29,48 +39,260 @@ def highest_parent(db, table_names: List[str], query_addons: Dict[str, Any]) ->
     else:
         return tables_without_parent[0]
 
-def join(db, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any] = None):
-    join_tracker = {'results': [], 'tables': {}}
+def estimate_join(db, root_table_name: str, table_names: List[str], query_addons: Dict[str, Any], row_limits: Dict[str, float] = None) -> List[Dict[str, Any]]:
+    # Mirrors the depth-first walk of join_for_table, estimating each stage from table statistics
+    remaining = set(table_names)
+    row_limits = row_limits or {}
+    stages = []
+
+    def visit(table_name, parent_table_name, parent_rows, join_key):
+        table = db.tables[table_name]
+        remaining.discard(table_name)
+        estimate = table.estimate_query(query_addons.get(table_name))
+        row_count = max(len(table.partition_name_by_primary_key), 1)
+
+        if join_key is None:
+            rows_scanned, rows = estimate['rows_scanned'], estimate['rows_returned']
+        else:
+            parent_row_count = len(db.tables[parent_table_name].partition_name_by_primary_key)
+            distinct_keys = table.distinct_count(join_key) or min(row_count, max(parent_row_count, 1))
+            matched = min(row_count, parent_rows * row_count / max(distinct_keys, 1))
+            rows_scanned = matched if table.is_indexed(join_key) else row_count
+            rows = matched * estimate['rows_returned'] / row_count
+
+        # Tables seeded with primary keys from an earlier pass are looked up directly
+        if table_name in row_limits:
+            rows_scanned = min(rows_scanned, row_limits[table_name])
+            rows = min(rows, row_limits[table_name])
+
+        stages.append({'table_name': table_name, 'estimated_rows_scanned': rows_scanned, 'estimated_rows': rows})
+        for connected_table_name, connection in table.table_connections.items():
+            if connected_table_name in remaining:
+                visit(connected_table_name, table_name, rows, connection['join_key'])
+
+    visit(root_table_name, None, None, None)
+    return stages
+
+def plan_join(db, base_table_name: str, table_names: List[str], query_addons: Dict[str, Any], inner: bool = False) -> Dict[str, Any]:
+    try:
+        topology_root = highest_parent(db, table_names, query_addons)
+    except Exception:
+        topology_root = None
+
+    # A left join keeps every base row, so it is driven from the base table. An inner join drops the rows a filtered
+    # table has no match for, so driving from a table with query addons gives the same result, often for less work
+    root_candidates = [table_name for table_name in table_names if table_name == base_table_name or (inner and query_addons.get(table_name))]
+
+    candidates = {}
+    for root_table_name in root_candidates:
+        passes = [estimate_join(db, root_table_name, table_names, query_addons)]
+        if root_table_name != base_table_name:
+            row_limits = {stage['table_name']: stage['estimated_rows'] for stage in passes[0]}
+            passes.append(estimate_join(db, base_table_name, table_names, query_addons, row_limits))
+        cost = sum(stage['estimated_rows_scanned'] + stage['estimated_rows'] for stages in passes for stage in stages)
+        candidates[root_table_name] = {'cost': cost, 'passes': passes}
+
+    # Ties keep the topological parent, then the base table, so plans stay stable on empty tables
+    root = min(root_candidates, key=lambda table_name: (candidates[table_name]['cost'], table_name != topology_root, table_name != base_table_name))
+    return {'root': root, 'candidates': candidates}
+
+def explain_join(db, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any] = None, inner: bool = False) -> Dict[str, Any]:
+    query_addons = query_addons or {}
+    table_names = list(dict.fromkeys([base_table_name] + include_table_names))
+    plan = plan_join(db, base_table_name, table_names, query_addons, inner)
+    join_tracker = join(db, base_table_name, include_table_names, query_addons, inner=inner)
+
+    estimated_stages = [stage for stages in plan['candidates'][plan['root']]['passes'] for stage in stages]
+    stages = [{**estimated, 'actual_rows': actual['rows']} for estimated, actual in zip(estimated_stages, join_tracker['stages'])]
+    return {
+        'root': plan['root'],
+        'order': [stage['table_name'] for stage in stages],
+        'costs': {table_name: candidate['cost'] for table_name, candidate in plan['candidates'].items()},
+        'stages': stages,
+    }
+
+def join(db, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any] = None, root_table_name: str = None, fields: Dict[str, List[str]] = None, inner: bool = False):
+    # A left join by default: every base row its query selects is returned, with None or [] where a table has no match.
+    # inner=True also drops the rows a table with query addons has nothing for.
+    # Every find of the join runs under one read lock, so no write lands between the tables it reads
+    if not sinks:
+        with db.lock.reading:
+            return _cached_join(db, base_table_name, include_table_names, query_addons, root_table_name, fields, inner)
+
+    profile = {'event': 'join', 'table_name': base_table_name, 'include_table_names': include_table_names, 'query': query_addons or {}, 'inner': inner, 'cached': False}
+    start = perf_counter()
+    with db.lock.reading:
+        join_tracker = _cached_join(db, base_table_name, include_table_names, query_addons, root_table_name, fields, inner, profile)
+    profile['seconds'] = perf_counter() - start
+    profile['rows_returned'] = len(join_tracker['results'])
+    profile['stages'] = join_tracker['stages']
+    emit(profile)
+    return join_tracker
+
+def _cached_join(db, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any], root_table_name: str, fields: Dict[str, List[str]], inner: bool, profile: Dict[str, Any] = None):
+    result_cache = db.result_cache
+    if result_cache is None:
+        return _join(db, base_table_name, include_table_names, query_addons, root_table_name, fields, inner)
+    try:
+        key = ('join', base_table_name, tuple(include_table_names), freeze(query_addons or {}), root_table_name, freeze(fields or {}), inner)
+    except TypeError:
+        return _join(db, base_table_name, include_table_names, query_addons, root_table_name, fields, inner)
+
+    # The entry depends on every partition read by the finds the join made, so a write to any of them invalidates it
+    join_tracker = result_cache.get(base_table_name, key)
+    if join_tracker is None:
+        with result_cache.recording() as scans:
+            join_tracker = _join(db, base_table_name, include_table_names, query_addons, root_table_name, fields, inner)
+        result_cache.put(key, join_tracker, scans, len(join_tracker['results']))
+    elif profile is not None:
+        profile['cached'] = True
+    # Joined rows are copy-on-write, so each caller gets its own view of the cached rows and their children
+    return {**join_tracker, 'results': list(map(fork_row, join_tracker['results']))}
+
+def _join(db, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any] = None, root_table_name: str = None, fields: Dict[str, List[str]] = None, inner: bool = False):
+    join_tracker = {'results': [], 'tables': {}, 'stages': [], 'fields': fields or {}, 'inner': inner}
     all_tables_needed = set([base_table_name] + include_table_names)
 
     query_addons = query_addons or {}
-    first_table = highest_parent(db, list(all_tables_needed), query_addons)
+    first_table = root_table_name or plan_join(db, base_table_name, list(dict.fromkeys([base_table_name] + include_table_names)), query_addons, inner)['root']
 
     join_from_table_results = join_for_table(db, first_table, all_tables_needed, query_addons, join_tracker)
 
     if first_table != base_table_name:
+        join_tracker['seed_primary_keys'] = root_seed(db, first_table, join_tracker, inner)
+
         all_tables_needed = set([base_table_name] + include_table_names)
         join_from_table_results = join_for_table(db, base_table_name, all_tables_needed, query_addons, join_tracker)
 
     return join_from_table_results
 
-def join_for_table(db, table_name: str, all_tables_needed: Set[str], query_addons: Dict[str, Any], join_tracker: Dict[str, Any]):
+def root_seed(db, root_table_name: str, join_tracker: Dict[str, Any], inner: bool) -> Dict[str, List[Any]]:
+    # An inner join only keeps rows connected to the root's filtered rows, so every table the first pass found seeds the
+    # base pass. A left join is seeded with the root's rows only: the other tables were narrowed by the root's join keys,
+    # so seeding them, or the base table, would drop base rows the root has no match for
+    seeded_tables = join_tracker['tables'] if inner else {root_table_name: join_tracker['tables'][root_table_name]}
+    return {
+        table_name: list(map(key_getter(db.tables[table_name].primary_key), tracked['data']))
+        for table_name, tracked in seeded_tables.items()
+    }
+
+def join_iter(db, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any] = None, skip: int = 0, limit: int = None, batch_size: int = JOIN_BATCH_SIZE, fields: Dict[str, List[str]] = None, inner: bool = False) -> Iterator[Dict[str, Any]]:
+    # Base rows are streamed and joined one batch at a time, so only a batch and its children are held at once
+    query_addons = query_addons or {}
+    fields = fields or {}
+    table_names = list(dict.fromkeys([base_table_name] + include_table_names))
+    with db.lock.reading:
+        root_table_name = plan_join(db, base_table_name, table_names, query_addons, inner)['root']
+
+        seed_primary_keys = {}
+        if root_table_name != base_table_name:
+            join_tracker = join_for_table(db, root_table_name, set(table_names), query_addons, {'results': [], 'tables': {}, 'stages': [], 'fields': fields, 'inner': inner})
+            seed_primary_keys = root_seed(db, root_table_name, join_tracker, inner)
+
+    rows = _iter_joined_batches(db, base_table_name, table_names, query_addons, seed_primary_keys, batch_size, fields, inner)
+    return islice(rows, skip, None if limit is None else skip + limit)
+
+def _iter_joined_batches(db, base_table_name: str, table_names: List[str], query_addons: Dict[str, Any], seed_primary_keys: Dict[str, List[Any]], batch_size: int, fields: Dict[str, List[str]], inner: bool):
+    table = db.tables[base_table_name]
+    table_query = query_addons.get(base_table_name, {})
+    if base_table_name in seed_primary_keys:
+        table_query = merge_in_clause(table, table_query, table.primary_key, seed_primary_keys[base_table_name])
+
+    # The base rows are pinned as of the first batch; the lock is only held while one batch is nested, so writes can
+    # run between batches and each batch sees its child tables at one moment
+    base_rows = table.find_iter(table_query, fields=join_fields(table, fields), copy_on_write=True)
+    while True:
+        batch = list(islice(base_rows, batch_size))
+        if not batch:
+            return
+
+        join_tracker = {'results': [], 'tables': {}, 'stages': [], 'fields': fields, 'inner': inner, 'seed_primary_keys': seed_primary_keys}
+        join_tracker['tables'][base_table_name] = {'data': batch, 'indexes': {}, 'groups': {}, 'restricting': inner and bool(query_addons.get(base_table_name))}
+        all_tables_needed = set(table_names)
+        all_tables_needed.discard(base_table_name)
+        with db.lock.reading:
+            results = nest_connected_tables(db, base_table_name, batch, all_tables_needed, query_addons, join_tracker)['results']
+        yield from results
+
+def join_fields(table, fields: Dict[str, List[str]]):
+    # A projected table still carries its primary key and join keys, which seeding and nesting rely on
+    if table.table_name not in fields:
+        return None
+    key_fields = [table.primary_key] + [connection['join_key'] for connection in table.table_connections.values()]
+    return list(dict.fromkeys(fields[table.table_name] + key_fields))
+
+def merge_in_clause(table, query: Dict[str, Any], field: str, values: List[Any]) -> Dict[str, Any]:
+    new_query = table.normalize_query(query)
+    clause = dict(new_query.get(field, {}))
+    if '$in' in clause:
+        allowed_values = set(clause['$in'])
+        values = [value for value in values if value in allowed_values]
+    clause['$in'] = values
+    new_query[field] = clause
+    return new_query
+
+def join_for_table(db, table_name: str, all_tables_needed: Set[str], query_addons: Dict[str, Any], join_tracker: Dict[str, Any], table_query: Dict[str, Any] = None):
     table = db.tables[table_name]
     all_tables_needed.discard(table_name)
-    data = table.find(query_addons.get(table_name, {})) or []
+    if table_query is None:
+        table_query = query_addons.get(table_name, {})
+    if table_name in join_tracker.get('seed_primary_keys', {}):
+        table_query = merge_in_clause(table, table_query, table.primary_key, join_tracker['seed_primary_keys'][table_name])
+
+    start = perf_counter()
+    if any(isinstance(clause, dict) and clause.get('$in') == [] for clause in table_query.values()):
+        data = Results([])
+    else:
+        # Copy-on-write rows take the nested children, so the rows stored in the partitions are never modified
+        data = table.find(table_query, fields=join_fields(table, join_tracker.get('fields', {})), copy_on_write=True) or []
+
+    # Timing a stage costs two clock reads per table, so stages are always timed; nest_seconds is filled in by the parent
+    stage = {'table_name': table_name, 'rows': len(data), 'seconds': perf_counter() - start}
+    join_tracker['stages'].append(stage)
 
+    # index_by/group_by maps are filled in by the parent, only for the join key it nests on
     join_tracker['tables'][table_name] = {
         'data': data,
-        'indexes': {key: index_by(data, key) for key in table.get_foreign_keys_and_primary_keys()},
-        'groups': {key: group_by(data, key) for key in table.get_foreign_keys_and_primary_keys()}
+        'indexes': {},
+        'groups': {},
+        'restricting': join_tracker.get('inner', False) and bool(query_addons.get(table_name)),
+        'stage': stage,
     }
 
+    return nest_connected_tables(db, table_name, data, all_tables_needed, query_addons, join_tracker)
+
+def nest_connected_tables(db, table_name: str, data: List[Dict[str, Any]], all_tables_needed: Set[str], query_addons: Dict[str, Any], join_tracker: Dict[str, Any]):
+    table = db.tables[table_name]
     for connected_table_name, connection in table.table_connections.items():
         if connected_table_name not in all_tables_needed:
             continue
 
         join_key = connection['join_key']
-        parent_join_ids = distinct([get_from_dict(row, join_key) for row in data])
-        child_query = query_addons.get(connected_table_name, {})
-        parent_id_query = {join_key: {'$in': parent_join_ids}}
-        new_child_query = {**child_query, **parent_id_query}
+        parent_join_ids = distinct(map(key_getter(join_key), data))
+        connected_table = db.tables[connected_table_name]
+        new_child_query = merge_in_clause(connected_table, query_addons.get(connected_table_name, {}), join_key, parent_join_ids)
 
-        join_tracker = join_for_table(db, connected_table_name, all_tables_needed, query_addons, join_tracker)
-        child_data_by_key = join_tracker['tables'][connected_table_name]['indexes'][join_key] if connection['join_type'] == 'many_to_one' else join_tracker['tables'][connected_table_name]['groups'][join_key]
+        join_tracker = join_for_table(db, connected_table_name, all_tables_needed, query_addons, join_tracker, new_child_query)
+        child_tracker = join_tracker['tables'][connected_table_name]
+        start = perf_counter()
+        if connection['join_type'] == 'many_to_one':
+            if join_key not in child_tracker['indexes']:
+                child_tracker['indexes'][join_key] = index_by(child_tracker['data'], join_key)
+            child_data_by_key = child_tracker['indexes'][join_key]
+        else:
+            if join_key not in child_tracker['groups']:
+                child_tracker['groups'][join_key] = group_by(child_tracker['data'], join_key)
+            child_data_by_key = child_tracker['groups'][join_key]
         store_key = connected_table_name if connection['join_type'] == 'many_to_one' else f"{connected_table_name}s"
 
         data = nest_children(data, child_data_by_key, join_key, store_key)
 
-    join_tracker['results'] = join_tracker['tables'][table_name]['data']
-    return join_tracker
+        # In an inner join a filtered child filters its parents too, so the result does not depend on which table drove it
+        if child_tracker['restricting']:
+            data = [row for row in data if row.get(store_key)]
+            join_tracker['tables'][table_name]['restricting'] = True
+        child_tracker['stage']['nest_seconds'] = perf_counter() - start
 
+    join_tracker['tables'][table_name]['data'] = data
+    join_tracker['results'] = data
+    return join_tracker
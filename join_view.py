@@ -0,0 +1,252 @@
+import gzip
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from query import compile_query
+from results import CopyOnWriteRow, Results, fork_row
+from utils import key_getter, write_file_atomic
+
+
+class JoinViewNode:
+    # One table of the view, nested into its parent on join_key the way join_for_table nests it
+    def __init__(self, table, parent: Optional['JoinViewNode'], join_key: str = None, join_type: str = None, query: Dict[str, Any] = None, inner: bool = False):
+        self.table = table
+        self.table_name = table.table_name
+        self.parent = parent
+        self.join_key = join_key
+        self.get_join_value = key_getter(join_key) if join_key else None
+        self.join_type = join_type
+        self.store_key = self.table_name if join_type == 'many_to_one' else f"{self.table_name}s"
+        self.query = table.normalize_query(query or {})
+        self.predicate = compile_query(self.query) if self.query else None
+        self.children: List['JoinViewNode'] = []
+        self.restricting = inner and bool(self.query)
+        self.clear()
+
+    def clear(self):
+        # Nested rows of the included rows, and for every row matching the query the join key values it was filed under
+        self.nested: Dict[Any, Dict[str, Any]] = {}
+        self.keys_by_pk: Dict[Any, tuple] = {}
+        self.included_pks_by_key: Dict[Any, Dict[Any, None]] = {}
+        self.pks_by_child_key: Dict[str, Dict[Any, Dict[Any, None]]] = {child.table_name: {} for child in self.children}
+
+    def children_of(self, join_value):
+        row_pks = self.included_pks_by_key.get(join_value)
+        if not row_pks:
+            return None
+        if self.join_type == 'many_to_one':
+            return self.nested[next(reversed(row_pks))]
+        return [self.nested[row_pk] for row_pk in row_pks]
+
+
+class JoinView:
+    # A join kept materialized: writes to any of its tables refresh only the rows they touch and the parents nesting them,
+    # so reading the view costs the size of the result. Rows are shared like find's, copy_on_write gives private copies.
+    def __init__(self, db, view_name: str, base_table_name: str, include_table_names: List[str], query_addons: Dict[str, Any] = None, inner: bool = False):
+        self.db = db
+        self.view_name = view_name
+        self.base_table_name = base_table_name
+        self.include_table_names = include_table_names
+        self.query_addons = query_addons or {}
+        self.inner = inner
+        self.output_file_path = f"{db.storage_location}/_{view_name}.view.json"
+        self.root = self._build_tree()
+        self.nodes_by_table_name = {node.table_name: node for node in self._post_order(self.root)}
+        # Until the view is built from its tables (or read from its file) and while it is not maintained, reads rebuild it
+        self.results: Dict[Any, Dict[str, Any]] = {}
+        self.maintained = False
+        self.stale = True
+        self.build_lock = threading.Lock()
+        for table_name in self.nodes_by_table_name:
+            db.tables[table_name].join_views.append(self)
+
+    def _build_tree(self) -> JoinViewNode:
+        # Same depth-first walk over table_connections as join_for_table, so the nesting matches join()
+        remaining = set([self.base_table_name] + self.include_table_names)
+
+        def visit(table_name, parent, join_key, join_type):
+            remaining.discard(table_name)
+            table = self.db.tables[table_name]
+            node = JoinViewNode(table, parent, join_key, join_type, self.query_addons.get(table_name), self.inner)
+            for connected_table_name, connection in table.table_connections.items():
+                if connected_table_name in remaining:
+                    child = visit(connected_table_name, node, connection['join_key'], connection['join_type'])
+                    node.children.append(child)
+                    node.restricting = node.restricting or child.restricting
+            node.clear()
+            return node
+
+        return visit(self.base_table_name, None, None, None)
+
+    def _post_order(self, node: JoinViewNode) -> List[JoinViewNode]:
+        return [descendant for child in node.children for descendant in self._post_order(child)] + [node]
+
+    def build(self):
+        # Children first, so each parent row finds its nested children when it is linked
+        for node in self._post_order(self.root):
+            node.clear()
+            get_primary_key = key_getter(node.table.primary_key)
+            for row in node.table.find(node.query):
+                self._link(node, get_primary_key(row), row, {})
+        self.results = self.root.nested
+        self.maintained = True
+        self.stale = False
+
+    def rows(self, copy_on_write: bool = False) -> Results:
+        self._build_if_stale()
+        if copy_on_write:
+            return Results(map(fork_row, self.results.values()))
+        return Results(self.results.values())
+
+    def get(self, row_pk) -> Optional[Dict[str, Any]]:
+        self._build_if_stale()
+        return self.results.get(row_pk)
+
+    def _build_if_stale(self):
+        # Writes are kept out by the read lock, which a caller reading several tables may already hold; the build lock
+        # makes other readers wait for the build rather than run it too. Lock order: database lock, then build lock
+        if self.stale:
+            with self.db.lock.reading, self.build_lock:
+                if self.stale:
+                    self.build()
+
+    def rows_changed(self, table_name: str, primary_keys: List[Any]):
+        if not self.maintained:
+            self.stale = True
+            return
+        self._refresh(self.nodes_by_table_name[table_name], primary_keys)
+
+    def mark_stale(self):
+        self.maintained = False
+        self.stale = True
+
+    def _refresh(self, node: JoinViewNode, primary_keys):
+        # Re-nest the changed rows, then the parent rows filed under any join value whose children changed
+        touched_keys: Dict[Any, None] = {}
+        rows_by_pk = node.table.get_rows(primary_keys)
+        for row_pk in primary_keys:
+            row = rows_by_pk.get(row_pk)
+            if row is not None and node.predicate is not None and not node.predicate(row):
+                row = None
+            self._link(node, row_pk, row, touched_keys)
+
+        if node.parent is not None and touched_keys:
+            pks_by_key = node.parent.pks_by_child_key[node.table_name]
+            parent_pks: Dict[Any, None] = {}
+            for join_value in touched_keys:
+                parent_pks.update(pks_by_key.get(join_value, {}))
+            if parent_pks:
+                self._refresh(node.parent, list(parent_pks))
+
+    def _link(self, node: JoinViewNode, row_pk, row, touched_keys: Dict[Any, None]):
+        # Rows that stay in a group keep their position, so updates do not reorder the view
+        old_keys = node.keys_by_pk.pop(row_pk, None)
+        was_included = row_pk in node.nested
+        old_parent_key, old_child_keys = old_keys if old_keys is not None else (None, [None] * len(node.children))
+
+        new_keys = None
+        nested = None
+        if row is not None:
+            new_keys = (node.get_join_value(row) if node.parent is not None else None,
+                        [child.get_join_value(row) for child in node.children])
+            node.keys_by_pk[row_pk] = new_keys
+            nested = self._nest(node, row, new_keys[1])
+
+        for position, child in enumerate(node.children):
+            pks_by_key = node.pks_by_child_key[child.table_name]
+            new_child_key = new_keys[1][position] if new_keys is not None else None
+            if old_keys is not None and (new_keys is None or new_child_key != old_child_keys[position]):
+                _discard(pks_by_key, old_child_keys[position], row_pk)
+            if new_keys is not None and (old_keys is None or new_child_key != old_child_keys[position]):
+                pks_by_key.setdefault(new_child_key, {})[row_pk] = None
+
+        if nested is None:
+            node.nested.pop(row_pk, None)
+        else:
+            node.nested[row_pk] = nested
+        if node.parent is None:
+            return
+
+        new_parent_key = new_keys[0] if new_keys is not None else None
+        if was_included:
+            touched_keys[old_parent_key] = None
+            if nested is None or new_parent_key != old_parent_key:
+                _discard(node.included_pks_by_key, old_parent_key, row_pk)
+        if nested is not None:
+            touched_keys[new_parent_key] = None
+            if not was_included or new_parent_key != old_parent_key:
+                node.included_pks_by_key.setdefault(new_parent_key, {})[row_pk] = None
+
+    def _nest(self, node: JoinViewNode, row, child_keys) -> Optional[Dict[str, Any]]:
+        # None when a restricting child (a filtered one, in an inner join) has nothing for this row, which drops it
+        nested = CopyOnWriteRow(row)
+        for child, child_key in zip(node.children, child_keys):
+            children = child.children_of(child_key)
+            if child.restricting and not children:
+                return None
+            nested[child.store_key] = children
+        return nested
+
+    def definition(self) -> Dict[str, Any]:
+        return {
+            'view_name': self.view_name,
+            'base_table_name': self.base_table_name,
+            'include_table_names': self.include_table_names,
+            'query_addons': self.query_addons,
+            'inner': self.inner,
+        }
+
+    def write_file(self) -> bool:
+        self._build_if_stale()
+        # Nested rows are replaced rather than changed by writes, so the list taken under the lock is a snapshot
+        with self.db.lock.reading:
+            output_data = {
+                **self.definition(),
+                'row_counts': {table_name: len(self.db.tables[table_name].partition_name_by_primary_key) for table_name in self.nodes_by_table_name},
+                'rows': list(self.results.values()),
+            }
+        try:
+            os.makedirs(os.path.dirname(self.output_file_path), exist_ok=True)
+            payload = json.dumps(output_data).encode('utf-8')
+            write_file_atomic(self.output_file_path, gzip.compress(payload) if self.db.do_compression else payload, self.db.fsync_writes)
+            return True
+        except Exception as e:
+            print(f"Error writing join view {self.view_name}: {e}")
+            return False
+
+    def read_from_file(self):
+        # The saved rows are served as they are until a write touches the view, which then rebuilds it from its tables
+        try:
+            with open(self.output_file_path, 'rb') as f:
+                payload = f.read()
+            parsed_data = json.loads(gzip.decompress(payload) if self.db.do_compression else payload)
+        except FileNotFoundError:
+            print(f"File not found: {self.output_file_path}")
+            return
+        except Exception as e:
+            print(f"Error reading join view {self.view_name}: {e}")
+            return
+
+        row_counts = {table_name: len(self.db.tables[table_name].partition_name_by_primary_key) for table_name in self.nodes_by_table_name}
+        if parsed_data.get('row_counts') != row_counts:
+            return
+        get_primary_key = key_getter(self.root.table.primary_key)
+        self.results = {get_primary_key(row): row for row in parsed_data.get('rows', [])}
+        self.maintained = False
+        self.stale = False
+
+    def drop(self):
+        for table_name in self.nodes_by_table_name:
+            self.db.tables[table_name].join_views.remove(self)
+        if os.path.exists(self.output_file_path):
+            os.remove(self.output_file_path)
+
+
+def _discard(pks_by_key: Dict[Any, Dict[Any, None]], join_value, row_pk):
+    row_pks = pks_by_key.get(join_value)
+    if row_pks is not None:
+        row_pks.pop(row_pk, None)
+        if not row_pks:
+            del pks_by_key[join_value]
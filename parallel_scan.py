@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Tuple
+
+from aggregate import aggregate_rows, merge_partials
+from partition import Partition
+from query import compile_projection, compile_query
+
+# Tasks per worker, so one slow partition does not leave the rest of the pool idle
+CHUNKS_PER_WORKER = 4
+
+_executors: Dict[int, ProcessPoolExecutor] = {}
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        _executors[workers] = executor
+    return executor
+
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+
+
+def partition_sources(partition: Partition, chunk_rows: int) -> List[Tuple[str, Any]]:
+    # Clean partitions are read from their own file by the worker, only dirty rows are pickled across; a partition
+    # being saved is clean already, but its file may still hold the previous rows
+    if not partition.is_dirty and not partition.write_lock.locked() and os.path.exists(partition.output_file_path()):
+        return [('file', (partition.storage_location, partition.partition_indices, partition.primary_key,
+                          partition.do_compression, partition.partition_name, partition.storage_format))]
+    rows = list(partition.data.values())
+    return [('rows', rows[start:start + chunk_rows]) for start in range(0, len(rows), chunk_rows)]
+
+
+def source_rows(source: Tuple[str, Any]):
+    kind, payload = source
+    if kind == 'file':
+        storage_location, partition_indices, primary_key, do_compression, partition_name, storage_format = payload
+        partition = Partition(storage_location, partition_indices, primary_key, None, do_compression, partition_name, storage_format)
+        partition.load()
+        return partition.data.values()
+    return payload
+
+
+def scan_source(source: Tuple[str, Any], query: Dict[str, Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    rows = source_rows(source)
+    if query:
+        predicate = compile_query(query)
+        rows = [row for row in rows if predicate(row)]
+    if fields:
+        return list(map(compile_projection(fields), rows))
+    return list(rows)
+
+
+def aggregate_source(source: Tuple[str, Any], query: Dict[str, Dict[str, Any]], group_by: List[str], metric_specs) -> Dict[Tuple, List[Any]]:
+    rows = source_rows(source)
+    if query:
+        rows = filter(compile_query(query), rows)
+    return aggregate_rows(rows, group_by, metric_specs)
+
+
+def _sources(partitions: List[Partition], workers: int) -> List[Tuple[str, Any]]:
+    total_rows = sum(partition.row_count() for partition in partitions)
+    chunk_rows = max(1, total_rows // (workers * CHUNKS_PER_WORKER))
+    return [source for partition in partitions for source in partition_sources(partition, chunk_rows)]
+
+
+def parallel_aggregate(partitions: List[Partition], query: Dict[str, Dict[str, Any]], group_by: List[str], metric_specs, workers: int) -> Dict[Tuple, List[Any]]:
+    # Workers send back one small partial per source instead of rows, and the partials merge in source order
+    partials = get_executor(workers).map(aggregate_source, _sources(partitions, workers), repeat(query), repeat(group_by), repeat(metric_specs))
+    return merge_partials(partials, metric_specs)
+
+
+def parallel_scan(partitions: List[Partition], query: Dict[str, Dict[str, Any]], fields: Optional[List[str]], workers: int) -> List[Dict[str, Any]]:
+    rows = []
+    for matches in get_executor(workers).map(scan_source, _sources(partitions, workers), repeat(query), repeat(fields)):
+        rows.extend(matches)
+    return rows
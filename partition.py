@@ -2,83 +2,313 @@ import json
 import os
 import asyncio
 import gzip
-from typing import Any, Dict
+import datetime
+import threading
+from itertools import count
+from time import perf_counter
+from typing import Any, Dict, List
+
+from binary_format import read_partition_file, write_partition_file
+from columnar import ColumnStore, columnar_available
+from concurrency import ReadWriteLock
+from instrumentation import emit, sinks
+from utils import get_from_dict, write_file_atomic
+
+# Level 6 compresses nearly as well as the default 9 at a fraction of the cost
+COMPRESS_LEVEL = 6
+
+# Versions are drawn from one counter, so a partition recreated under the same name never repeats an old version
+_versions = count(1)
 
 class Partition:
-    def __init__(self, storage_location: str, partition_indices: Dict[str, Any], primary_key: str, proto, do_compression: bool, partition_name: str = None):
+    def __init__(self, storage_location: str, partition_indices: Dict[str, Any], primary_key: str, proto, do_compression: bool, partition_name: str = None, storage_format: str = 'json'):
         self.partition_indices = partition_indices
         self.primary_key = primary_key
         self.proto = proto
+        self.version = next(_versions)
         self.data = {}
+        self.stub_primary_keys = []
         self.partition_name = partition_name or self._partition_name_from_partition_index(partition_indices)
         self.storage_location = storage_location
         self.json_output_file_path = os.path.join(storage_location, f"{self.partition_name}.json")
         self.txt_output_file_path = os.path.join(storage_location, f"{self.partition_name}.txt")
+        self.bin_output_file_path = os.path.join(storage_location, f"{self.partition_name}.bin")
+        self.keys_output_file_path = os.path.join(storage_location, f"{self.partition_name}.keys.json")
+        self.storage_format = storage_format
         self.last_update_dt = None
         self.do_compression = do_compression
         self.is_dirty = True
-        self.write_lock = False
+        self.write_lock = threading.Lock()
+        self.load_lock = threading.RLock()
+        # The table's lock once the partition belongs to one; pins are taken under it, so no write is half applied
+        self.lock = ReadWriteLock()
+        # One entry per snapshot reading the current rows dict; while any is open, writes go to a copy instead
+        self.pins: List[None] = []
+        self.cache = None
+        self.estimated_row_bytes = None
+        self.last_write_bytes = 0
+        self.column_store_cache = None
+        self.fsync = False
+
+    @property
+    def data(self):
+        # Concurrent readers of a stub wait for the one that reads its file, and none sees it half unloaded
+        with self.load_lock:
+            was_loaded = self.is_loaded
+            if not was_loaded:
+                self.load()
+            data = self._data
+        # Outside the lock: admitting can evict other partitions, which takes their locks
+        if self.cache is not None:
+            if was_loaded:
+                self.cache.touch(self)
+            else:
+                self.cache.admit(self)
+        return data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self.is_loaded = True
+        self.version = next(_versions)
+
+    def pin(self):
+        # The current rows dict, left unchanged until unpin: writers move the partition to a copy while it is pinned.
+        # Callers hold the table's lock, so the dict they pin has no write half applied to it
+        data = self.data
+        pins = self.pins
+        pins.append(None)
+        return data, pins
+
+    def unpin(self, pins):
+        pins.pop()
+
+    def _writable_data(self):
+        data = self.data
+        if self.pins:
+            data = self._data = data.copy()
+            self.pins = []
+        return data
+
+    def mark_unloaded(self, primary_keys):
+        # Stub partitions only know their keys until the first access to data reads the file
+        with self.load_lock:
+            self.is_loaded = False
+            self._data = {}
+            self.column_store_cache = None
+            self.is_dirty = False
+            self.stub_primary_keys = primary_keys
+
+    def column_store(self):
+        # Column arrays follow the row dicts: any change to the partition bumps its version and they are rebuilt on demand
+        if not columnar_available():
+            return None
+        if self.column_store_cache is None or self.column_store_cache.version != self.version:
+            self.column_store_cache = ColumnStore(self.data, self.version)
+        return self.column_store_cache
+
+    def row_count(self):
+        with self.load_lock:
+            return len(self._data) if self.is_loaded else len(self.stub_primary_keys)
+
+    def estimated_bytes(self):
+        with self.load_lock:
+            if not self.is_loaded:
+                return 0
+            if self.estimated_row_bytes is None:
+                self.estimated_row_bytes = self._estimate_row_bytes()
+            return (self.estimated_row_bytes or 0) * len(self._data)
+
+    def _estimate_row_bytes(self):
+        # Serialized size of a few rows; clean binary partitions use the file they are mapped from
+        if not isinstance(self._data, dict) and not self.is_dirty and os.path.exists(self.output_file_path()):
+            return os.path.getsize(self.output_file_path()) / max(len(self._data), 1)
+        sample = [self._data[row_pk] for _, row_pk in zip(range(16), self._data.keys())]
+        if not sample:
+            return None
+        return sum(len(json.dumps(row, default=str)) for row in sample) / len(sample)
+
+    def read_primary_keys(self):
+        # None when the key list does not describe the current partition file (a crash between the two writes, or a
+        # file replaced since); the partition is then read in full instead
+        with open(self.keys_output_file_path, 'r') as f:
+            keys_data = json.load(f)
+        if not isinstance(keys_data, dict) or keys_data.get('file') != self._file_signature(self.output_file_path()):
+            return None
+        return keys_data['primary_keys']
+
+    def _file_signature(self, file_path):
+        # Snapshots replace the file rather than rewrite it, so each one gets a new inode
+        stat = os.stat(file_path)
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
 
     def _partition_name_from_partition_index(self, partition_indices):
         return '_'.join([f'{key}_{value}' for key, value in partition_indices.items()]) or 'default'
 
-    async def write_to_file(self):
-        if not self.is_dirty or self.write_lock:
-            return
+    def output_file_path(self):
+        if self.storage_format == 'binary':
+            return self.bin_output_file_path
+        return self.txt_output_file_path if self.do_compression else self.json_output_file_path
+
+    async def write_to_file(self, executor=None) -> bool:
+        # Serialization, compression and the file write run on the executor so the event loop keeps flushing other partitions
+        if not self.is_dirty:
+            return True
+        if not self.write_lock.acquire(blocking=False):
+            return False
 
-        self.write_lock = True
+        # The profile is filled in on the executor thread and emitted from this one, so sinks never run concurrently
+        profile = self._io_profile('partition_write') if sinks else None
+        pins = None
         try:
-            self.is_dirty = False
+            output_file_path, output_data, data, pins = self._snapshot()
+            self.last_write_bytes = await asyncio.get_running_loop().run_in_executor(executor, self._write_snapshot, output_file_path, output_data, data, profile)
+            return True
+        except Exception as e:
+            print(f"Error writing file: {e}")
+            if profile is not None:
+                profile['error'] = str(e)
+            self.is_dirty = True
+            return False
+        finally:
+            if pins is not None:
+                self.unpin(pins)
+            self.write_lock.release()
+            if profile is not None:
+                emit(profile)
+
+    def write_file(self) -> bool:
+        if not self.is_dirty:
+            return True
+        if not self.write_lock.acquire(blocking=False):
+            return False
+
+        profile = self._io_profile('partition_write') if sinks else None
+        pins = None
+        try:
+            output_file_path, output_data, data, pins = self._snapshot()
+            self.last_write_bytes = self._write_snapshot(output_file_path, output_data, data, profile)
+            return True
+        except Exception as e:
+            print(f"Error writing file: {e}")
+            if profile is not None:
+                profile['error'] = str(e)
+            self.is_dirty = True
+            return False
+        finally:
+            if pins is not None:
+                self.unpin(pins)
+            self.write_lock.release()
+            if profile is not None:
+                emit(profile)
+
+    def _io_profile(self, event_name: str) -> Dict[str, Any]:
+        profile = {
+            'event': event_name,
+            'table_name': os.path.basename(self.storage_location),
+            'partition_name': self.partition_name,
+            'storage_format': self.storage_format,
+            'bytes': 0,
+            'seconds': 0.0,
+        }
+        if event_name == 'partition_write':
+            profile['serialize_seconds'] = 0.0
+            profile['fsync_seconds'] = 0.0
+        return profile
+
+    def _snapshot(self):
+        # The rows are pinned rather than copied: writes made while the file is written go to a copy of the dict,
+        # and the partition is marked clean in the same step, so any such write marks it dirty again
+        with self.lock.reading:
             output_data = {
                 "partition_name": self.partition_name,
                 "partition_indices": self.partition_indices,
-                "data": self.data,
                 "storage_location": self.storage_location,
                 "primary_key": self.primary_key,
                 "last_update_dt": self.last_update_dt.isoformat() if self.last_update_dt else None
             }
-            data = json.dumps(output_data, indent=2)
-            output_file_path = self.txt_output_file_path if self.do_compression else self.json_output_file_path
+            data, pins = self.pin()
+            self.is_dirty = False
+        return self.output_file_path(), output_data, data, pins
 
-            os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+    def _write_snapshot(self, output_file_path, output_data, data, profile=None) -> int:
+        start = perf_counter()
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        if self.storage_format == 'binary':
+            # Rows are encoded as they are written, so serialize time includes the writes of the binary file
+            size = write_partition_file(output_file_path, output_data, data, self.fsync, profile)
+            serialize_seconds = perf_counter() - start - (profile['fsync_seconds'] if profile is not None else 0.0)
+        else:
+            output_data["data"] = data if isinstance(data, dict) else dict(data.items())
+            payload = json.dumps(output_data, indent=2).encode('utf-8')
             if self.do_compression:
-                async with gzip.open(output_file_path, 'wt', encoding='utf-8') as f:
-                    await f.write(data)
-            else:
-                with open(output_file_path, 'w') as f:
-                    f.write(data)
-        except Exception as e:
-            print(f"Error writing file: {e}")
-            self.is_dirty = True
-        finally:
-            self.write_lock = False
+                payload = gzip.compress(payload, compresslevel=COMPRESS_LEVEL)
+            serialize_seconds = perf_counter() - start
+            size = write_file_atomic(output_file_path, payload, self.fsync, profile)
+        # The key list names the file it was taken from, so a list left over from an earlier snapshot is not trusted
+        keys_data = {'file': self._file_signature(output_file_path), 'primary_keys': list(data.keys())}
+        size += write_file_atomic(self.keys_output_file_path, json.dumps(keys_data, separators=(',', ':')).encode('utf-8'), self.fsync, profile)
+        if profile is not None:
+            profile['bytes'] = size
+            profile['serialize_seconds'] = serialize_seconds
+            profile['seconds'] = perf_counter() - start
+        return size
 
     async def read_from_file(self):
-        output_file_path = self.txt_output_file_path if self.do_compression else self.json_output_file_path
+        self.load()
+
+    def load(self):
+        # Reading a stub's file back does not change its rows, so it keeps the version results were cached against
+        unloaded_version = None if self.is_loaded else self.version
+        output_file_path = self.output_file_path()
+        profile = self._io_profile('partition_read') if sinks else None
+        start = perf_counter()
+        # Rows are read into a local dict and published once, so readers never see a partly read file
+        rows = {}
         try:
-            if self.do_compression:
-                async with gzip.open(output_file_path, 'rt', encoding='utf-8') as f:
-                    data = await f.read()
+            if self.storage_format == 'binary':
+                # Only the header and offset index are read here, rows stay in the mapped file until accessed
+                parsed_data, rows = read_partition_file(output_file_path)
+            elif self.do_compression:
+                with gzip.open(output_file_path, 'rt', encoding='utf-8') as f:
+                    data = f.read()
             else:
                 with open(output_file_path, 'r') as f:
                     data = f.read()
-            parsed_data = json.loads(data)
+            if self.storage_format != 'binary':
+                parsed_data = json.loads(data)
+                rows = {get_from_dict(row, parsed_data.get("primary_key")): row for row in parsed_data.get("data", {}).values()}
             self.partition_name = parsed_data.get("partition_name")
             self.partition_indices = parsed_data.get("partition_indices")
-            self.data = parsed_data.get("data")
             self.storage_location = parsed_data.get("storage_location")
             self.primary_key = parsed_data.get("primary_key")
-            self.last_update_dt = parsed_data.get("last_update_dt")
-        except FileNotFoundError:
+            last_update_dt = parsed_data.get("last_update_dt")
+            self.last_update_dt = datetime.datetime.fromisoformat(last_update_dt) if last_update_dt else None
+        except FileNotFoundError as e:
             print(f"File not found: {output_file_path}")
+            if profile is not None:
+                profile['error'] = str(e)
         except Exception as e:
             print(f"Error reading from file: {e}")
+            if profile is not None:
+                profile['error'] = str(e)
+        with self.load_lock:
+            self.data = rows
+            if unloaded_version is not None:
+                self.version = unloaded_version
+        if profile is not None:
+            # Binary files are mapped rather than read, so their rows are decoded later, as they are accessed
+            profile['seconds'] = perf_counter() - start
+            profile['bytes'] = os.path.getsize(output_file_path) if os.path.exists(output_file_path) else 0
+            emit(profile)
 
     async def delete_file(self):
-        output_file_path = self.txt_output_file_path if self.do_compression else self.json_output_file_path
+        output_file_path = self.output_file_path()
         try:
-            self.data.clear()
+            self.data = {}
             os.remove(output_file_path)
+            if os.path.exists(self.keys_output_file_path):
+                os.remove(self.keys_output_file_path)
         except FileNotFoundError:
             print(f"File not found: {output_file_path}")
         except Exception as e:
@@ -90,27 +320,43 @@ class Partition:
         if not isinstance(data, list):
             data = [data]
 
+        partition_data = self.data
+        rows_by_pk = {}
         for row in data:
-            row_pk = self._get_from_dict(row, self.primary_key)
+            row_pk = get_from_dict(row, self.primary_key)
             if row_pk is None:
                 raise ValueError(f"Primary key value missing in the data row. Cannot insert into partition. Table {self.partition_name} and primary key {self.primary_key}")
-            elif row_pk in self.data:
+            elif row_pk in partition_data or row_pk in rows_by_pk:
                 raise ValueError(f"Duplicate primary key value: {row_pk} for field {self.primary_key} in partition {self.partition_name}")
+            rows_by_pk[row_pk] = row
 
-            self.data[row_pk] = row
-            self.is_dirty = True
+        self.insert_rows(rows_by_pk)
 
+    def insert_rows(self, rows_by_pk):
+        # Rows already validated by the caller; the batch is marked dirty, timestamped and charged to the cache once
+        self._writable_data().update(rows_by_pk)
+        self.is_dirty = True
+        self.version = next(_versions)
         self.last_update_dt = datetime.datetime.now()
+        if self.cache is not None:
+            self.cache.resize(self)
 
     def update(self, row, fields_to_drop=None):
         fields_to_drop = fields_to_drop or []
-        row_pk = self._get_from_dict(row, self.primary_key)
+        row_pk = get_from_dict(row, self.primary_key)
         if row_pk not in self.data:
             raise ValueError(f"Row with primary key {row_pk} does not exist in partition {self.partition_name}.")
 
         for field in fields_to_drop:
             row.pop(field, None)
 
-        self.data[row_pk] = row
+        self._writable_data()[row_pk] = row
+        self.is_dirty = True
+        self.version = next(_versions)
+        self.last_update_dt = datetime.datetime.now()
+
+    def remove_row(self, row_pk):
+        row = self._writable_data().pop(row_pk)
         self.is_dirty = True
-        self.last_update_dt = datetime.datetime.now()
\ No newline at end of file
+        self.version = next(_versions)
+        return row
\ No newline at end of file
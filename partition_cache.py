@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+
+
+class PartitionCache:
+    def __init__(self, memory_budget_bytes: int, policy: str = 'lru'):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unsupported cache policy: {policy}")
+        self.memory_budget_bytes = memory_budget_bytes
+        self.policy = policy
+        # Resident partitions in recency order, with the byte estimate they were last charged at
+        self.resident: 'OrderedDict[Any, float]' = OrderedDict()
+        self.access_counts: Dict[Any, int] = {}
+        self.bytes_resident = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_backs = 0
+        # Readers on several threads touch partitions at once; admitting one may evict another
+        self.lock = threading.RLock()
+
+    def admit(self, partition):
+        with self.lock:
+            self.misses += 1
+            self._charge(partition)
+            self.evict_if_needed(keep=partition)
+
+    def add(self, partition):
+        # Partitions created in memory are resident without having been a miss
+        with self.lock:
+            self._charge(partition)
+            self.evict_if_needed(keep=partition)
+
+    def touch(self, partition):
+        with self.lock:
+            self.hits += 1
+            if partition in self.resident:
+                self.resident.move_to_end(partition)
+                self.access_counts[partition] += 1
+            else:
+                self._charge(partition)
+
+    def resize(self, partition):
+        with self.lock:
+            self._charge(partition)
+            self.evict_if_needed(keep=partition)
+
+    def discard(self, partition):
+        with self.lock:
+            self.bytes_resident -= self.resident.pop(partition, 0)
+            self.access_counts.pop(partition, None)
+
+    def _charge(self, partition):
+        partition_bytes = partition.estimated_bytes()
+        self.bytes_resident += partition_bytes - self.resident.get(partition, 0)
+        self.resident[partition] = partition_bytes
+        self.resident.move_to_end(partition)
+        self.access_counts[partition] = self.access_counts.get(partition, 0) + 1
+
+    def evict_if_needed(self, keep=None):
+        skipped = set()
+        while self.bytes_resident > self.memory_budget_bytes:
+            candidates = (partition for partition in self.resident if partition is not keep and partition not in skipped)
+            if self.policy == 'lfu':
+                victim = min(candidates, key=lambda partition: self.access_counts[partition], default=None)
+            else:
+                victim = next(candidates, None)
+            if victim is None:
+                return
+            if not self.evict(victim):
+                skipped.add(victim)
+
+    def evict(self, partition) -> bool:
+        # Dirty partitions are written back first; one that cannot be written stays resident
+        if partition.is_dirty:
+            if not partition.write_file():
+                return False
+            self.write_backs += 1
+        partition.mark_unloaded(list(partition._data.keys()))
+        self.discard(partition)
+        self.evictions += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'policy': self.policy,
+            'memory_budget_bytes': self.memory_budget_bytes,
+            'bytes_resident': self.bytes_resident,
+            'partitions_resident': len(self.resident),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'write_backs': self.write_backs,
+        }
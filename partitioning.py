@@ -0,0 +1,244 @@
+import zlib
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+from query import make_test
+
+# Length of the ISO 8601 prefix each time bucket keeps: 2019, 2019-10, 2019-10-01, 2019-10-01T13
+TIME_UNITS = {'year': 4, 'month': 7, 'day': 10, 'hour': 13}
+
+
+class ValuePartitioner:
+    # One partition per distinct value. Every row of a partition has the value itself, so an index clause resolved
+    # against the partitions needs no row filter
+    strategy = 'value'
+    exact = True
+
+    def __init__(self, field: str):
+        self.field = field
+
+    def key(self, value):
+        return value
+
+    def label(self, key) -> str:
+        return f'{key}'
+
+    def matches(self, key, query_clause) -> bool:
+        return _key_matches(key, query_clause)
+
+    def spec(self):
+        return self.strategy
+
+
+class HashPartitioner:
+    # A fixed number of shards, however many distinct values there are; only equality clauses can prune
+    strategy = 'hash'
+    exact = False
+
+    def __init__(self, field: str, shards: int = 16):
+        if not isinstance(shards, int) or isinstance(shards, bool) or shards < 1:
+            raise ValueError(f"Hash partitioning of {field} needs a positive number of shards, got {shards}")
+        self.field = field
+        self.shards = shards
+
+    def key(self, value):
+        if value is None:
+            return None
+        # Equal values land in one shard whatever their type: 3, 3.0 and True == 1 are all numbers to a query
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, int):
+            return int(value) % self.shards
+        if isinstance(value, str):
+            return zlib.crc32(value.encode('utf-8')) % self.shards
+        return zlib.crc32(repr(value).encode('utf-8')) % self.shards
+
+    def label(self, key) -> str:
+        return 'none' if key is None else f'h{key}'
+
+    def matches(self, key, query_clause) -> bool:
+        for query_function, query_value in query_clause.items():
+            if query_function == '$eq':
+                if self._safe_key(query_value) != key:
+                    return False
+            elif query_function == '$in':
+                if key not in {self._safe_key(value) for value in query_value}:
+                    return False
+        return True
+
+    def _safe_key(self, value):
+        try:
+            return self.key(value)
+        except TypeError:
+            return None
+
+    def spec(self):
+        return {'strategy': self.strategy, 'shards': self.shards}
+
+
+class RangePartitioner:
+    # Buckets split at sorted boundaries: bucket 0 holds values below the first one, bucket i values from boundary i - 1
+    # up to boundary i. Range and equality clauses prune to the buckets they overlap
+    strategy = 'range'
+    exact = False
+
+    def __init__(self, field: str, boundaries: List[Any] = None):
+        boundaries = list(boundaries or [])
+        if not boundaries:
+            raise ValueError(f"Range partitioning of {field} needs at least one boundary")
+        try:
+            if any(lower >= upper for lower, upper in zip(boundaries, boundaries[1:])):
+                raise ValueError(f"Range partitioning boundaries of {field} must be strictly increasing")
+        except TypeError:
+            raise ValueError(f"Range partitioning boundaries of {field} must be comparable with each other")
+        self.field = field
+        self.boundaries = boundaries
+
+    def key(self, value):
+        if value is None:
+            return None
+        try:
+            return bisect_right(self.boundaries, value)
+        except TypeError:
+            raise ValueError(f"Value {value!r} of {self.field} cannot be placed in its range partitions")
+
+    def label(self, key) -> str:
+        return 'none' if key is None else f'r{key}'
+
+    def matches(self, key, query_clause) -> bool:
+        if key is None:
+            return _key_matches(None, query_clause)
+        lower = self.boundaries[key - 1] if key > 0 else None
+        upper = self.boundaries[key] if key < len(self.boundaries) else None
+        try:
+            for query_function, query_value in query_clause.items():
+                if query_function == '$eq':
+                    if query_value is None or self.key(query_value) != key:
+                        return False
+                elif query_function == '$in':
+                    if not any(value is not None and self.key(value) == key for value in query_value):
+                        return False
+                elif query_function in ('$gt', '$gte'):
+                    if upper is not None and upper <= query_value:
+                        return False
+                elif query_function == '$lt':
+                    if lower is not None and lower >= query_value:
+                        return False
+                elif query_function == '$lte':
+                    if lower is not None and lower > query_value:
+                        return False
+                elif query_function == '$between':
+                    if (upper is not None and upper <= query_value[0]) or (lower is not None and lower > query_value[1]):
+                        return False
+        except (TypeError, ValueError):
+            # Values the boundaries cannot be compared with are left for the row filter to reject
+            return True
+        return True
+
+    def spec(self):
+        return {'strategy': self.strategy, 'boundaries': self.boundaries}
+
+
+class TimePartitioner:
+    # Buckets by calendar unit over ISO 8601 strings (or dates and datetimes), keyed by the leading part they share,
+    # e.g. '2019-10' for months; those keys sort like the timestamps they cover, which is what prunes ranges
+    strategy = 'time'
+    exact = False
+
+    def __init__(self, field: str, unit: str = 'month'):
+        if unit not in TIME_UNITS:
+            raise ValueError(f"Unsupported time partitioning unit: {unit}, expected one of {', '.join(TIME_UNITS)}")
+        self.field = field
+        self.unit = unit
+        self.prefix_length = TIME_UNITS[unit]
+
+    def key(self, value):
+        if value is None:
+            return None
+        bucket = self._bucket(value)
+        if bucket is None:
+            raise ValueError(f"Value {value!r} of {self.field} is not a date or an ISO 8601 string")
+        return bucket
+
+    def _bucket(self, value) -> Optional[str]:
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        if not isinstance(value, str):
+            return None
+        return value[:self.prefix_length]
+
+    def label(self, key) -> str:
+        return 'none' if key is None else key.replace(':', '')
+
+    def matches(self, key, query_clause) -> bool:
+        if key is None:
+            return _key_matches(None, query_clause)
+        for query_function, query_value in query_clause.items():
+            if query_function == '$eq':
+                if self._bucket(query_value) != key:
+                    return False
+            elif query_function == '$in':
+                if key not in {self._bucket(value) for value in query_value}:
+                    return False
+            elif query_function in ('$gt', '$gte', '$lt', '$lte', '$between'):
+                bounds = query_value if query_function == '$between' else [query_value]
+                buckets = [self._bucket(bound) for bound in bounds]
+                if None in buckets:
+                    continue
+                if query_function in ('$gt', '$gte', '$between') and key < buckets[0]:
+                    return False
+                if query_function in ('$lt', '$lte', '$between') and key > buckets[-1]:
+                    return False
+        return True
+
+    def spec(self):
+        return {'strategy': self.strategy, 'unit': self.unit}
+
+
+def lookup_keys(partitioner, query_clause) -> Optional[set]:
+    # The partition keys an equality clause can be in, so pruning looks them up instead of testing every key
+    if '$eq' in query_clause:
+        values = [query_clause['$eq']]
+    elif '$in' in query_clause:
+        values = query_clause['$in']
+    else:
+        return None
+    try:
+        return {partitioner.key(value) for value in values}
+    except (TypeError, ValueError):
+        return None
+
+
+PARTITIONERS = {partitioner_class.strategy: partitioner_class for partitioner_class in (ValuePartitioner, HashPartitioner, RangePartitioner, TimePartitioner)}
+
+
+def _key_matches(key, query_clause) -> bool:
+    try:
+        return all(make_test(query_function, query_value)(key) for query_function, query_value in query_clause.items())
+    except TypeError:
+        # Range clauses against a missing (None) or differently typed value cannot match
+        return False
+
+
+def build_partitioner(field: str, spec=None):
+    # spec is a strategy name, or a dict with the strategy and its options:
+    # 'value', {'strategy': 'hash', 'shards': 16}, {'strategy': 'range', 'boundaries': [...]}, {'strategy': 'time', 'unit': 'month'}
+    if spec is None:
+        spec = 'value'
+    options = dict(spec) if isinstance(spec, dict) else {'strategy': spec}
+    strategy = options.pop('strategy', 'value')
+    partitioner_class = PARTITIONERS.get(strategy)
+    if partitioner_class is None:
+        raise ValueError(f"Unsupported partitioning strategy: {strategy}")
+    try:
+        return partitioner_class(field, **options)
+    except TypeError:
+        raise ValueError(f"Unsupported options for {strategy} partitioning of {field}: {', '.join(options)}")
+
+
+def build_partitioners(indices: List[str], partitioning: Dict[str, Any] = None) -> Dict[str, Any]:
+    # Fields are partitioned by value unless partitioning names another strategy; several fields make a composite
+    # partitioning, one partition per combination of their keys
+    partitioning = partitioning or {}
+    fields = list(dict.fromkeys(list(indices or []) + list(partitioning.keys())))
+    return {field: build_partitioner(field, partitioning.get(field)) for field in fields}
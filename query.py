@@ -0,0 +1,213 @@
+import operator
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
+
+# Rough share of rows each operator lets through, cheapest and most selective clauses run first
+OPERATOR_SELECTIVITY = {
+    '$eq': 0.01,
+    '$in': 0.05,
+    '$between': 0.2,
+    '$gt': 0.3,
+    '$gte': 0.3,
+    '$lt': 0.3,
+    '$lte': 0.3,
+    '$ne': 0.99,
+    '$nin': 0.95,
+}
+
+# Operands are bound first, so each comparison is flipped: `value > constant` becomes `lt(constant, value)`
+BOUND_OPERATORS = {
+    '$eq': operator.eq,
+    '$ne': operator.ne,
+    '$gt': operator.lt,
+    '$gte': operator.le,
+    '$lt': operator.gt,
+    '$lte': operator.ge,
+}
+
+PLAN_CACHE_SIZE = 256
+
+
+class CompiledPlan:
+    def __init__(self, shape: Tuple):
+        self.shape = shape
+        self.clauses: List[Tuple[str, str, Callable[[Dict[str, Any]], Any]]] = []
+        for query_field, query_functions in shape:
+            getter = make_getter(tuple(query_field.split('.')))
+            for query_function in query_functions:
+                if query_function not in OPERATOR_SELECTIVITY:
+                    raise ValueError(f"Unsupported query function: {query_function}")
+                self.clauses.append((query_field, query_function, getter))
+        self.clauses.sort(key=lambda clause: OPERATOR_SELECTIVITY[clause[1]])
+        self.hits = 0
+
+    def bind(self, query: Dict[str, Dict[str, Any]]) -> Callable[[Dict[str, Any]], bool]:
+        checks = [(getter, make_test(query_function, query[query_field][query_function]))
+                  for query_field, query_function, getter in self.clauses]
+
+        if len(checks) == 1:
+            return make_check(*checks[0])
+
+        def predicate(row):
+            # A range test on a missing or incomparable value raises TypeError, which fails that clause and with it
+            # the row, whichever order the clauses run in
+            try:
+                for getter, test in checks:
+                    if not test(getter(row)):
+                        return False
+            except TypeError:
+                return False
+            return True
+
+        return predicate
+
+    def bind_clauses(self, query: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str, Callable[[Dict[str, Any]], bool]]]:
+        return [(query_field, query_function, make_check(getter, make_test(query_function, query[query_field][query_function])))
+                for query_field, query_function, getter in self.clauses]
+
+
+def make_check(getter, test) -> Callable[[Dict[str, Any]], bool]:
+    def check(row):
+        try:
+            return test(getter(row))
+        except TypeError:
+            return False
+
+    return check
+
+
+def make_getter(key_parts: Tuple[str, ...]) -> Callable[[Dict[str, Any]], Any]:
+    if len(key_parts) == 1:
+        key = key_parts[0]
+        return lambda row: row.get(key)
+    if len(key_parts) == 2:
+        # One level of nesting, the common case for dotted fields, without the loop
+        outer_key, inner_key = key_parts
+
+        def nested_getter(row):
+            outer = row.get(outer_key)
+            return outer.get(inner_key) if isinstance(outer, dict) else None
+
+        return nested_getter
+
+    def getter(row):
+        current = row
+        for part in key_parts:
+            if not isinstance(current, dict):
+                return None
+            current = current.get(part)
+            if current is None:
+                return None
+        return current
+
+    return getter
+
+
+def make_test(query_function: str, query_value: Any) -> Callable[[Any], bool]:
+    if query_function in BOUND_OPERATORS:
+        return partial(BOUND_OPERATORS[query_function], query_value)
+    elif query_function == '$in':
+        return make_membership(query_value)
+    elif query_function == '$nin':
+        contains = make_membership(query_value)
+        return lambda field_value: not contains(field_value)
+    elif query_function == '$between':
+        lower, upper = query_value[0], query_value[1]
+        return lambda field_value: lower <= field_value <= upper
+    else:
+        raise ValueError(f"Unsupported query function: {query_function}")
+
+
+def make_membership(query_value) -> Callable[[Any], bool]:
+    values = list(query_value)
+    try:
+        hashed_values = frozenset(values)
+    except TypeError:
+        return values.__contains__
+
+    def contains(field_value):
+        try:
+            return field_value in hashed_values
+        except TypeError:
+            # Unhashable field values (lists, dicts) fall back to the equality scan a list gives
+            return field_value in values
+
+    return contains
+
+
+def copy_nested(value):
+    if type(value) is dict:
+        return {key: copy_nested(item) for key, item in value.items()}
+    if type(value) is list:
+        return [copy_nested(item) for item in value]
+    return value
+
+
+def compile_projection(fields: List[str], row_type: Callable = dict) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    # Dotted fields are rebuilt as nested dicts; fields missing from a row are left out. Plain dict rows get their own
+    # copies of nested dicts and lists, copy-on-write rows copy them when they are first read
+    copy_value = copy_nested if row_type is dict else None
+    if not any('.' in field for field in fields):
+        if copy_value is not None:
+            return lambda row: row_type({field: copy_value(row[field]) for field in fields if row.get(field) is not None})
+        return lambda row: row_type({field: row[field] for field in fields if row.get(field) is not None})
+
+    paths = [(tuple(field.split('.')), make_getter(tuple(field.split('.')))) for field in fields]
+
+    def project(row):
+        projected = row_type()
+        for key_parts, getter in paths:
+            value = getter(row)
+            if value is None:
+                continue
+            if copy_value is not None:
+                value = copy_value(value)
+            target = projected
+            for part in key_parts[:-1]:
+                target = target.setdefault(part, {})
+            target[key_parts[-1]] = value
+        return projected
+
+    return project
+
+
+_plan_cache: 'OrderedDict[Tuple, CompiledPlan]' = OrderedDict()
+plan_cache_stats = {'hits': 0, 'misses': 0}
+# Readers on several threads compile queries at once
+_plan_cache_lock = threading.Lock()
+
+
+def query_shape(query: Dict[str, Dict[str, Any]]) -> Tuple:
+    return tuple((query_field, tuple(query_clause.keys())) for query_field, query_clause in query.items() if query_clause)
+
+
+def compile_query(query: Dict[str, Dict[str, Any]]) -> Callable[[Dict[str, Any]], bool]:
+    shape = query_shape(query)
+    with _plan_cache_lock:
+        plan = _plan_cache.get(shape)
+        if plan is None:
+            plan_cache_stats['misses'] += 1
+            plan = CompiledPlan(shape)
+            _plan_cache[shape] = plan
+            if len(_plan_cache) > PLAN_CACHE_SIZE:
+                _plan_cache.popitem(last=False)
+        else:
+            plan_cache_stats['hits'] += 1
+            plan.hits += 1
+            _plan_cache.move_to_end(shape)
+    return plan.bind(query)
+
+
+def compile_clauses(query: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str, Callable[[Dict[str, Any]], bool]]]:
+    # The checks compile_query combines, one per clause and in the order it runs them; planned outside the cache
+    # so profiling a query does not count towards its hit rate
+    return CompiledPlan(query_shape(query)).bind_clauses(query)
+
+
+def clear_plan_cache():
+    with _plan_cache_lock:
+        _plan_cache.clear()
+        plan_cache_stats['hits'] = 0
+        plan_cache_stats['misses'] = 0
@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+
+def freeze(value):
+    # Hashable form of a normalized query; raises TypeError for values that cannot be part of a key
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted((key, freeze(item)) for key, item in value.items())))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    hash(value)
+    return value
+
+
+class Scan:
+    # The partitions one query read, at the versions they had when it ran
+    __slots__ = ('table', 'query', 'partition_versions', 'partitions_version', 'primary_key_partitions')
+
+    def __init__(self, table, query: Dict[str, Any]):
+        self.table = table
+        self.query = query
+        self.partition_versions = {partition.partition_name: partition.version for partition in table.plan_query(query)['partitions']}
+        self.partitions_version = table.partitions_version
+        # A primary key lookup skips the partitions its keys are not in, so a key inserted later must invalidate it
+        self.primary_key_partitions = {}
+        pk_clause = table.normalize_query(query or {}).get(table.primary_key) or {}
+        for row_pk in [pk_clause['$eq']] if '$eq' in pk_clause else pk_clause.get('$in', []):
+            self.primary_key_partitions[row_pk] = table.partition_name_by_primary_key.get(row_pk)
+
+    def is_valid(self) -> bool:
+        partitions_by_name = self.table.partitions_by_partition_name
+        for partition_name, version in self.partition_versions.items():
+            partition = partitions_by_name.get(partition_name)
+            if partition is None or partition.version != version:
+                return False
+        partition_name_by_primary_key = self.table.partition_name_by_primary_key
+        for row_pk, partition_name in self.primary_key_partitions.items():
+            if partition_name_by_primary_key.get(row_pk) != partition_name:
+                return False
+        if self.table.partitions_version != self.partitions_version:
+            # A partition created since only matters if the query would read it
+            partition_names = {partition.partition_name for partition in self.table.plan_query(self.query)['partitions']}
+            if partition_names != self.partition_versions.keys():
+                return False
+            self.partitions_version = self.table.partitions_version
+        return True
+
+
+class CacheEntry:
+    __slots__ = ('value', 'scans', 'row_count')
+
+    def __init__(self, value, scans: List[Scan], row_count: int):
+        self.value = value
+        self.scans = scans
+        self.row_count = row_count
+
+
+class ResultCache:
+    def __init__(self, max_rows: int):
+        self.max_rows = max_rows
+        # Results in recency order; an entry is checked against partition versions when it is looked up
+        self.entries: 'OrderedDict[Any, CacheEntry]' = OrderedDict()
+        self.rows_cached = 0
+        self.evictions = 0
+        self.counts_by_table: Dict[str, Dict[str, int]] = {}
+        # Readers on several threads share the cache; each thread records the scans of its own joins
+        self.lock = threading.RLock()
+        self.local = threading.local()
+
+    @property
+    def recorders(self) -> List[List[Scan]]:
+        recorders = getattr(self.local, 'recorders', None)
+        if recorders is None:
+            recorders = self.local.recorders = []
+        return recorders
+
+    def get(self, table_name: str, key):
+        with self.lock:
+            counts = self._counts(table_name)
+            entry = self.entries.get(key)
+            if entry is not None and not all(scan.is_valid() for scan in entry.scans):
+                self._remove(key)
+                counts['invalidations'] += 1
+                entry = None
+            if entry is None:
+                counts['misses'] += 1
+                return None
+
+            counts['hits'] += 1
+            self.entries.move_to_end(key)
+        for recorder in self.recorders:
+            recorder.extend(entry.scans)
+        return entry.value
+
+    def scan(self, table, query: Dict[str, Any]) -> Scan:
+        # Taken before the query runs, so a write made while it runs leaves the entry stale rather than wrong
+        scan = Scan(table, query)
+        for recorder in self.recorders:
+            recorder.append(scan)
+        return scan
+
+    @contextmanager
+    def recording(self):
+        # Collects the scans of every find made inside, for results such as joins that are built from several
+        recorder: List[Scan] = []
+        self.recorders.append(recorder)
+        try:
+            yield recorder
+        finally:
+            self.recorders.remove(recorder)
+
+    def put(self, key, value, scans: List[Scan], row_count: int):
+        if row_count > self.max_rows:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = CacheEntry(value, scans, row_count)
+            self.rows_cached += row_count
+            while self.rows_cached > self.max_rows:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.rows_cached -= self.entries.pop(key).row_count
+
+    def _counts(self, table_name: str) -> Dict[str, int]:
+        counts = self.counts_by_table.get(table_name)
+        if counts is None:
+            counts = self.counts_by_table[table_name] = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        return counts
+
+    def table_stats(self, table_name: str) -> Dict[str, Any]:
+        counts = self._counts(table_name)
+        lookups = counts['hits'] + counts['misses']
+        return {**counts, 'hit_rate': counts['hits'] / lookups if lookups else 0.0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'max_rows': self.max_rows,
+                'rows_cached': self.rows_cached,
+                'entries': len(self.entries),
+                'evictions': self.evictions,
+                'tables': {table_name: self.table_stats(table_name) for table_name in list(self.counts_by_table)},
+            }
@@ -0,0 +1,97 @@
+from typing import Any, Dict, List, Optional
+
+
+class Results(list):
+    def first(self) -> Optional[Dict[str, Any]]:
+        return self[0] if self else None
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+
+class CopyOnWriteRow(dict):
+    # Shallow copy of a stored row: nested dicts and lists are copied the first time they are read, so callers can
+    # mutate a result freely while the partition keeps the original, without paying for a deep copy up front.
+    # Copied containers are CopyOnWriteRow/OwnedList, which is how a value already owned by this row is recognised.
+    # Overriding __iter__ keeps dict(row), {**row} and update(row) off dict's storage-copying fast path, so they read
+    # through __getitem__ as well.
+    __slots__ = ()
+
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def _own(self, key, value):
+        if type(value) is dict or type(value) is list:
+            value = own_value(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __getitem__(self, key):
+        return self._own(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        return self._own(key, dict.__getitem__(self, key)) if key in self else default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            dict.__delitem__(self, key)
+            return value
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def copy(self) -> 'CopyOnWriteRow':
+        return fork_row(self)
+
+    def __copy__(self) -> 'CopyOnWriteRow':
+        return fork_row(self)
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        merged = dict(self)
+        merged.update(other)
+        return merged
+
+    def __reduce__(self):
+        return CopyOnWriteRow, (dict(self),)
+
+
+class OwnedList(list):
+    __slots__ = ()
+
+
+def own_value(value):
+    if type(value) is dict:
+        return CopyOnWriteRow(value)
+    return OwnedList(own_value(item) if type(item) is dict or type(item) is list else item for item in value)
+
+
+def fork_row(row: CopyOnWriteRow) -> CopyOnWriteRow:
+    # Joined rows nest other copy-on-write rows, and values this row already copied count as owned, so each of them
+    # gets its own copy rather than being shared with the fork. The rest is taken from storage as it is, not read
+    # through __getitem__, so forking never copies values on the original's behalf
+    forked = CopyOnWriteRow(dict.items(row))
+    for key, value in dict.items(row):
+        if type(value) is CopyOnWriteRow:
+            dict.__setitem__(forked, key, fork_row(value))
+        elif type(value) is OwnedList or (type(value) is list and any(type(item) is CopyOnWriteRow for item in value)):
+            dict.__setitem__(forked, key, [fork_row(item) if type(item) is CopyOnWriteRow else _fork_item(item) for item in value])
+    return forked
+
+
+def _fork_item(item):
+    if type(item) is OwnedList:
+        return [fork_row(value) if type(value) is CopyOnWriteRow else _fork_item(value) for value in item]
+    return item
@@ -1,114 +1,596 @@
 import json
 import os
 import asyncio
-from typing import Any, Dict, List, Optional
+import threading
+from collections import deque
+from itertools import islice
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional
 
 # Assuming partition.py and results.py exist with Partition and Results classes respectively
+from aggregate import aggregate_rows, finalize_partial, merge_partials, metadata_answerable, parse_metrics, partition_metadata_partial
+from columnar import columnar_available
+from concurrency import ReadWriteLock
+from flush import default_pipeline
+from indexes import build_index
+from instrumentation import clause_profiles, clause_stats, emit, filter_clauses, iter_filter_clauses, sinks
+from parallel_scan import parallel_aggregate, parallel_scan
 from partition import Partition
-from results import Results
-from utils import get_from_dict, partition_name_from_partition_index
+from partitioning import build_partitioners, lookup_keys
+from query import OPERATOR_SELECTIVITY, compile_projection, compile_query, make_getter
+from result_cache import freeze
+from results import CopyOnWriteRow, Results
+from utils import get_from_dict, partition_name_from_partition_index, typed_partition_keys, write_file_atomic
+from wal import WriteAheadLog
 
 class Table:
-    def __init__(self, table_name: str, indices: List[str], storage_location: str, primary_key: str, proto: Any, delete_key_list: List[str], do_compression: bool):
+    def __init__(self, table_name: str, indices: List[str], storage_location: str, dbname: str, primary_key: str, proto: Any, delete_key_list: List[str], do_compression: bool, secondary_indices: Dict[str, str] = None, use_write_ahead_log: bool = False, storage_format: str = 'json', partition_cache=None, parallel_workers: int = None, flush_pipeline=None, columnar: bool = False, result_cache=None, fsync_writes: bool = False, lock: ReadWriteLock = None, partitioning: Dict[str, Any] = None):
         self.table_name = table_name
-        self.indices = indices or []
+        self.dbname = dbname
+        # How each partition field maps a row's value to its partition, by value unless partitioning says otherwise
+        self.partitioners = build_partitioners(indices, partitioning)
+        self.indices = list(self.partitioners)
         self.primary_key = primary_key
         self.proto = proto
         self.partitions_by_partition_name: Dict[str, Partition] = {}
         self.partition_name_by_primary_key: Dict[str, str] = {}
+        self.partition_names_by_index_value: Dict[str, Dict[Any, Dict[str, None]]] = {}
         self.delete_key_list = delete_key_list or []
         self.do_compression = do_compression or False
         self.storage_location = f"{storage_location}/{table_name}"
         self.output_file_path = f"{self.storage_location}/_{table_name}.json"
         self.table_connections: Dict[str, Dict[str, str]] = {}
+        self.secondary_indices: Dict[str, Any] = {field: build_index(field, index_type) for field, index_type in (secondary_indices or {}).items()}
+        self.use_write_ahead_log = use_write_ahead_log or False
+        self.storage_format = storage_format or 'json'
+        self.wal = WriteAheadLog(f"{self.storage_location}/_{table_name}.wal")
+        # Writers append on any thread while a save drains from the left, so no record is lost to a swapped list
+        self.pending_log_records: deque = deque()
+        self.compaction_threshold_bytes = 64 * 1024 * 1024
+        self.compaction_task: Optional[asyncio.Task] = None
+        self.persist_lock = asyncio.Lock()
+        # Settings as the manifest on disk has them, so log-only saves know when to rewrite it
+        self.saved_manifest_settings: Optional[Dict[str, Any]] = None
+        self.secondary_indices_stale = False
+        self.partition_cache = partition_cache
+        self.parallel_workers = parallel_workers or 0
+        self.parallel_min_rows = 100_000
+        self.flush_pipeline = flush_pipeline
+        if columnar and not columnar_available():
+            print(f"NumPy is not installed, table {table_name} filters rows without columnar storage")
+        self.columnar = bool(columnar) and columnar_available()
+        self.join_views: List[Any] = []
+        self.result_cache = result_cache
+        # Bumped whenever a partition is added or dropped, so cached results can tell if their query would read a new one
+        self.partitions_version = 0
+        self.fsync_writes = fsync_writes
+        # Readers share it and writers take it alone; a database passes one lock to all its tables
+        self.lock = lock or ReadWriteLock()
+        self.index_lock = threading.Lock()
+        # Primary keys written while repartition() regroups the rows, re-applied to the new layout before it is swapped in
+        self.repartition_changes: Optional[Dict[Any, None]] = None
 
     async def output_to_file(self):
+        # With a write-ahead log only the delta since the last save is appended, the snapshot is rewritten by compact()
+        if self.use_write_ahead_log and os.path.exists(self.output_file_path):
+            await self.append_to_log()
+            await self._write_manifest_settings()
+        else:
+            await self.compact()
+
+    async def append_to_log(self) -> bool:
+        async with self.persist_lock:
+            records = [self.pending_log_records.popleft() for _ in range(len(self.pending_log_records))]
+            try:
+                self.wal.append(records)
+            except Exception as error:
+                print(f"Error appending to write-ahead log: {error}")
+                self.pending_log_records.extendleft(reversed(records))
+                return False
+
+        if self.wal.size() >= self.compaction_threshold_bytes and (self.compaction_task is None or self.compaction_task.done()):
+            self.compaction_task = asyncio.ensure_future(self.compact())
+        return True
+
+    async def compact(self) -> bool:
+        async with self.persist_lock:
+            snapshot_record_count = len(self.pending_log_records)
+            if not await self._write_snapshot():
+                return False
+            self.wal.truncate()
+            # Replay is idempotent, so records logged while the snapshot was written can safely stay pending
+            for _ in range(snapshot_record_count):
+                self.pending_log_records.popleft()
+            return True
+
+    def _manifest_settings(self) -> Dict[str, Any]:
+        # The parts of the manifest that do not describe the partition files, so they can change between snapshots
+        return {
+            "table_connections": self.table_connections,
+            "secondary_indices": {field: index.index_type for field, index in self.secondary_indices.items()},
+        }
+
+    async def _write_manifest_settings(self):
+        # A log append leaves the partition list as of the last snapshot, but a secondary index or connection added
+        # since then is written to the manifest now rather than lost on restart until the next compaction
+        async with self.persist_lock:
+            with self.lock.reading:
+                settings = json.loads(json.dumps(self._manifest_settings()))
+            if settings == self.saved_manifest_settings:
+                return
+            try:
+                with open(self.output_file_path, 'r') as f:
+                    output_data = {**json.load(f), **settings}
+                write_file_atomic(self.output_file_path, json.dumps(output_data, indent=2).encode('utf-8'), self.fsync_writes)
+                self.saved_manifest_settings = settings
+            except Exception as error:
+                print(f"Error writing manifest: {error}")
+
+    async def _write_snapshot(self) -> bool:
         try:
-            partitions = self.find_partitions()
-            output_data = {
-                "table_name": self.table_name,
-                "indices": self.indices,
-                "primary_key": self.primary_key,
-                "partition_names": list(self.partitions_by_partition_name.keys()),
-                "output_file_path": self.output_file_path,
-                "storage_location": self.storage_location,
-                "table_connections": self.table_connections,
-                "do_compression": self.do_compression,
-            }
-            data = json.dumps(output_data, indent=2)
+            with self.lock.reading:
+                partitions = self.find_partitions()
+                output_data = {
+                    "table_name": self.table_name,
+                    "indices": self.indices,
+                    "partitioning": self.partitioning(),
+                    "primary_key": self.primary_key,
+                    "partition_names": list(self.partitions_by_partition_name.keys()),
+                    "partitions": {partition_name: {"partition_indices": partition.partition_indices, "row_count": partition.row_count()} for partition_name, partition in self.partitions_by_partition_name.items()},
+                    "output_file_path": self.output_file_path,
+                    "storage_location": self.storage_location,
+                    "do_compression": self.do_compression,
+                    "use_write_ahead_log": self.use_write_ahead_log,
+                    "storage_format": self.storage_format,
+                    **self._manifest_settings(),
+                }
+                data = json.dumps(output_data, indent=2)
+                settings = json.loads(data)
 
             os.makedirs(os.path.dirname(self.output_file_path), exist_ok=True)
 
-            write_promises = [partition.write_to_file() for partition in partitions]  # Assuming Partition has write_to_file method
-            await asyncio.gather(*write_promises)
+            await (self.flush_pipeline or default_pipeline()).flush(partitions)
 
-            with open(self.output_file_path, 'w') as f:
-                f.write(data)
+            write_file_atomic(self.output_file_path, data.encode('utf-8'), self.fsync_writes)
+            self.saved_manifest_settings = {key: settings[key] for key in self._manifest_settings()}
+            return not any(partition.is_dirty for partition in partitions)
         except Exception as error:
             print(f"Error in output_to_file: {error}")
+            return False
 
-    async def read_from_file(self):
+    async def read_from_file(self, lazy: bool = False):
         try:
             with open(self.output_file_path, 'r') as f:
                 parsed_data = json.load(f)
 
             self.table_name = parsed_data['table_name']
-            self.indices = parsed_data['indices']
+            self.partitioners = build_partitioners(parsed_data['indices'], parsed_data.get('partitioning'))
+            self.indices = list(self.partitioners)
             self.primary_key = parsed_data['primary_key']
             self.storage_location = parsed_data['storage_location']
             self.table_connections = parsed_data['table_connections']
             self.do_compression = parsed_data['do_compression']
+            self.use_write_ahead_log = parsed_data.get('use_write_ahead_log', False)
+            self.storage_format = parsed_data.get('storage_format', 'json')
+            self.saved_manifest_settings = {'table_connections': parsed_data['table_connections'], 'secondary_indices': parsed_data.get('secondary_indices', {})}
 
-            partition_read_promises = [self._read_partition(partition_name) for partition_name in parsed_data['partition_names']]  # Assuming _read_partition method
-            await asyncio.gather(*partition_read_promises)
+            # Lazy opens need the per-partition metadata that older manifests do not have
+            partitions_info = parsed_data.get('partitions')
+            if lazy and partitions_info is not None:
+                for partition_name in parsed_data['partition_names']:
+                    self._read_partition_stub(partition_name, partitions_info[partition_name]['partition_indices'])
+            else:
+                partition_read_promises = [self._read_partition(partition_name) for partition_name in parsed_data['partition_names']]
+                await asyncio.gather(*partition_read_promises)
+
+            with self.lock.writing:
+                self._regroup_stray_rows()
+                for field, index_type in parsed_data.get('secondary_indices', {}).items():
+                    self.secondary_indices[field] = build_index(field, index_type)
+                if lazy:
+                    self.secondary_indices_stale = bool(self.secondary_indices)
+                else:
+                    self._rebuild_secondary_indices()
+                self._replay_log()
         except FileNotFoundError:
             pass  # Handle error or log as needed
 
+    async def convert_storage_format(self, storage_format: str):
+        old_file_paths = [partition.output_file_path() for partition in self.partitions_by_partition_name.values()]
+        with self.lock.writing:
+            self.storage_format = storage_format
+            for partition in self.partitions_by_partition_name.values():
+                if not partition.is_loaded:
+                    partition.load()
+                partition.storage_format = storage_format
+                partition.is_dirty = True
+
+        # Old files are only removed once the new snapshot and manifest are written
+        await self.compact()
+        for old_file_path in old_file_paths:
+            if old_file_path not in (partition.output_file_path() for partition in self.partitions_by_partition_name.values()):
+                try:
+                    os.remove(old_file_path)
+                except FileNotFoundError:
+                    pass
+
+    async def repartition(self, indices: List[str], partitioning: Dict[str, Any] = None):
+        # Online: the rows are regrouped from pinned snapshots of the current partitions while reads and writes go on.
+        # Writes made meanwhile are re-applied to the new layout under the write lock, which then swaps it in, so readers
+        # see either layout whole and never wait for more than that last step
+        partitioners = build_partitioners(indices, partitioning)
+        with self.lock.writing:
+            if self.repartition_changes is not None:
+                raise ValueError(f"Table {self.table_name} is already being repartitioned")
+            self.repartition_changes = {}
+            pinned = [(partition, *partition.pin()) for partition in self.find_partitions()]
+
+        new_partitions: Dict[str, Partition] = {}
+        new_partition_name_by_primary_key: Dict[Any, str] = {}
+        try:
+            for partition, rows, pins in pinned:
+                try:
+                    self._add_to_layout(new_partitions, new_partition_name_by_primary_key, partitioners, list(rows.keys()), list(rows.values()))
+                finally:
+                    partition.unpin(pins)
+                await asyncio.sleep(0)
+
+            with self.lock.writing:
+                changed_primary_keys = list(self.repartition_changes)
+                for row_pk in changed_primary_keys:
+                    partition_name = new_partition_name_by_primary_key.pop(row_pk, None)
+                    if partition_name is not None:
+                        new_partitions[partition_name].remove_row(row_pk)
+                current_rows = self.get_rows(changed_primary_keys)
+                self._add_to_layout(new_partitions, new_partition_name_by_primary_key, partitioners, list(current_rows.keys()), list(current_rows.values()))
+                old_partitions = self._swap_layout(partitioners, new_partitions, new_partition_name_by_primary_key)
+        finally:
+            self.repartition_changes = None
+
+        # Only a table that was saved before is rewritten, and an old file goes once the manifest on disk no longer lists it
+        if os.path.exists(self.output_file_path):
+            await self.compact()
+            try:
+                with open(self.output_file_path, 'r') as f:
+                    saved_partition_names = set(json.load(f)['partition_names'])
+            except Exception as error:
+                print(f"Error reading manifest after repartition: {error}")
+                return
+            for partition in old_partitions:
+                if partition.partition_name not in saved_partition_names and os.path.exists(partition.output_file_path()):
+                    await partition.delete_file()
+
+    def _add_to_layout(self, new_partitions, new_partition_name_by_primary_key, partitioners, primary_keys, rows):
+        for partition_name, (partition_indices, rows_by_pk) in self._group_rows_by_partition(rows, primary_keys, partitioners, new_partitions).items():
+            partition = new_partitions.get(partition_name)
+            if partition is None:
+                partition = new_partitions[partition_name] = self._create_partition(partition_name, partition_indices)
+                # Kept out of the partition cache until swapped in, so it is never evicted to a file under a live name
+                partition.cache = None
+            partition.insert_rows(rows_by_pk)
+            new_partition_name_by_primary_key.update(dict.fromkeys(rows_by_pk, partition_name))
+
+    def _swap_layout(self, partitioners, new_partitions, new_partition_name_by_primary_key):
+        # Rows, secondary indexes and join views are unchanged; only the partitions holding the rows are replaced
+        old_partitions = self.find_partitions()
+        if self.partition_cache is not None:
+            for partition in old_partitions:
+                self.partition_cache.discard(partition)
+        self.partitioners = partitioners
+        self.indices = list(partitioners)
+        self.partitions_by_partition_name.clear()
+        self.partition_name_by_primary_key.clear()
+        self.partition_names_by_index_value.clear()
+        for partition_name, partition in new_partitions.items():
+            if not partition.row_count():
+                continue
+            self.partitions_by_partition_name[partition_name] = partition
+            self._register_partition(partition)
+            if self.partition_cache is not None:
+                partition.cache = self.partition_cache
+                self.partition_cache.add(partition)
+        self.partition_name_by_primary_key.update(new_partition_name_by_primary_key)
+        self.partitions_version += 1
+        return old_partitions
+
+    def _track_changes(self, primary_keys):
+        if self.repartition_changes is not None:
+            self.repartition_changes.update(dict.fromkeys(primary_keys))
+
+    def _replay_log(self):
+        for record in self.wal.read():
+            row_pk = get_from_dict(record['row'], self.primary_key) if 'row' in record else record.get('primary_key')
+            # Records may already be part of the snapshot when a compaction was interrupted, so each one overwrites
+            if record['op'] in ('insert', 'update', 'upsert', 'delete') and row_pk in self.partition_name_by_primary_key:
+                self._remove_row(row_pk)
+            if record['op'] in ('insert', 'update', 'upsert'):
+                self._insert_rows([record['row']])
+            elif record['op'] == 'clear':
+                self._clear_rows()
+
+    def _encode_log(self, records: List[Dict[str, Any]]) -> List[bytes]:
+        # Writes encode their records before changing anything, so a record that cannot be logged rejects the whole write
+        if not self.use_write_ahead_log:
+            return []
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.wal.encode(record))
+            except (TypeError, ValueError) as error:
+                raise ValueError(f"Cannot write {record['op']} to the write-ahead log of table {self.table_name}: {error}")
+        return lines
+
+    def _log(self, lines: List[bytes]):
+        self.pending_log_records.extend(lines)
+
     async def _read_partition(self, partition_name: str):
-        partition = Partition(...)  # Instantiate Partition with appropriate arguments
-        await partition.read_from_file()  # Assuming Partition has read_from_file method
+        partition = self._create_partition(partition_name, {})
+        await partition.read_from_file()
+        partition.is_dirty = False
+        with self.lock.writing:
+            self.partitions_by_partition_name[partition_name] = partition
+            self._register_partition(partition)
+            for row_pk in partition.data.keys():
+                self.partition_name_by_primary_key[row_pk] = partition_name
+        if self.partition_cache is not None:
+            self.partition_cache.add(partition)
+
+    def _create_partition(self, partition_name: str, partition_indices: Dict[str, Any]) -> Partition:
+        partition = Partition(self.storage_location, partition_indices, self.primary_key, self.proto, self.do_compression, partition_name, self.storage_format)
+        partition.cache = self.partition_cache
+        partition.fsync = self.fsync_writes
+        partition.lock = self.lock
+        return partition
+
+    def _read_partition_stub(self, partition_name: str, partition_indices: Dict[str, Any]):
+        partition = self._create_partition(partition_name, partition_indices)
+        try:
+            primary_keys = partition.read_primary_keys()
+        except FileNotFoundError:
+            primary_keys = None
+        if primary_keys is None:
+            # Partitions saved before key lists existed, or whose key list is out of date, are loaded eagerly instead
+            partition.load()
+            primary_keys = list(partition.data.keys())
+            if self.partition_cache is not None:
+                self.partition_cache.add(partition)
+        else:
+            partition.mark_unloaded(primary_keys)
+        partition.is_dirty = False
         self.partitions_by_partition_name[partition_name] = partition
-        # Additional logic to update partition_name_by_primary_key
+        self._register_partition(partition)
+        for row_pk in primary_keys:
+            self.partition_name_by_primary_key[row_pk] = partition_name
+
+    def _register_partition(self, partition: Partition):
+        self.partitions_version += 1
+        for index_name in self.indices:
+            index_value = partition.partition_indices.get(index_name)
+            partition_names = self.partition_names_by_index_value.setdefault(index_name, {}).setdefault(index_value, {})
+            partition_names[partition.partition_name] = None
+
+    def add_secondary_index(self, field: str, index_type: str = 'hash'):
+        with self.lock.writing:
+            self.secondary_indices[field] = build_index(field, index_type)
+            self._rebuild_secondary_indices([field])
+        return self.secondary_indices[field]
+
+    def _rebuild_secondary_indices(self, fields: List[str] = None):
+        with self.index_lock:
+            self._swap_in_secondary_indices(fields)
 
-    # Further methods like insert, update, delete, clear, etc., need to be defined here
-    # These methods will include the logic similar to the TypeScript version
+    def _ensure_secondary_indices(self):
+        # Lazily opened tables build their secondary indexes the first time a query can use one, which readers on
+        # other threads may be doing at the same moment
+        if self.secondary_indices_stale:
+            with self.index_lock:
+                if self.secondary_indices_stale:
+                    self._swap_in_secondary_indices()
+
+    def _swap_in_secondary_indices(self, fields: List[str] = None):
+        if not self.secondary_indices:
+            return
+        rows_by_pk = {row_pk: row for partition in self.partitions_by_partition_name.values() for row_pk, row in partition.data.items()}
+        fresh_indices = {}
+        for field in fields or list(self.secondary_indices.keys()):
+            index = build_index(field, self.secondary_indices[field].index_type)
+            if hasattr(index, 'build'):
+                index.build(rows_by_pk)
+            else:
+                for row_pk, row in rows_by_pk.items():
+                    index.add(row_pk, row)
+            fresh_indices[field] = index
+        # Readers never see a half-built index: the new ones replace the old whole, and only then is the flag cleared
+        self.secondary_indices = {**self.secondary_indices, **fresh_indices}
+        if fields is None:
+            self.secondary_indices_stale = False
+
+    def _index_rows(self, rows_by_pk):
+        if self.secondary_indices_stale:
+            return
+        for index in self.secondary_indices.values():
+            index.add_many(rows_by_pk)
+
+    def _unindex_row(self, row_pk, row):
+        if self.secondary_indices_stale:
+            return
+        for index in self.secondary_indices.values():
+            index.remove(row_pk, row)
+
+    def _unindex_rows(self, rows_by_pk):
+        if self.secondary_indices_stale or not rows_by_pk:
+            return
+        for index in self.secondary_indices.values():
+            index.remove_many(rows_by_pk)
 
     def insert(self, data):
         if not isinstance(data, list):
             data = [data]
 
         data = self.cleanse_before_alter(data)
+        with self.lock.writing:
+            self._insert_rows(data, 'insert')
 
-        for row in data:
-            row_pk = get_from_dict(row, self.primary_key)
-            partition_indices = {index_name: get_from_dict(row, index_name) for index_name in self.indices}
-            partition_name = partition_name_from_partition_index(partition_indices)
-            self.partition_name_by_primary_key[row_pk] = partition_name
+    def upsert(self, data):
+        if not isinstance(data, list):
+            data = [data]
+
+        data = self.cleanse_before_alter(data)
+        with self.lock.writing:
+            self._insert_rows(data, 'upsert', replace=True)
 
-            if partition_name not in self.partitions_by_partition_name:
-                self.partitions_by_partition_name[partition_name] = Partition(...)  # Instantiate with appropriate arguments
+    def _insert_rows(self, data, log_op: str = None, replace: bool = False):
+        # Everything that can reject the batch (primary keys, partition routing, log records) runs before anything changes, and
+        # index keys cannot fail, so a rejected upsert leaves the rows it would have replaced in place
+        primary_keys = self._batch_primary_keys(data)
+        if not replace:
+            for row_pk in primary_keys:
+                if row_pk in self.partition_name_by_primary_key:
+                    raise ValueError(f"Duplicate primary key value: {row_pk} for field {self.primary_key} in table {self.table_name}")
+        groups = self._group_rows_by_partition(data, primary_keys)
+        log_lines = self._encode_log([{'op': log_op, 'row': row} for row in data]) if log_op else []
+        if replace:
+            self._remove_rows([row_pk for row_pk in primary_keys if row_pk in self.partition_name_by_primary_key])
 
-            self.partitions_by_partition_name[partition_name].insert(row)  # Assuming Partition has an insert method
+        self._place_rows(groups)
+        self._index_rows(dict(zip(primary_keys, data)))
+        self._track_changes(primary_keys)
+        self._notify_join_views(primary_keys)
+        self._log(log_lines)
+
+    def _place_rows(self, groups):
+        for partition_name, (partition_indices, rows_by_pk) in groups.items():
+            partition = self.partitions_by_partition_name.get(partition_name)
+            if partition is None:
+                partition = self._create_partition(partition_name, partition_indices)
+                self.partitions_by_partition_name[partition_name] = partition
+                self._register_partition(partition)
+                if self.partition_cache is not None:
+                    self.partition_cache.add(partition)
+
+            partition.insert_rows(rows_by_pk)
+            self.partition_name_by_primary_key.update(dict.fromkeys(rows_by_pk, partition_name))
+
+    def _regroup_stray_rows(self):
+        # Files saved before partition names were kept apart can hold rows of several keys that format to one name
+        # (team 1 and team '1'). Pruning finds a partition by its own keys only, so rows of other keys are moved to
+        # the partitions they belong in when the files are read, and saved there next time
+        key_getters = [self._partition_key_getter(partitioner) for partitioner in self.partitioners.values()]
+        if not key_getters:
+            return
+        stray_rows = {}
+        for partition in self.find_partitions():
+            if not partition.is_loaded or not isinstance(partition.data, dict):
+                continue
+            expected_keys = typed_partition_keys(tuple((partition.partition_indices or {}).get(field) for field in self.partitioners))
+            for row_pk, row in partition.data.items():
+                if typed_partition_keys(tuple(getter(row) for getter in key_getters)) != expected_keys:
+                    stray_rows[row_pk] = partition
+        if not stray_rows:
+            return
+        rows = [stray_rows[row_pk].remove_row(row_pk) for row_pk in stray_rows]
+        for row_pk in stray_rows:
+            del self.partition_name_by_primary_key[row_pk]
+        self._place_rows(self._group_rows_by_partition(rows, list(stray_rows)))
+
+    def _batch_primary_keys(self, data):
+        get_primary_key = make_getter(tuple(self.primary_key.split('.')))
+        primary_keys = [get_primary_key(row) for row in data]
+        if None in primary_keys:
+            raise ValueError(f"Primary key value missing in the data row. Cannot insert into table {self.table_name} with primary key {self.primary_key}")
+        if len(set(primary_keys)) != len(primary_keys):
+            seen = set()
+            duplicate_pk = next(row_pk for row_pk in primary_keys if row_pk in seen or seen.add(row_pk))
+            raise ValueError(f"Duplicate primary key value: {duplicate_pk} for field {self.primary_key} within one batch for table {self.table_name}")
+        return primary_keys
+
+    def _group_rows_by_partition(self, data, primary_keys, partitioners=None, partitions=None):
+        partitioners = partitioners or self.partitioners
+        partitions = self.partitions_by_partition_name if partitions is None else partitions
+        key_getters = [self._partition_key_getter(partitioner) for partitioner in partitioners.values()]
+        partition_names_by_keys = {}
+        groups = {}
+        for row_pk, row in zip(primary_keys, data):
+            partition_keys = tuple(getter(row) for getter in key_getters)
+            # Keyed by type as well, since 1, True and 1.0 are one dict key but may name different partitions
+            typed_keys = typed_partition_keys(partition_keys)
+            partition_name = partition_names_by_keys.get(typed_keys)
+            if partition_name is None:
+                partition_indices = dict(zip(partitioners, partition_keys))
+                partition_name = self._free_partition_name(partitioners, partition_indices, typed_keys, partitions, groups)
+                partition_names_by_keys[typed_keys] = partition_name
+                if partition_name not in groups:
+                    groups[partition_name] = (partition_indices, {})
+            groups[partition_name][1][row_pk] = row
+        return groups
+
+    def _free_partition_name(self, partitioners, partition_indices, typed_keys, partitions, groups):
+        # Different keys can format to one name (team 1 and team '1' are both team_1); the later one gets a numbered
+        # name, so a partition only ever holds rows of its own keys
+        base_name = self._partition_name(partitioners, partition_indices)
+        partition_name = base_name
+        suffix = 1
+        while True:
+            if partition_name in groups:
+                taken_indices = groups[partition_name][0]
+            elif partition_name in partitions:
+                taken_indices = partitions[partition_name].partition_indices or {}
+            else:
+                return partition_name
+            if typed_partition_keys(tuple(taken_indices.get(field) for field in partitioners)) == typed_keys:
+                return partition_name
+            suffix += 1
+            partition_name = f'{base_name}_{suffix}'
+
+    def _partition_key_getter(self, partitioner):
+        getter = make_getter(tuple(partitioner.field.split('.')))
+        if partitioner.exact:
+            return getter
+        key = partitioner.key
+        return lambda row: key(getter(row))
+
+    def _partition_name(self, partitioners, partition_indices):
+        # Value partitions keep the names they always had; other strategies name their buckets, e.g. user_id_h3
+        if all(partitioner.exact for partitioner in partitioners.values()):
+            return partition_name_from_partition_index(partition_indices)
+        return '_'.join(f'{field}_{partitioners[field].label(key)}' for field, key in partition_indices.items()) or 'default'
+
+    def partitioning(self) -> Dict[str, Any]:
+        return {field: partitioner.spec() for field, partitioner in self.partitioners.items()}
+
+    def _remove_row(self, row_pk):
+        partition = self.partitions_by_partition_name[self.partition_name_by_primary_key.pop(row_pk)]
+        row = partition.remove_row(row_pk)
+        self._unindex_row(row_pk, row)
+        self._track_changes([row_pk])
+        self._notify_join_views([row_pk])
+        return row
+
+    def _remove_rows(self, primary_keys):
+        removed_rows = {}
+        for row_pk in primary_keys:
+            partition = self.partitions_by_partition_name[self.partition_name_by_primary_key.pop(row_pk)]
+            removed_rows[row_pk] = partition.remove_row(row_pk)
+        self._unindex_rows(removed_rows)
+        self._track_changes(removed_rows)
 
     def update(self, data):
         if not isinstance(data, list):
             data = [data]
 
         data = self.cleanse_before_alter(data)
+        with self.lock.writing:
+            for row_pk in self._batch_primary_keys(data):
+                if row_pk not in self.partition_name_by_primary_key:
+                    raise ValueError(f"Row with primary key {row_pk} does not exist and cannot be updated.")
 
-        for row in data:
-            row_pk = get_from_dict(row, self.primary_key)
-            existing_partition_name = self.partition_name_by_primary_key.get(row_pk)
-            if not existing_partition_name:
-                raise ValueError(f"Row with primary key {row_pk} does not exist and cannot be updated.")
-
-            self.partitions_by_partition_name[existing_partition_name].is_dirty = True
-            del self.partitions_by_partition_name[existing_partition_name].data[row_pk]
-            del self.partition_name_by_primary_key[row_pk]
-
-            self.insert(row)
+            self._insert_rows(data, 'update', replace=True)
 
     def cleanse_before_alter(self, data):
+        # Rows are only copied when there are keys to strip from them
+        if not self.delete_key_list:
+            return data
+
         new_list = []
         for item in data:
             new_item = item.copy()  # Assuming item is a dictionary
@@ -122,27 +604,62 @@ class Table:
             await self.clear()
             return
 
-        rows = self.find(query)
-        for row in rows:
-            row_pk = get_from_dict(row, self.primary_key)
-            partition_name = self.partition_name_by_primary_key[row_pk]
-            partition = self.partitions_by_partition_name[partition_name]
-            partition.is_dirty = True
-            del partition.data[row_pk]
-            del self.partition_name_by_primary_key[row_pk]
+        with self.lock.writing:
+            primary_keys = [get_from_dict(row, self.primary_key) for row in self.find(query)]
+            log_lines = self._encode_log([{'op': 'delete', 'primary_key': row_pk} for row_pk in primary_keys])
+            self._remove_rows(primary_keys)
+            self._notify_join_views(primary_keys)
+            self._log(log_lines)
 
     async def clear(self):
-        for name, partition in self.partitions_by_partition_name.items():
-            await partition.delete_file()  # Assuming Partition has a delete_file method
+        # The table lets go of its partitions in one step, so no reader sees it half cleared. A saved table then writes a
+        # snapshot without them before their files are removed, so the manifest never lists a deleted file and a crash
+        # in between reopens either the old rows or none
+        with self.lock.writing:
+            partitions = self.find_partitions()
+            log_lines = self._encode_log([{'op': 'clear'}])
+            self._clear_rows()
+            self._log(log_lines)
+        if os.path.exists(self.output_file_path) and not await self.compact():
+            return
+        for partition in partitions:
+            await partition.delete_file()
+
+    def _clear_rows(self):
+        self._track_changes(self.partition_name_by_primary_key)
+        if self.partition_cache is not None:
+            for partition in self.partitions_by_partition_name.values():
+                self.partition_cache.discard(partition)
         self.partitions_by_partition_name.clear()
         self.partition_name_by_primary_key.clear()
+        self.partition_names_by_index_value.clear()
+        self.partitions_version += 1
+        for index in self.secondary_indices.values():
+            index.clear()
+        for join_view in self.join_views:
+            join_view.mark_stale()
+
+    def _notify_join_views(self, primary_keys):
+        # Replaced rows are reported once, after the whole batch is written
+        for join_view in self.join_views:
+            join_view.rows_changed(self.table_name, primary_keys)
+
+    def get_rows(self, primary_keys) -> Dict[Any, Dict[str, Any]]:
+        rows_by_pk = {}
+        with self.lock.reading:
+            for row_pk in primary_keys:
+                partition_name = self.partition_name_by_primary_key.get(row_pk)
+                if partition_name is not None:
+                    rows_by_pk[row_pk] = self.partitions_by_partition_name[partition_name].data[row_pk]
+        return rows_by_pk
+
     def find_partitions(self):
         return list(self.partitions_by_partition_name.values())
 
     def normalize_query(self, query):
         normalized_query = {}
         for query_field, query_clause in query.items():
-            if isinstance(query_clause, (str, int, bool)):
+            if not isinstance(query_clause, dict):
                 normalized_query[query_field] = {'$eq': query_clause}
             else:
                 normalized_query[query_field] = query_clause
@@ -151,11 +668,8 @@ class Table:
     def filter(self, data, query_field, query_clause):
         if not query_clause or not query_clause.keys():
             return data
-        filtered_data = []
-        for row in data:
-            if all(self.meets_query_condition(get_from_dict(row, query_field), func, value) for func, value in query_clause.items()):
-                filtered_data.append(row)
-        return filtered_data
+        predicate = compile_query({query_field: query_clause})
+        return [row for row in data if predicate(row)]
 
     def meets_query_condition(self, field_value, query_function, query_value):
         if query_function == '$eq':
@@ -179,37 +693,399 @@ class Table:
         else:
             raise ValueError(f"Unsupported query function: {query_function}")
 
-    def find(self, input_query=None):
-        if not input_query:
-            return Results([row for partition in self.partitions_by_partition_name.values() for row in partition.data.values()])
+    def find(self, input_query=None, fields=None, skip: int = 0, limit: int = None, copy_on_write: bool = False):
+        if sinks:
+            with self.lock.reading:
+                results, profile = self._profile_find(input_query, fields, skip, limit, copy_on_write)
+            emit(profile)
+            return results
+        with self.lock.reading:
+            return self._cached_find(input_query, fields, skip, limit, copy_on_write)
+
+    def _profile_find(self, input_query, fields, skip, limit, copy_on_write):
+        profile = {
+            'event': 'find',
+            'table_name': self.table_name,
+            'query': input_query or {},
+            'path': 'full',
+            'partitions_total': len(self.partitions_by_partition_name),
+            'partitions_scanned': 0,
+            'partitions_pruned': 0,
+            'rows_scanned': 0,
+            'indexes_used': [],
+            'clauses': [],
+        }
+        start = perf_counter()
+        results = self._cached_find(input_query, fields, skip, limit, copy_on_write, profile)
+        profile['seconds'] = perf_counter() - start
+        profile['rows_returned'] = len(results)
+        return results, profile
+
+    def _cached_find(self, input_query, fields, skip, limit, copy_on_write, profile=None):
+        if self.result_cache is None:
+            return self._find(input_query, fields, skip, limit, copy_on_write, profile)
+
+        query = self.normalize_query(input_query or {})
+        try:
+            key = ('find', self.table_name, freeze(query), skip, limit)
+        except TypeError:
+            return self._find(query, fields, skip, limit, copy_on_write, profile)
+
+        # The cache holds the matching stored rows; projection and copy-on-write are applied to each caller's list
+        rows = self.result_cache.get(self.table_name, key)
+        if rows is None:
+            scan = self.result_cache.scan(self, query)
+            rows = self._find(query, None, skip, limit, False, profile)
+            self.result_cache.put(key, rows, [scan], len(rows))
+        elif profile is not None:
+            profile['path'] = 'cache'
+        if fields:
+            return Results(map(compile_projection(fields, CopyOnWriteRow if copy_on_write else dict), rows))
+        return Results(map(CopyOnWriteRow, rows) if copy_on_write else rows)
+
+    def _find(self, input_query=None, fields=None, skip: int = 0, limit: int = None, copy_on_write: bool = False, profile=None):
+        if skip or limit is not None:
+            return Results(self._iter_find(input_query, fields, skip, limit, copy_on_write, profile))
+
+        if not input_query and not fields:
+            rows = [row for partition in self.partitions_by_partition_name.values() for row in partition.data.values()]
+            if profile is not None:
+                self._profile_plan(profile, 'full', {'partitions': self.find_partitions(), 'indexes_used': []})
+                profile['rows_scanned'] = len(rows)
+        else:
+            plan = self.plan_query(input_query)
+            if self._use_parallel_scan(plan):
+                if profile is not None:
+                    # Clauses are checked in the workers, so only the rows handed to them are counted
+                    self._profile_plan(profile, 'parallel', plan)
+                    profile['rows_scanned'] = sum(partition.row_count() for partition in plan['partitions'])
+                # Workers return copies of the matching rows (or just the requested fields), not the stored rows
+                return Results(parallel_scan(plan['partitions'], plan['query'], fields, self.parallel_workers))
+
+            if self._use_columnar_scan(plan):
+                if profile is not None:
+                    self._profile_plan(profile, 'columnar', plan)
+                rows = list(self._iter_columnar_rows([partition.column_store() for partition in plan['partitions']], plan['query'], profile))
+            else:
+                rows = self._scan_rows(plan['partitions'], plan['primary_keys'])
+                if profile is not None:
+                    self._profile_plan(profile, 'rows' if plan['primary_keys'] is None else 'index', plan)
+                    profile['rows_scanned'] = len(rows)
+                    if plan['query']:
+                        rows = filter_clauses(rows, clause_profiles(profile, plan['query']))
+                elif plan['query']:
+                    predicate = compile_query(plan['query'])
+                    rows = [row for row in rows if predicate(row)]
+            if fields:
+                return Results(map(compile_projection(fields, CopyOnWriteRow if copy_on_write else dict), rows))
+
+        # Stored rows are returned as is unless the caller asks for copy-on-write rows it may modify
+        if copy_on_write:
+            rows = list(map(CopyOnWriteRow, rows))
+        return Results(rows)
+
+    def find_iter(self, input_query=None, fields=None, skip: int = 0, limit: int = None, copy_on_write: bool = False) -> Iterator[Dict[str, Any]]:
+        return self._iter_find(input_query, fields, skip, limit, copy_on_write)
+
+    def _iter_find(self, input_query, fields, skip, limit, copy_on_write, profile=None):
+        # Rows are produced partition by partition, and nothing past skip + limit is read. The query is planned and its
+        # partitions pinned under the lock, so the stream shows the table as of this call while writes go on meanwhile
+        with self.lock.reading:
+            plan = self.plan_query(input_query)
+            if self._use_columnar_scan(plan):
+                # A column store keeps its own list of the rows it was built from, which is snapshot enough
+                column_stores = [partition.column_store() for partition in plan['partitions']]
+            elif plan['primary_keys'] is not None:
+                candidate_rows = self._scan_rows(plan['partitions'], plan['primary_keys'])
+            else:
+                pinned = deque((partition, *partition.pin()) for partition in plan['partitions'])
+
+        if self._use_columnar_scan(plan):
+            if profile is not None:
+                self._profile_plan(profile, 'columnar', plan)
+            rows = self._iter_columnar_rows(column_stores, plan['query'], profile)
+        else:
+            rows = iter(candidate_rows) if plan['primary_keys'] is not None else self._iter_pinned_rows(pinned)
+            if profile is not None:
+                # Partitions are counted as planned; a limit may stop the scan before it reaches all of them
+                self._profile_plan(profile, 'rows' if plan['primary_keys'] is None else 'index', plan)
+                rows = iter_filter_clauses(rows, clause_profiles(profile, plan['query']) if plan['query'] else [], profile)
+            elif plan['query']:
+                rows = filter(compile_query(plan['query']), rows)
+        if fields:
+            rows = map(compile_projection(fields, CopyOnWriteRow if copy_on_write else dict), rows)
+        elif copy_on_write:
+            rows = map(CopyOnWriteRow, rows)
+        return islice(rows, skip, None if limit is None else skip + limit)
+
+    def _iter_rows(self, partitions, candidate_pks):
+        if candidate_pks is not None:
+            yield from self._scan_rows(partitions, candidate_pks)
+            return
+        for partition in partitions:
+            rows = partition.data
+            yield from rows.values() if isinstance(rows, dict) else rows.iter_values()
+
+    def _iter_pinned_rows(self, pinned):
+        # Each partition is unpinned once streamed, and all that are left when the caller stops early
+        try:
+            while pinned:
+                partition, rows, pins = pinned[0]
+                yield from rows.values() if isinstance(rows, dict) else rows.iter_values()
+                partition.unpin(pins)
+                pinned.popleft()
+        finally:
+            for partition, rows, pins in pinned:
+                partition.unpin(pins)
+
+    def _use_columnar_scan(self, plan):
+        return self.columnar and plan['primary_keys'] is None and bool(plan['query'])
 
-        query = self.normalize_query(input_query)
+    def _iter_columnar_rows(self, column_stores, query, profile=None):
+        # Clauses run as masks over each partition's column arrays; only matching rows are taken from the row dicts
+        for column_store in column_stores:
+            if profile is not None:
+                yield from self._profile_columnar_rows(column_store, query, profile)
+                continue
+            mask, residual_query = column_store.mask(query)
+            rows = column_store.rows_where(mask)
+            if residual_query:
+                rows = filter(compile_query(residual_query), rows)
+            yield from rows
+
+    def _profile_columnar_rows(self, column_store, query, profile):
+        # The vectorized clauses are timed together, as one mask, and the residual clauses one by one
+        start = perf_counter()
+        mask, residual_query = column_store.mask(query)
+        rows = column_store.rows_where(mask)
+        stats = clause_stats(profile, 'columnar mask')
+        stats['rows_in'] += len(column_store.rows)
+        stats['rows_out'] += len(rows)
+        stats['seconds'] += perf_counter() - start
+        profile['rows_scanned'] += len(column_store.rows)
+        if residual_query:
+            rows = filter_clauses(rows, clause_profiles(profile, residual_query))
+        return rows
+
+    def _profile_plan(self, profile, path, plan):
+        profile['path'] = path
+        profile['partitions_scanned'] = len(plan['partitions'])
+        profile['partitions_pruned'] = profile['partitions_total'] - len(plan['partitions'])
+        profile['indexes_used'] = plan['indexes_used']
+
+    def aggregate(self, input_query=None, group_by: List[str] = None, metrics: Dict[str, Dict[str, Any]] = None) -> Results:
+        # metrics maps output names to one function each, e.g. {'points': {'$sum': 'stats.points'}, 'games': {'$count': None}}
+        with self.lock.reading:
+            group_by = group_by or []
+            metric_specs = parse_metrics(metrics)
+            plan = self.plan_query(input_query)
+            partitions = plan['partitions']
+
+            # Pruning resolves the index clauses, so when nothing else is left each partition is a whole group on its own
+            if not plan['query'] and plan['primary_keys'] is None and metadata_answerable(self.value_indices(), partitions, group_by, metric_specs):
+                partials = (partition_metadata_partial(partition, group_by, metric_specs) for partition in partitions)
+            elif self._use_parallel_scan(plan):
+                partial = parallel_aggregate(partitions, plan['query'], group_by, metric_specs, self.parallel_workers)
+                return finalize_partial(partial, group_by, metric_specs)
+            elif plan['primary_keys'] is not None:
+                rows = self._scan_rows(partitions, plan['primary_keys'])
+                if plan['query']:
+                    rows = filter(compile_query(plan['query']), rows)
+                partials = [aggregate_rows(rows, group_by, metric_specs)]
+            elif self.columnar:
+                partials = (self._columnar_partial(partition, plan['query'], group_by, metric_specs) for partition in partitions)
+            else:
+                predicate = compile_query(plan['query']) if plan['query'] else None
+                partials = []
+                for partition in partitions:
+                    rows = self._iter_rows([partition], None)
+                    partials.append(aggregate_rows(rows if predicate is None else filter(predicate, rows), group_by, metric_specs))
+            return finalize_partial(merge_partials(partials, metric_specs), group_by, metric_specs)
+
+    def _columnar_partial(self, partition, query, group_by, metric_specs):
+        column_store = partition.column_store()
+        mask, residual_query = column_store.mask(query)
+        if residual_query:
+            mask = column_store.filter_mask(mask, residual_query)
+        partial = column_store.aggregate(mask, group_by, metric_specs)
+        if partial is None:
+            partial = aggregate_rows(column_store.rows_where(mask), group_by, metric_specs)
+        return partial
+
+    def _use_parallel_scan(self, plan):
+        # Index lookups already touch few rows, and small scans cost less than shipping work to other processes
+        if self.parallel_workers <= 1 or plan['primary_keys'] is not None:
+            return False
+        return sum(partition.row_count() for partition in plan['partitions']) >= self.parallel_min_rows
+
+    def plan_query(self, input_query):
+        query = self.normalize_query(input_query or {})
         valid_partitions = self.find_partitions()
+        candidate_pks = None
+        indexes_used = []
 
         if query.get(self.primary_key):
-            valid_partitions = self.primary_key_partition_filter(valid_partitions, query.pop(self.primary_key))
+            valid_partitions = self.primary_key_partition_filter(valid_partitions, query[self.primary_key])
 
-        for index_name in self.indices:
-            if query.get(index_name):
-                valid_partitions = self.index_partition_filter(valid_partitions, index_name, query.pop(index_name))
+        # Every row of a value partition shares its index values, so a resolved index clause needs no row filter;
+        # hash, range and time buckets hold several values, so their clauses still filter the rows they keep
+        for index_name, partitioner in self.partitioners.items():
+            if query.get(index_name) and index_name != self.primary_key:
+                query_clause = query.pop(index_name) if partitioner.exact else query[index_name]
+                valid_partitions = self.index_partition_filter(valid_partitions, index_name, query_clause)
+                indexes_used.append(index_name)
 
-        rows = [row for partition in valid_partitions for row in partition.data.values()]
-        for query_key, query_clause in query.items():
-            rows = self.filter(rows, query_key, query_clause)
+        # The primary key and secondary indexes narrow the partitions down to candidate rows
+        for query_field in list(query.keys()):
+            query_clause = query[query_field]
+            if not query_clause:
+                continue
+            elif query_field == self.primary_key:
+                primary_keys = self._primary_key_lookup(query_clause)
+            elif query_field in self.secondary_indices:
+                self._ensure_secondary_indices()
+                primary_keys = self.secondary_indices[query_field].lookup(query_clause)
+            else:
+                continue
+            if primary_keys is None:
+                continue
 
-        return Results(rows)
+            if candidate_pks is None:
+                candidate_pks = primary_keys
+            else:
+                smaller, larger = sorted([candidate_pks, primary_keys], key=len)
+                candidate_pks = {row_pk: None for row_pk in smaller if row_pk in larger}
+            indexes_used.append(query_field)
+            # A single-function clause is answered exactly by the lookup; combined ones are re-checked per row
+            if len(query_clause) == 1:
+                query.pop(query_field)
+
+        return {
+            'partitions': valid_partitions,
+            'primary_keys': candidate_pks,
+            'query': query,
+            'indexes_used': indexes_used,
+        }
+
+    def _scan_rows(self, partitions, candidate_pks):
+        if candidate_pks is None:
+            return [row for partition in partitions for row in partition.data.values()]
+
+        if len(partitions) == len(self.partitions_by_partition_name):
+            partitions_by_name = self.partitions_by_partition_name
+        else:
+            if sum(partition.row_count() for partition in partitions) <= len(candidate_pks):
+                return [row for partition in partitions for row_pk, row in partition.data.items() if row_pk in candidate_pks]
+            partitions_by_name = {partition.partition_name: partition for partition in partitions}
+
+        rows = []
+        for row_pk in candidate_pks:
+            partition = partitions_by_name.get(self.partition_name_by_primary_key.get(row_pk))
+            if partition is not None:
+                rows.append(partition.data[row_pk])
+        return rows
+
+    def explain(self, input_query=None):
+        # Runs the query once, profiled, for its actual path, time and per-clause counts
+        with self.lock.reading:
+            plan = self.plan_query(input_query)
+            results, profile = self._profile_find(input_query, None, 0, None, False)
+            return {
+                'table_name': self.table_name,
+                'partitions_total': len(self.partitions_by_partition_name),
+                'partitions_scanned': len(plan['partitions']),
+                'rows_total': len(self.partition_name_by_primary_key),
+                'rows_scanned': len(self._scan_rows(plan['partitions'], plan['primary_keys'])),
+                'rows_returned': len(results),
+                'indexes_used': plan['indexes_used'],
+                'residual_query': plan['query'],
+                'path': profile['path'],
+                'seconds': profile['seconds'],
+                'clauses': profile['clauses'],
+            }
+
+    def statistics(self):
+        with self.lock.reading:
+            return {
+                'table_name': self.table_name,
+                'row_count': len(self.partition_name_by_primary_key),
+                'partition_count': len(self.partitions_by_partition_name),
+                'rows_by_partition': {partition_name: partition.row_count() for partition_name, partition in self.partitions_by_partition_name.items()},
+                'distinct_counts': {field: self.distinct_count(field) for field in [self.primary_key] + self.indices + list(self.secondary_indices.keys())},
+            }
+
+    def is_indexed(self, field: str) -> bool:
+        return field == self.primary_key or field in self.indices or field in self.secondary_indices
+
+    def distinct_count(self, field: str) -> Optional[int]:
+        if field == self.primary_key:
+            return len(self.partition_name_by_primary_key)
+        elif field in self.indices and self.partitioners[field].exact:
+            return len(self.partition_names_by_index_value.get(field, {}))
+        elif not self.secondary_indices_stale and hasattr(self.secondary_indices.get(field), 'primary_keys_by_value'):
+            return len(self.secondary_indices[field].primary_keys_by_value)
+        return None
+
+    def estimate_query(self, input_query=None):
+        with self.lock.reading:
+            if not input_query:
+                row_count = len(self.partition_name_by_primary_key)
+                return {'rows_scanned': row_count, 'rows_returned': row_count}
+
+            plan = self.plan_query(input_query)
+            if plan['primary_keys'] is not None:
+                rows_scanned = len(plan['primary_keys'])
+            else:
+                rows_scanned = sum(partition.row_count() for partition in plan['partitions'])
+
+            rows_returned = rows_scanned
+            for query_clause in plan['query'].values():
+                for query_function in query_clause.keys():
+                    rows_returned *= OPERATOR_SELECTIVITY.get(query_function, 1)
+            return {'rows_scanned': rows_scanned, 'rows_returned': rows_returned}
+
+    def _primary_key_lookup(self, query_clause):
+        if '$eq' in query_clause:
+            primary_keys = [query_clause['$eq']]
+        elif '$in' in query_clause:
+            primary_keys = query_clause['$in']
+        else:
+            return None
+        return {row_pk: None for row_pk in primary_keys if row_pk in self.partition_name_by_primary_key}
+
+    def primary_key_partition_filter(self, partitions, query_clause):
+        primary_keys = self._primary_key_lookup(query_clause)
+        if primary_keys is None:
+            return partitions
+
+        partition_names = {self.partition_name_by_primary_key[row_pk]: None for row_pk in primary_keys}
+        return self._restrict_partitions(partitions, partition_names)
+
+    def index_partition_filter(self, partitions, index_name, query_clause):
+        partitioner = self.partitioners[index_name]
+        partition_names_by_key = self.partition_names_by_index_value.get(index_name, {})
+        partition_keys = lookup_keys(partitioner, query_clause)
+        partition_names = {}
+        for partition_key in partition_names_by_key if partition_keys is None else partition_keys:
+            names = partition_names_by_key.get(partition_key)
+            if names and partitioner.matches(partition_key, query_clause):
+                partition_names.update(names)
+        return self._restrict_partitions(partitions, partition_names)
+
+    def value_indices(self) -> List[str]:
+        # Partition fields whose partitions each hold one value of the field
+        return [field for field, partitioner in self.partitioners.items() if partitioner.exact]
 
-    # def primary_key_partition_filter(self, partitions, query_clause):
-        # Implementation of primary key based partition filtering
-        # Similar to TypeScript version, but using Python data structures
+    def _restrict_partitions(self, partitions, partition_names):
+        if len(partitions) == len(self.partitions_by_partition_name):
+            return [self.partitions_by_partition_name[name] for name in partition_names if name in self.partitions_by_partition_name]
+        return [partition for partition in partitions if partition.partition_name in partition_names]
 
-    # def index_partition_filter(self, partitions, index_name, query_clause):
-        # Implementation of index based partition filtering
-        # Similar to TypeScript version, but using Python data structures
+    def result_cache_stats(self) -> Dict[str, Any]:
+        return self.result_cache.table_stats(self.table_name) if self.result_cache is not None else {}
 
     def findOne(self, query=None):
-        results = self.find(query)
-        return results[0] if results else None
+        return next(self.find_iter(query, limit=1), None)
 
     def get_table_connection(self, foreign_table_name):
         return self.table_connections.get(foreign_table_name)
@@ -218,4 +1094,4 @@ class Table:
         return [connection['join_key'] for connection in self.table_connections.values()]
 
     def get_foreign_keys_and_primary_keys(self):
-        return list(set(self.get_all_foreign_keys() + [self.primary_key]))
\ No newline at end of file
+        return list(set(self.get_all_foreign_keys() + [self.primary_key]))
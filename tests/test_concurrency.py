@@ -0,0 +1,247 @@
+import asyncio
+import contextlib
+import io
+import threading
+import time
+
+import pytest
+
+from concurrency import ReadWriteLock
+from database import Database
+from indexes import SortedIndex
+import partition as partition_module
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting')
+        time.sleep(0.001)
+
+
+def start(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def hold(lock_context, entered: threading.Event, release: threading.Event, order=None, name=None):
+    def run():
+        with lock_context:
+            if order is not None:
+                order.append(name)
+            entered.set()
+            release.wait(5)
+    return run
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    entered = [threading.Event(), threading.Event()]
+    release = threading.Event()
+    threads = [start(hold(lock.reading, event, release)) for event in entered]
+    # Both readers are inside at once
+    assert all(event.wait(5) for event in entered)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_writer_excludes_readers_and_writers():
+    lock = ReadWriteLock()
+    reader_entered, writer_entered, release = threading.Event(), threading.Event(), threading.Event()
+    with lock.writing:
+        threads = [start(hold(lock.reading, reader_entered, release)), start(hold(lock.writing, writer_entered, release))]
+        wait_until(lambda: lock._readers_waiting == 1 and lock._writers_waiting == 1)
+        assert not reader_entered.is_set() and not writer_entered.is_set()
+    release.set()
+    assert reader_entered.wait(5) and writer_entered.wait(5)
+    for thread in threads:
+        thread.join(5)
+
+
+def test_waiting_writer_holds_back_new_readers():
+    lock = ReadWriteLock()
+    order = []
+    writer_entered, reader_entered, release = threading.Event(), threading.Event(), threading.Event()
+    release.set()
+    with lock.reading:
+        writer = start(hold(lock.writing, writer_entered, release, order, 'writer'))
+        wait_until(lambda: lock._writers_waiting == 1)
+        reader = start(hold(lock.reading, reader_entered, release, order, 'reader'))
+        wait_until(lambda: lock._readers_waiting == 1)
+        assert not reader_entered.is_set()
+    writer.join(5)
+    reader.join(5)
+    assert order == ['writer', 'reader']
+
+
+def test_readers_waiting_on_a_write_go_before_the_next_writer():
+    lock = ReadWriteLock()
+    order = []
+    entered = [threading.Event() for _ in range(3)]
+    release = threading.Event()
+    release.set()
+    with lock.writing:
+        threads = [start(hold(lock.reading, entered[0], release, order, 'reader'))]
+        wait_until(lambda: lock._readers_waiting == 1)
+        threads.append(start(hold(lock.writing, entered[1], release, order, 'writer')))
+        wait_until(lambda: lock._writers_waiting == 1)
+        threads.append(start(hold(lock.reading, entered[2], release, order, 'reader')))
+        wait_until(lambda: lock._readers_waiting == 2)
+    for thread in threads:
+        thread.join(5)
+    # Every reader that waited on the write goes before the writer queued behind it, so readers never starve
+    assert order == ['reader', 'reader', 'writer']
+
+
+def test_locks_are_reentrant():
+    lock = ReadWriteLock()
+    writer_entered, release = threading.Event(), threading.Event()
+    release.set()
+    with lock.reading:
+        writer = start(hold(lock.writing, writer_entered, release))
+        wait_until(lambda: lock._writers_waiting == 1)
+        # A nested read does not queue behind the waiting writer
+        with lock.reading:
+            assert not writer_entered.is_set()
+    writer.join(5)
+    assert writer_entered.is_set()
+
+    with lock.writing:
+        with lock.writing, lock.reading, lock.reading:
+            pass
+    assert lock._writer is None and lock._readers == 0 and not lock._read_depths
+
+
+def test_write_inside_a_read_raises():
+    lock = ReadWriteLock()
+    with lock.reading:
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
+    with lock.writing:
+        pass
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database('concurrency', str(tmp_path), False)
+    db.add_table('teams', [], 'team_id', None, [])
+    db.add_table('players', ['team_id'], 'player_id', None, [])
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('teams', 'players', 'team_id', 'one_to_many')
+    db.tables['teams'].insert([{'team_id': team_id} for team_id in range(3)])
+    db.tables['players'].insert([{'player_id': player_id, 'team_id': player_id % 3, 'points': 1} for player_id in range(30)])
+    return db
+
+
+def test_find_iter_reads_a_snapshot(db):
+    players = db.tables['players']
+    rows = players.find_iter()
+    first = next(rows)
+    # Writes land while the stream is half read, without waiting for it
+    players.update([{'player_id': player_id, 'team_id': player_id % 3, 'points': 2} for player_id in range(30)])
+    players.insert({'player_id': 100, 'team_id': 0, 'points': 2})
+    asyncio.run(players.delete({'player_id': 29}))
+    streamed = [first] + list(rows)
+    assert len(streamed) == 30 and {row['points'] for row in streamed} == {1}
+    assert sum(row['points'] for row in players.find()) == 60
+
+
+def test_writer_waits_for_a_snapshot_read_under_the_lock(db):
+    players = db.tables['players']
+    written = threading.Event()
+
+    def write():
+        players.insert({'player_id': 100, 'team_id': 0, 'points': 5})
+        written.set()
+
+    with db.lock.reading:
+        before = players.find()
+        writer = start(write)
+        wait_until(lambda: db.lock._writers_waiting == 1)
+        assert players.find() == before
+    writer.join(5)
+    assert written.is_set() and len(players.find()) == 31
+
+
+def test_stale_join_view_builds_under_a_held_read_lock(db):
+    view = db.add_join_view('rosters', 'teams', ['players'])
+    view.mark_stale()
+    with db.lock.reading:
+        rows = view.rows()
+    assert len(rows) == 3 and sum(len(team['playerss']) for team in rows) == 30
+
+
+def test_lazy_index_build_is_never_seen_half_done(tmp_path, monkeypatch):
+    db = Database('indexes', str(tmp_path), False)
+    db.add_table('players', ['team_id'], 'player_id', None, [], {'points': 'sorted'})
+    db.tables['players'].insert([{'player_id': player_id, 'team_id': player_id % 3, 'points': player_id} for player_id in range(30)])
+    asyncio.run(db.save_database())
+    db = Database('indexes', str(tmp_path), False)
+    asyncio.run(db.read_from_file(lazy=True))
+    players = db.tables['players']
+
+    building, release = threading.Event(), threading.Event()
+    built = []
+    build = SortedIndex.build
+
+    def slow_build(index, rows_by_pk):
+        build(index, rows_by_pk)
+        built.append(index)
+        building.set()
+        release.wait(5)
+
+    monkeypatch.setattr(SortedIndex, 'build', slow_build)
+    results = []
+
+    def query():
+        with db.lock.reading:
+            results.append(len(players.find({'points': {'$gte': 10}})))
+
+    threads = [start(query)]
+    assert building.wait(5)
+    threads.append(start(query))
+    time.sleep(0.05)
+    # The second reader waits for the build rather than reading the index it is filling
+    assert players.secondary_indices_stale and players.secondary_indices['points'] is not built[0] and not results
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [20, 20] and len(built) == 1
+
+
+def test_readers_of_a_stub_wait_for_its_file(tmp_path, monkeypatch):
+    db = Database('stubs', str(tmp_path), False, storage_format='binary')
+    db.add_table('players', [], 'player_id', None, [])
+    db.tables['players'].insert([{'player_id': player_id} for player_id in range(30)])
+    asyncio.run(db.save_database())
+    db = Database('stubs', str(tmp_path), False, storage_format='binary')
+    asyncio.run(db.read_from_file(lazy=True))
+    partition = db.tables['players'].find_partitions()[0]
+
+    reading, release = threading.Event(), threading.Event()
+    read_partition_file = partition_module.read_partition_file
+
+    def slow_read(file_path):
+        reading.set()
+        release.wait(5)
+        return read_partition_file(file_path)
+
+    monkeypatch.setattr(partition_module, 'read_partition_file', slow_read)
+    row_counts = []
+
+    def read():
+        row_counts.append(len(partition.data))
+
+    threads = [start(read)]
+    assert reading.wait(5)
+    threads.append(start(read))
+    time.sleep(0.05)
+    # The second reader neither loads the file again nor sees the rows dict before it is filled
+    assert not partition.is_loaded and not row_counts
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert row_counts == [30, 30]
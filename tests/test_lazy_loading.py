@@ -0,0 +1,31 @@
+import asyncio
+import glob
+import os
+import shutil
+
+import pytest
+
+from database import Database
+
+
+@pytest.mark.parametrize('storage_format', ['json', 'binary'])
+def test_out_of_date_key_list_falls_back_to_a_full_read(tmp_path, storage_format):
+    db = Database('lazy', str(tmp_path), False, storage_format=storage_format)
+    table = db.add_table('players', ['team'], 'player_id', None, [])
+    table.insert([{'player_id': player_id, 'team': 'a'} for player_id in range(10)])
+    asyncio.run(db.save_database())
+    [keys_file] = glob.glob(os.path.join(str(tmp_path), '**', '*.keys.json'), recursive=True)
+    shutil.copy(keys_file, f'{keys_file}.old')
+
+    table.insert({'player_id': 10, 'team': 'a'})
+    asyncio.run(table.delete({'player_id': 0}))
+    asyncio.run(db.save_database())
+    # As if the process died after writing the partition file but before its key list
+    os.replace(f'{keys_file}.old', keys_file)
+
+    db = Database('lazy', str(tmp_path), False, storage_format=storage_format)
+    asyncio.run(db.read_from_file(lazy=True))
+    players = db.tables['players']
+    assert players.findOne({'player_id': 10}) == {'player_id': 10, 'team': 'a'}
+    assert players.find({'player_id': 0}) == []
+    assert sorted(row['player_id'] for row in players.find()) == list(range(1, 11))
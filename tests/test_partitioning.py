@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database('partitioning', str(tmp_path), False)
+
+
+def test_keys_formatting_to_one_name_keep_their_rows(db):
+    table = db.add_table('players', ['team'], 'id', None, [])
+    table.insert([{'id': 1, 'team': 1}, {'id': 2, 'team': '1'}, {'id': 3, 'team': 1}])
+    table.insert({'id': 4, 'team': '1'})
+    assert sorted(row['id'] for row in table.find()) == [1, 2, 3, 4]
+    assert len(table.partitions_by_partition_name) == 2
+    assert [row['id'] for row in table.find({'team': '1'})] == [2, 4]
+    assert [row['id'] for row in table.find({'team': 1})] == [1, 3]
+
+
+def test_numbered_partition_names_survive_a_reopen(db, tmp_path):
+    table = db.add_table('players', ['team'], 'id', None, [])
+    table.insert([{'id': 1, 'team': 1}, {'id': 2, 'team': '1'}])
+    asyncio.run(db.save_database())
+
+    reopened = Database('partitioning', str(tmp_path), False)
+    asyncio.run(reopened.read_from_file())
+    table = reopened.tables['players']
+    table.insert([{'id': 3, 'team': '1'}, {'id': 4, 'team': 1}])
+    assert len(table.partitions_by_partition_name) == 2
+    assert [row['id'] for row in table.find({'team': '1'})] == [2, 3]
+    assert [row['id'] for row in table.find({'team': 1})] == [1, 4]
+
+
+def test_rows_saved_under_a_colliding_name_are_found_after_a_reopen(db, tmp_path):
+    table = db.add_table('players', ['team'], 'id', None, [])
+    table.insert([{'id': 1, 'team': 1}, {'id': 3, 'team': 1}])
+    # A partition file written when team '1' rows shared team 1's partition
+    table.partitions_by_partition_name['team_1'].insert_rows({2: {'id': 2, 'team': '1'}})
+    asyncio.run(db.save_database())
+
+    reopened = Database('partitioning', str(tmp_path), False)
+    asyncio.run(reopened.read_from_file())
+    table = reopened.tables['players']
+    assert [row['id'] for row in table.find({'team': '1'})] == [2]
+    assert [row['id'] for row in table.find({'team': 1})] == [1, 3]
+    assert sorted(row['id'] for row in table.find()) == [1, 2, 3]
@@ -0,0 +1,26 @@
+import pytest
+
+from database import Database
+from query import compile_query
+
+
+@pytest.fixture
+def table(tmp_path):
+    db = Database('query', str(tmp_path), False)
+    table = db.add_table('games', [], 'id', None, [])
+    table.insert([{'id': 1}, {'id': 20, 'pts': 5}, {'id': 30, 'pts': 'n/a'}])
+    return table
+
+
+def test_range_clauses_fail_rows_missing_the_field(table):
+    assert table.find({'id': {'$gt': 10}, 'pts': {'$between': [0, 9]}}) == [{'id': 20, 'pts': 5}]
+    assert table.find({'pts': {'$gte': 0}}) == [{'id': 20, 'pts': 5}]
+    assert table.find({'pts': {'$lt': 'z'}}) == [{'id': 30, 'pts': 'n/a'}]
+    assert [row['id'] for row in table.find_iter({'pts': {'$between': [0, 9]}, 'id': {'$ne': 1}})] == [20]
+
+
+def test_incomparable_values_fail_only_their_clause():
+    predicate = compile_query({'pts': {'$gt': 1}})
+    assert not predicate({'pts': None}) and not predicate({'pts': 'n/a'}) and predicate({'pts': 2})
+    predicate = compile_query({'pts': {'$ne': 3, '$lte': 5}, 'team': {'$in': ['a']}})
+    assert predicate({'pts': 4, 'team': 'a'}) and not predicate({'team': 'a'})
@@ -0,0 +1,13 @@
+from database import Database
+
+
+def test_primary_key_miss_is_invalidated_by_insert(tmp_path):
+    db = Database('cache', str(tmp_path), False, result_cache_rows=100)
+    table = db.add_table('players', ['team'], 'player_id', None, [])
+    table.insert([{'player_id': 1, 'team': 'a'}])
+    assert table.find({'player_id': 2}) == []
+    assert table.find({'player_id': {'$in': [1, 2]}}) == [{'player_id': 1, 'team': 'a'}]
+
+    table.insert([{'player_id': 2, 'team': 'a'}])
+    assert table.find({'player_id': 2}) == [{'player_id': 2, 'team': 'a'}]
+    assert sorted(row['player_id'] for row in table.find({'player_id': {'$in': [1, 2]}})) == [1, 2]
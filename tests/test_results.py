@@ -0,0 +1,66 @@
+import copy
+
+import pytest
+
+from database import Database
+from results import CopyOnWriteRow, fork_row
+
+
+@pytest.fixture
+def table(tmp_path):
+    db = Database('results', str(tmp_path), False)
+    table = db.add_table('players', [], 'player_id', None, [])
+    table.insert([{'player_id': 1, 'stats': {'points': 10, 'splits': {'home': 4}}, 'tags': ['guard']}])
+    return table
+
+
+STORED = [{'player_id': 1, 'stats': {'points': 10, 'splits': {'home': 4}}, 'tags': ['guard']}]
+
+
+def test_dict_copy_does_not_reach_storage(table):
+    row = table.find(copy_on_write=True)[0]
+    dict(row)['stats']['points'] = 99
+    dict(row)['stats']['splits']['home'] = 0
+    dict(row)['tags'].append('captain')
+    assert table.find() == STORED
+
+
+def test_unpacking_does_not_reach_storage(table):
+    row = table.find(copy_on_write=True)[0]
+    {**row}['tags'].append('captain')
+    {**row}['stats']['points'] = 99
+    (row | {})['stats']['splits']['home'] = 0
+    merged = {}
+    merged.update(table.find(copy_on_write=True)[0])
+    merged['tags'].append('center')
+    assert table.find() == STORED
+
+
+def test_copies_do_not_reach_storage(table):
+    copy.copy(table.find(copy_on_write=True)[0])['tags'].append('captain')
+    table.find(copy_on_write=True)[0].copy()['stats']['points'] = 99
+    assert table.find() == STORED
+
+    row = table.find(copy_on_write=True)[0]
+    row['tags'].append('captain')
+    copy.copy(row)['tags'].append('center')
+    row.copy()['stats']['points'] = 99
+    assert row['tags'] == ['guard', 'captain'] and row['stats']['points'] == 10
+    assert table.find() == STORED
+
+
+def test_projected_rows_do_not_reach_storage(table):
+    table.find(fields=['stats', 'tags'])[0]['stats']['points'] = 99
+    table.find(fields=['stats', 'tags'])[0]['tags'].append('captain')
+    table.find(fields=['stats.splits'])[0]['stats']['splits']['home'] = 0
+    dict(table.find(fields=['stats.splits'], copy_on_write=True)[0])['stats']['splits']['home'] = 0
+    assert table.find() == STORED
+
+
+def test_forked_rows_are_independent():
+    child = CopyOnWriteRow({'tags': ['a']})
+    row = CopyOnWriteRow({'children': [child]})
+    forked = fork_row(row)
+    dict(forked)['children'][0]['tags'].append('b')
+    assert dict.__getitem__(child, 'tags') == ['a']
+    assert row['children'][0]['tags'] == ['a']
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import io
+import random
+import threading
+
+import pytest
+
+from database import Database
+
+
+def open_database(folder_path, lazy=False):
+    db = Database('wal', folder_path, False, use_write_ahead_log=True)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        asyncio.run(db.read_from_file(lazy))
+    return db, output.getvalue()
+
+
+def rows_of(table):
+    return sorted(table.find(), key=lambda row: row['game_id'])
+
+
+def build_database(folder_path):
+    db = Database('wal', folder_path, False, use_write_ahead_log=True)
+    table = db.add_table('games', ['season'], 'game_id', None, [])
+    table.insert([{'game_id': game_id, 'season': 2018 + game_id % 3, 'points': game_id} for game_id in range(60)])
+    asyncio.run(db.save_database())
+    return db, table
+
+
+def test_replay_stops_at_last_complete_record(tmp_path):
+    db, table = build_database(str(tmp_path))
+    states = [(table.wal.size(), rows_of(table))]
+    for step in range(30):
+        if step % 3 == 0:
+            table.insert({'game_id': 1000 + step, 'season': 2021, 'points': step})
+        elif step % 3 == 1:
+            table.upsert({'game_id': step, 'season': 2020, 'points': -step})
+        else:
+            asyncio.run(table.delete({'game_id': step}))
+        asyncio.run(db.save_database())
+        states.append((table.wal.size(), rows_of(table)))
+
+    with open(table.wal.file_path, 'rb') as f:
+        log_data = f.read()
+    rng = random.Random(6)
+    offsets = [0, len(log_data)] + [rng.randrange(len(log_data)) for _ in range(40)]
+    for offset in offsets:
+        with open(table.wal.file_path, 'wb') as f:
+            f.write(log_data[:offset])
+        # Each save appends one record, so recovery lands exactly on the last save written whole
+        expected = [state for size, state in states if size <= offset][-1]
+        recovered, _ = open_database(str(tmp_path), lazy=offset % 2 == 1)
+        assert rows_of(recovered.tables['games']) == expected, offset
+
+
+def test_manifest_keeps_settings_changed_between_snapshots(tmp_path):
+    db, table = build_database(str(tmp_path))
+    db.add_table('seasons', [], 'season', None, [])
+    asyncio.run(db.save_database())
+    table.add_secondary_index('points', 'sorted')
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.add_connection('seasons', 'games', 'season', 'one_to_many')
+    table.insert({'game_id': 500, 'season': 2019, 'points': 7})
+    asyncio.run(db.save_database())
+
+    recovered, _ = open_database(str(tmp_path))
+    games = recovered.tables['games']
+    assert games.secondary_indices['points'].index_type == 'sorted'
+    assert games.table_connections['seasons'] == {'join_key': 'season', 'join_type': 'many_to_one'}
+    assert games.find({'points': {'$gte': 7, '$lte': 7}}) == [{'game_id': 7, 'season': 2019, 'points': 7}, {'game_id': 500, 'season': 2019, 'points': 7}]
+
+
+def test_clear_is_saved_before_files_are_removed(tmp_path):
+    db, table = build_database(str(tmp_path))
+    asyncio.run(table.clear())
+
+    # Nothing saved since the clear, as after a crash
+    for lazy in (False, True):
+        recovered, output = open_database(str(tmp_path), lazy)
+        assert rows_of(recovered.tables['games']) == []
+        assert 'not found' not in output
+
+    table.insert({'game_id': 1, 'season': 2018, 'points': 3})
+    asyncio.run(db.save_database())
+    recovered, _ = open_database(str(tmp_path))
+    assert rows_of(recovered.tables['games']) == [{'game_id': 1, 'season': 2018, 'points': 3}]
+
+
+def test_saves_lose_no_records_written_on_other_threads(tmp_path):
+    db, table = build_database(str(tmp_path))
+
+    def write():
+        for game_id in range(1000, 1400):
+            table.insert({'game_id': game_id, 'season': 2021, 'points': game_id})
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while writer.is_alive():
+        asyncio.run(table.append_to_log())
+    writer.join()
+    asyncio.run(table.append_to_log())
+    assert len(table.wal.read()) == 400 and not table.pending_log_records
+
+
+def test_unloggable_rows_leave_the_table_unchanged(tmp_path):
+    db, table = build_database(str(tmp_path))
+    before, pending = rows_of(table), len(table.pending_log_records)
+    with pytest.raises(ValueError):
+        table.insert([{'game_id': 2000, 'season': 2021, 'points': 1}, {'game_id': 2001, 'season': 2021, 'points': {1, 2}}])
+    with pytest.raises(ValueError):
+        table.upsert([{'game_id': 1, 'season': 2018, 'points': object()}])
+    assert rows_of(table) == before and len(table.pending_log_records) == pending
+    assert table.find({'game_id': 2000}) == [] and table.find({'game_id': 1})[0]['points'] == 1
@@ -1,5 +1,10 @@
+import os
 from collections import defaultdict
 from copy import deepcopy
+from functools import lru_cache
+from time import perf_counter
+
+from query import make_getter
 
 # Import for handling date if needed, similar to dayjs
 import datetime
@@ -7,13 +12,38 @@ import datetime
 def partition_name_from_partition_index(partition_index):
     return '_'.join([f'{key}_{value}' for key, value in partition_index.items()]) or 'default'
 
+def typed_partition_keys(partition_keys):
+    return tuple((type(key).__name__, key) for key in partition_keys)
+
 def distinct(arr):
+    # Order-preserving: the first of equal items is kept. Unhashable items fall back to a scan of the unhashable ones
+    if not isinstance(arr, list):
+        arr = list(arr)
+    try:
+        return list(dict.fromkeys(arr))
+    except TypeError:
+        pass
+
+    seen = set()
+    unhashable = []
     result = []
     for item in arr:
-        if item not in result:
-            result.append(item)
+        try:
+            if item in seen:
+                continue
+            seen.add(item)
+        except TypeError:
+            if item in unhashable:
+                continue
+            unhashable.append(item)
+        result.append(item)
     return result
 
+@lru_cache(maxsize=None)
+def key_getter(key):
+    # Compiled once per dotted key instead of splitting the path again for every row
+    return make_getter(tuple(key.split('.')))
+
 def get_from_dict(obj, key):
     key_parts = key.split('.')
     current = obj
@@ -88,15 +118,44 @@ def nest_children(parent_array, child_dict, join_key, store_key):
     return parent_array
 
 def index_by(list_, index_field):
-    index_map = {}
-    for row in list_:
-        index_value = get_from_dict(row, index_field)
-        index_map[index_value] = row
-    return index_map
+    get_index_value = key_getter(index_field)
+    return {get_index_value(row): row for row in list_}
 
 def group_by(list_, index_field):
+    get_index_value = key_getter(index_field)
     group_map = defaultdict(list)
     for row in list_:
-        index_value = get_from_dict(row, index_field)
-        group_map[index_value].append(row)
+        group_map[get_index_value(row)].append(row)
     return group_map
+
+def index_and_group_by(list_, index_fields=(), group_fields=()):
+    # One pass builds the index_by map (last row wins) and the group_by map for every field given
+    index_maps = {index_field: {} for index_field in index_fields}
+    group_maps = {group_field: defaultdict(list) for group_field in group_fields}
+    index_getters = [(key_getter(index_field), index_maps[index_field]) for index_field in index_maps]
+    group_getters = [(key_getter(group_field), group_maps[group_field]) for group_field in group_maps]
+    for row in list_:
+        for get_index_value, index_map in index_getters:
+            index_map[get_index_value(row)] = row
+        for get_group_value, group_map in group_getters:
+            group_map[get_group_value(row)].append(row)
+    return index_maps, group_maps
+
+def write_file_atomic(file_path, data: bytes, fsync: bool = False, profile=None) -> int:
+    # Readers see either the previous file or the complete new one, never a partial write
+    temp_file_path = f"{file_path}.tmp"
+    with open(temp_file_path, 'wb') as f:
+        f.write(data)
+        if fsync:
+            sync_file(f, profile)
+    os.replace(temp_file_path, file_path)
+    return len(data)
+
+
+def sync_file(f, profile=None):
+    # Without it a crash shortly after the rename can leave an empty or partial file behind the new name
+    start = perf_counter()
+    f.flush()
+    os.fsync(f.fileno())
+    if profile is not None:
+        profile['fsync_seconds'] += perf_counter() - start
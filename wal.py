@@ -0,0 +1,74 @@
+import json
+import os
+import zlib
+from typing import Any, Dict, List
+
+
+class WriteAheadLog:
+    # One record per line: "<crc32 hex> <json>\n". A torn or corrupt tail ends the replay at the last good record.
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def encode(self, record: Dict[str, Any]) -> bytes:
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+    def append(self, lines: List[bytes]) -> int:
+        if not lines:
+            return 0
+
+        data = b''.join(lines)
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        with open(self.file_path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(data)
+
+    def read(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.file_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        valid_length = 0
+        for line in data.splitlines(keepends=True):
+            record = self._parse_line(line)
+            if record is None:
+                break
+            records.append(record)
+            valid_length += len(line)
+
+        if valid_length < len(data):
+            print(f"Discarding {len(data) - valid_length} bytes of incomplete write-ahead log: {self.file_path}")
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(valid_length)
+        return records
+
+    def _parse_line(self, line: bytes):
+        if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b' ':
+            return None
+        payload = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.file_path)
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self):
+        try:
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(0)
+                f.flush()
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass